@@ -0,0 +1,399 @@
+import hashlib
+import json
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Words that carry no meaning for matching questions against each other
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "at", "to", "for", "by", "with", "and", "or",
+    "is", "are", "was", "were", "be", "been", "do", "does", "did", "has", "have", "had",
+    "what", "which", "who", "whom", "whose", "where", "when", "how", "why",
+    "me", "i", "you", "your", "my", "us", "we", "it", "its", "this", "that", "these", "those",
+    "tell", "show", "give", "please", "can", "could", "would", "about", "there",
+}
+
+EMBEDDING_DIM = 512
+
+# A paraphrase only matches a cached question naming the same states and anchor words
+STATE_NAMES = (
+    "Alabama", "Alaska", "Arizona", "Arkansas", "California", "Colorado", "Connecticut", "Delaware",
+    "Florida", "Georgia", "Hawaii", "Idaho", "Illinois", "Indiana", "Iowa", "Kansas", "Kentucky",
+    "Louisiana", "Maine", "Maryland", "Massachusetts", "Michigan", "Minnesota", "Mississippi",
+    "Missouri", "Montana", "Nebraska", "Nevada", "New Hampshire", "New Jersey", "New Mexico",
+    "New York", "North Carolina", "North Dakota", "Ohio", "Oklahoma", "Oregon", "Pennsylvania",
+    "Rhode Island", "South Carolina", "South Dakota", "Tennessee", "Texas", "Utah", "Vermont",
+    "Virginia", "Washington", "West Virginia", "Wisconsin", "Wyoming",
+)
+COMPARISON_WORDS = {
+    "largest", "biggest", "smallest", "most", "least", "highest", "lowest", "greatest", "fewest",
+    "top", "bottom", "first", "last", "oldest", "newest", "youngest", "longest", "shortest",
+    "best", "worst", "larger", "bigger", "smaller", "more", "less", "fewer", "higher", "lower",
+    "older", "newer", "longer", "shorter", "better", "worse",
+}
+# Words that change what kind of answer a question wants, kept in the key although they are stopwords
+QUESTION_WORDS = {"who", "whom", "whose", "where", "when", "how", "why"}
+NEGATIONS = {"not", "no", "never", "none", "nor", "without"}
+# A question asking about the past ("What was...") is not the one about today ("What is...")
+PAST_TENSE_WORDS = {"was", "were", "did", "had", "used"}
+# An opening auxiliary makes a yes/no question ("Is Austin the capital?")
+YES_NO_OPENERS = {"is", "are", "was", "were", "do", "does", "did", "can", "could", "has", "have", "had", "will"}
+UNITS = {
+    "mile": "miles", "miles": "miles", "mi": "miles",
+    "kilometer": "kilometers", "kilometers": "kilometers", "kilometre": "kilometers",
+    "kilometres": "kilometers", "km": "kilometers", "km2": "kilometers",
+    "acre": "acres", "acres": "acres", "hectare": "hectares", "hectares": "hectares",
+    "foot": "feet", "feet": "feet", "ft": "feet", "meter": "meters", "meters": "meters",
+    "metre": "meters", "metres": "meters", "percent": "percent",
+}
+# Longest names first so "West Virginia" is not also read as "Virginia"
+_STATE_REGEX = re.compile(
+    r"\b(" + "|".join(re.escape(name.lower()) for name in sorted(STATE_NAMES, key=len, reverse=True)) + r")\b"
+)
+
+
+def _words(text):
+    # "doesn't" and "isn't" read as "not" so the negation survives
+    return re.findall(r"[a-z0-9]+", re.sub(r"n't\b", " not", text.lower().replace("\u2019", "'")))
+
+
+def normalize_question(text):
+    """Lowercase, drop punctuation and stopwords, and fold simple plurals.
+
+    Interrogatives such as "who" and "why", past-tense auxiliaries and
+    negations are kept, since they change which question is being asked.
+    """
+    tokens = []
+    for token in _words(text):
+        if token in STOPWORDS and token not in QUESTION_WORDS | PAST_TENSE_WORDS:
+            continue
+        if len(token) == 1 and not token.isdigit():
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return " ".join(tokens)
+
+
+def hashed_embedding(normalized, dim=EMBEDDING_DIM):
+    """Embed a normalized question as an L2-normalized hashed bag of words"""
+    vector = {}
+    for token in normalized.split():
+        index = int(hashlib.md5(token.encode("utf-8")).hexdigest(), 16) % dim
+        vector[index] = vector.get(index, 0.0) + 1.0
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    if norm == 0:
+        return {}
+    return {index: weight / norm for index, weight in vector.items()}
+
+
+def cosine_similarity(a, b):
+    """Cosine similarity of two sparse, already normalized vectors"""
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(index, 0.0) for index, weight in a.items())
+
+
+def _numbers(normalized):
+    return {token for token in normalized.split() if token.isdigit()}
+
+
+def question_anchors(question):
+    """Return the states a question names and the words that fix its meaning.
+
+    The words are its superlatives and comparisons, interrogatives,
+    negations and units, plus "past" for a question in the past tense and
+    "yes/no" for one opening with an auxiliary verb.
+    """
+    text = question.lower()
+    states = frozenset(_STATE_REGEX.findall(text))
+    tokens = _words(text)
+    words = {word for word in tokens if word in COMPARISON_WORDS | QUESTION_WORDS | NEGATIONS}
+    words.update(UNITS[word] for word in tokens if word in UNITS)
+    if any(word in PAST_TENSE_WORDS for word in tokens):
+        words.add("past")
+    if tokens and tokens[0] in YES_NO_OPENERS:
+        words.add("yes/no")
+    return states, frozenset(words)
+
+
+def _same_anchors(entry, question=None, anchors=None):
+    """Whether a cached entry names the same states and anchor words as a question"""
+    if anchors is None:
+        anchors = question_anchors(question)
+    return entry.setdefault("anchors", question_anchors(entry["question"])) == anchors
+
+
+class AnswerCache:
+    """Two-tier answer cache keyed on the meaning of a question.
+
+    Lookups first try the exact normalized form, then the most similar cached
+    question above ``threshold``. The memory tier is an LRU bounded by entry
+    count and bytes; the SQLite tier is shared by every process that points at
+    the same file and survives restarts. Its vectors are decoded once into an
+    in-memory index that only reads rows added since the previous lookup, and
+    old rows are evicted only once the table grows past ``max_disk_entries``.
+    """
+
+    def __init__(self, db_path=None, threshold=0.85, max_entries=512,
+                 max_bytes=8 * 1024 * 1024, ttl=3600, max_disk_entries=10000,
+                 embed_fn=hashed_embedding):
+        self.db_path = db_path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self.embed_fn = embed_fn
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Decoded vectors of the disk tier by key, read once and then only rows added since
+        self._disk_index = {}
+        self._disk_rowid = 0
+        self._disk_rows = 0
+        self._disk_lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "similar_hits": 0,
+            "evictions": 0,
+            "saved_seconds": 0.0,
+        }
+        if self.db_path:
+            self._init_disk()
+
+    # ----- public API -----
+
+    def get(self, question, threshold=None):
+        """Return the cached answer for a question or a paraphrase of it, else None.
+
+        ``threshold`` overrides the similarity needed for a paraphrase to match,
+        e.g. to accept looser matches while the LLM is unavailable.
+        """
+        match = self.match(question, threshold)
+        return match[1] if match is not None else None
+
+    def match(self, question, threshold=None):
+        """Return ``(cached question, answer)`` for a question or a paraphrase of it, else None"""
+        key = normalize_question(question)
+        now = time.time()
+        threshold = self.threshold if threshold is None else threshold
+        with self._lock:
+            entry, exact = self._find_in_memory(key, question, now, threshold)
+            if entry is not None:
+                self._entries.move_to_end(entry["key"])
+                self._record_hit(entry, "memory_hits", exact)
+                return entry["question"], entry["answer"]
+
+        entry, exact = self._find_on_disk(key, question, now, threshold)
+        with self._lock:
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._store_in_memory(entry)
+            self._record_hit(entry, "disk_hits", exact)
+        return entry["question"], entry["answer"]
+
+    def put(self, question, answer, cost_seconds=0.0):
+        """Cache an answer; ``cost_seconds`` is what producing it took"""
+        key = normalize_question(question)
+        entry = {
+            "key": key,
+            "question": question,
+            "answer": answer,
+            "vector": self.embed_fn(key),
+            "cost": cost_seconds,
+            "created_at": time.time(),
+        }
+        with self._lock:
+            self._store_in_memory(entry)
+        if self.db_path:
+            self._write_to_disk(entry)
+
+    def clear(self):
+        """Drop every entry from both tiers and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            for name in self._stats:
+                self._stats[name] = 0.0 if name == "saved_seconds" else 0
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM answers")
+            with self._disk_lock:
+                self._disk_index.clear()
+                self._disk_rowid = 0
+                self._disk_rows = 0
+
+    def stats(self):
+        """Return hit/miss counters and current memory usage"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    # ----- memory tier -----
+
+    def _find_in_memory(self, key, question, now, threshold):
+        entry = self._entries.get(key)
+        if entry is not None and not self._expired(entry, now) and _same_anchors(entry, question):
+            return entry, True
+        best = self._most_similar(key, question, self._entries.values(), now, threshold)
+        return best, False
+
+    def _most_similar(self, key, question, candidates, now, threshold):
+        vector = self.embed_fn(key)
+        numbers = _numbers(key)
+        anchors = question_anchors(question)
+        best, best_score = None, threshold
+        for entry in candidates:
+            if self._expired(entry, now) or _numbers(entry["key"]) != numbers:
+                continue
+            # Similar wording about another state, the opposite superlative, another tense or unit,
+            # a negation or another interrogative is a different question
+            if not _same_anchors(entry, anchors=anchors):
+                continue
+            score = cosine_similarity(vector, entry["vector"])
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    def _store_in_memory(self, entry):
+        previous = self._entries.pop(entry["key"], None)
+        if previous is not None:
+            self._bytes -= previous["size"]
+        entry["size"] = self._entry_size(entry)
+        self._entries[entry["key"]] = entry
+        self._bytes += entry["size"]
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted["size"]
+            self._stats["evictions"] += 1
+
+    def _record_hit(self, entry, tier, exact):
+        self._stats["hits"] += 1
+        self._stats[tier] += 1
+        if not exact:
+            self._stats["similar_hits"] += 1
+        self._stats["saved_seconds"] += entry.get("cost", 0.0)
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry["created_at"] > self.ttl
+
+    @staticmethod
+    def _entry_size(entry):
+        text = entry["key"] + entry["question"] + entry["answer"]
+        return len(text.encode("utf-8")) + 16 * len(entry["vector"])
+
+    # ----- disk tier -----
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_disk(self):
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, question TEXT, answer TEXT, vector TEXT, "
+                "cost REAL, created_at REAL, last_used REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+            self._disk_rows = conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def _find_on_disk(self, key, question, now, threshold):
+        if not self.db_path:
+            return None, False
+        oldest = now - self.ttl if self.ttl is not None else 0
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM answers WHERE key = ? AND created_at >= ?", (key, oldest)
+            ).fetchone()
+            entry = self._row_to_entry(row) if row is not None else None
+            exact = entry is not None and _same_anchors(entry, question)
+            if not exact:
+                entry = self._most_similar_on_disk(conn, key, question, now, threshold)
+            if entry is not None:
+                conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, entry["key"]))
+        return entry, exact
+
+    def _most_similar_on_disk(self, conn, key, question, now, threshold):
+        with self._disk_lock:
+            # Only rows written since the last lookup, by this or another process, are decoded
+            for row in conn.execute(
+                "SELECT rowid, key, question, vector, created_at FROM answers WHERE rowid > ? ORDER BY rowid",
+                (self._disk_rowid,),
+            ):
+                self._disk_index[row["key"]] = {
+                    "key": row["key"],
+                    "question": row["question"],
+                    "vector": self._decode_vector(row["vector"]),
+                    "created_at": row["created_at"],
+                }
+                self._disk_rowid = row["rowid"]
+            best = self._most_similar(key, question, list(self._disk_index.values()), now, threshold)
+        if best is None:
+            return None
+        row = conn.execute("SELECT * FROM answers WHERE key = ?", (best["key"],)).fetchone()
+        if row is None:  # evicted by another process since it was indexed
+            with self._disk_lock:
+                self._disk_index.pop(best["key"], None)
+            return None
+        return self._row_to_entry(row)
+
+    def _write_to_disk(self, entry):
+        vector = json.dumps([[index, weight] for index, weight in entry["vector"].items()])
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (entry["key"], entry["question"], entry["answer"], vector,
+                 entry["cost"], entry["created_at"], entry["created_at"]),
+            )
+            with self._disk_lock:
+                # Replacing a key overcounts, which only costs an early recount
+                self._disk_rows += 1
+                if self._disk_rows <= self.max_disk_entries:
+                    return
+                self._disk_rows = conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+                excess = self._disk_rows - self.max_disk_entries
+                if excess <= 0:
+                    return
+                evicted = [key for (key,) in conn.execute(
+                    "SELECT key FROM answers ORDER BY last_used LIMIT ?", (excess,)
+                )]
+                conn.executemany("DELETE FROM answers WHERE key = ?", [(key,) for key in evicted])
+                for key in evicted:
+                    self._disk_index.pop(key, None)
+                self._disk_rows -= len(evicted)
+
+    @staticmethod
+    def _decode_vector(text):
+        return {index: weight for index, weight in json.loads(text)}
+
+    @staticmethod
+    def _row_to_entry(row):
+        return {
+            "key": row["key"],
+            "question": row["question"],
+            "answer": row["answer"],
+            "vector": AnswerCache._decode_vector(row["vector"]),
+            "cost": row["cost"] or 0.0,
+            "created_at": row["created_at"],
+        }
@@ -0,0 +1,239 @@
+"""Headless HTTP/JSON query service over the same pipeline as the Streamlit app.
+
+    uvicorn api:create_api --factory --port 8000
+    python api.py --port 8000 --workers 8 --max-queue 32
+
+POST /query with {"question": "..."} returns {"response", "path", "seconds"}.
+A follow-up may add "context", the conversation it refers back to.
+Add ?stream=true (or send Accept: text/event-stream) to receive the status,
+token and done events of ``app.stream_query`` as server-sent events.
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+MAX_QUESTION_LENGTH = 1000
+MAX_CONTEXT_LENGTH = 4000
+
+
+class QueryService:
+    """Run blocking pipeline calls on a bounded worker pool with admission control.
+
+    At most ``workers`` questions run at once and up to ``max_queue`` more
+    wait for a worker. Anything beyond that is refused straight away so a
+    burst turns into fast 429s instead of a growing backlog of slow answers.
+    A slot is held until its work finishes on the worker, not until the
+    client stops waiting, so timed-out and abandoned questions still count.
+    """
+
+    def __init__(self, answer_fn, stream_fn=None, workers=4, max_queue=16, timeout=120.0):
+        self.answer_fn = answer_fn
+        self.stream_fn = stream_fn
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query")
+        self._admitted = 0
+        self._stats = {"requests": 0, "rejected": 0, "timeouts": 0, "errors": 0}
+
+    @property
+    def capacity(self):
+        return self.workers + self.max_queue
+
+    def try_admit(self):
+        """Reserve a slot, returning False when the queue is full"""
+        # Only the event loop thread admits and releases, so no lock is needed
+        self._stats["requests"] += 1
+        if self._admitted >= self.capacity:
+            self._stats["rejected"] += 1
+            return False
+        self._admitted += 1
+        return True
+
+    def release(self):
+        self._admitted -= 1
+
+    def _submit(self, fn, *args):
+        """Run ``fn`` on the pool and release its admission slot once it has finished there"""
+        loop = asyncio.get_running_loop()
+        future = self._pool.submit(fn, *args)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self.release))
+        return future
+
+    async def answer(self, question, context=None):
+        start = time.perf_counter()
+        answer_fn = self.answer_fn if context is None else functools.partial(self.answer_fn, context=context)
+        try:
+            # A timeout cancels the question only if it is still queued; a running one keeps its slot
+            result = await asyncio.wait_for(
+                asyncio.wrap_future(self._submit(answer_fn, question)), self.timeout
+            )
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            raise
+        except Exception:
+            self._stats["errors"] += 1
+            raise
+        return {**result, "seconds": time.perf_counter() - start}
+
+    def stream(self, question, context=None):
+        """Start ``stream_fn`` on a worker thread and return an async iterator of its events.
+
+        When the reader goes away the worker stops at the next event and
+        closes the stream, and only then is the admission slot released.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stopped = threading.Event()
+        stream_fn = self.stream_fn if context is None else functools.partial(self.stream_fn, context=context)
+
+        def produce():
+            events = stream_fn(question)
+            try:
+                for event in events:
+                    if stopped.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, event)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, {"type": "error", "text": str(e)})
+            finally:
+                if hasattr(events, "close"):
+                    events.close()
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+
+        self._submit(produce)
+
+        async def relay():
+            try:
+                while (event := await queue.get()) is not None:
+                    if event["type"] == "error":
+                        self._stats["errors"] += 1
+                    yield event
+            finally:
+                stopped.set()
+
+        return relay()
+
+    def stats(self):
+        return {
+            **self._stats,
+            "admitted": self._admitted,
+            "running": min(self._admitted, self.workers),
+            "queued": max(0, self._admitted - self.workers),
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+        }
+
+
+def _sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def create_api(answer_fn=None, stream_fn=None, stats_fn=None, workers=None, max_queue=None, timeout=None):
+    """Build the ASGI app; by default it serves ``app.answer_query`` and ``app.stream_query``"""
+    if answer_fn is None:
+        import app as pipeline  # deferred: tests and other callers pass their own functions
+
+        answer_fn, stream_fn = pipeline.answer_query, pipeline.stream_query
+        stats_fn = stats_fn or pipeline.pipeline_stats
+    service = QueryService(
+        answer_fn,
+        stream_fn,
+        workers=workers or int(os.getenv("API_WORKERS", "4")),
+        max_queue=max_queue if max_queue is not None else int(os.getenv("API_MAX_QUEUE", "16")),
+        timeout=timeout or float(os.getenv("API_TIMEOUT", "120")),
+    )
+
+    def busy():
+        return JSONResponse(
+            {"error": "Too many questions in progress, please retry shortly."},
+            status_code=429,
+            headers={"Retry-After": "1"},
+        )
+
+    async def query(request):
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            return JSONResponse({"error": "Request body must be JSON."}, status_code=400)
+        question = body.get("question") if isinstance(body, dict) else None
+        if not isinstance(question, str) or not question.strip():
+            return JSONResponse({"error": "A non-empty 'question' is required."}, status_code=400)
+        if len(question) > MAX_QUESTION_LENGTH:
+            return JSONResponse(
+                {"error": f"Questions are limited to {MAX_QUESTION_LENGTH} characters."}, status_code=400
+            )
+        context = body.get("context")
+        if context is not None and (not isinstance(context, str) or len(context) > MAX_CONTEXT_LENGTH):
+            return JSONResponse(
+                {"error": f"'context' must be a string of at most {MAX_CONTEXT_LENGTH} characters."},
+                status_code=400
+            )
+
+        wants_stream = (
+            request.query_params.get("stream", "").lower() in ("1", "true")
+            or "text/event-stream" in request.headers.get("accept", "")
+        )
+        if wants_stream and service.stream_fn is None:
+            return JSONResponse({"error": "Streaming is not enabled."}, status_code=400)
+        if not service.try_admit():
+            return busy()
+
+        if wants_stream:
+            stream = service.stream(question, context or None)
+
+            async def events():
+                async for event in stream:
+                    yield _sse(event)
+
+            return StreamingResponse(
+                events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+            )
+
+        try:
+            result = await service.answer(question, context or None)
+        except asyncio.TimeoutError:
+            return JSONResponse({"error": "The question took too long to answer."}, status_code=504)
+        except Exception as e:
+            print(f"Error details: {str(e)}")
+            return JSONResponse({"error": "The question could not be answered."}, status_code=500)
+        return JSONResponse(result)
+
+    async def health(request):
+        return JSONResponse({"status": "ok", **service.stats()})
+
+    async def stats(request):
+        return JSONResponse({"service": service.stats(), **(stats_fn() if stats_fn else {})})
+
+    api = Starlette(routes=[
+        Route("/query", query, methods=["POST"]),
+        Route("/health", health),
+        Route("/stats", stats),
+    ])
+    api.state.service = service
+    return api
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the US states question pipeline over HTTP")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=None, help="questions answered at once")
+    parser.add_argument("--max-queue", type=int, default=None, help="questions allowed to wait")
+    args = parser.parse_args(argv)
+    uvicorn.run(create_api(workers=args.workers, max_queue=args.max_queue), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import json
+
+import httpx
+
+BUSY_MESSAGE = "The service is busy answering other questions. Please try again in a moment."
+ERROR_MESSAGE = "I encountered an error while processing your question. Please try again or rephrase your question."
+
+
+class QueryAPIClient:
+    """Client for ``api.py`` returning the same shapes as the in-process pipeline.
+
+    ``answer_query`` returns ``{"response", "path"}`` and ``stream_query``
+    yields status, token and done events, so the Streamlit app can switch
+    between answering locally and calling the service without other changes.
+    """
+
+    def __init__(self, base_url, timeout=120.0, client=None):
+        self._client = client or httpx.Client(base_url=base_url.rstrip("/"), timeout=timeout)
+
+    def answer_query(self, question, context=None):
+        try:
+            response = self._client.post("/query", json=_body(question, context))
+        except httpx.HTTPError as e:
+            print(f"Error details: {str(e)}")
+            return {"response": ERROR_MESSAGE, "path": "error"}
+        if response.status_code == 429:
+            return {"response": BUSY_MESSAGE, "path": "busy"}
+        if response.status_code != 200:
+            print(f"Error details: {response.status_code} {response.text}")
+            return {"response": ERROR_MESSAGE, "path": "error"}
+        return response.json()
+
+    def stream_query(self, question, context=None):
+        try:
+            with self._client.stream("POST", "/query", params={"stream": "true"},
+                                     json=_body(question, context)) as response:
+                if response.status_code != 200:
+                    response.read()
+                    message = BUSY_MESSAGE if response.status_code == 429 else ERROR_MESSAGE
+                    path = "busy" if response.status_code == 429 else "error"
+                    yield from self._single_answer(message, path)
+                    return
+                for event in _parse_sse(response.iter_lines()):
+                    if event["type"] == "error":
+                        yield from self._single_answer(ERROR_MESSAGE, "error")
+                        return
+                    yield event
+        except httpx.HTTPError as e:
+            print(f"Error details: {str(e)}")
+            yield from self._single_answer(ERROR_MESSAGE, "error")
+
+    def stats(self):
+        """Return the service's statistics, or None when it cannot be reached"""
+        try:
+            response = self._client.get("/stats")
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            print(f"Error details: {str(e)}")
+            return None
+        return response.json()
+
+    @staticmethod
+    def _single_answer(message, path):
+        yield {"type": "token", "text": message}
+        yield {"type": "done", "response": message, "path": path, "ttft_seconds": 0.0, "total_seconds": 0.0}
+
+
+def _body(question, context):
+    return {"question": question} if context is None else {"question": question, "context": context}
+
+
+def _parse_sse(lines):
+    """Yield the JSON payload of each server-sent event"""
+    data = []
+    for line in lines:
+        if line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+        elif not line and data:
+            yield json.loads("\n".join(data))
+            data = []
+    if data:
+        yield json.loads("\n".join(data))
@@ -1,107 +1,240 @@
 import streamlit as st
-import sqlalchemy as sa
+import functools
 import os
+import sys
+import threading
+import time
 from dotenv import load_dotenv
 
-from llama_index.core.query_engine import NLSQLTableQueryEngine
-from llama_index.core import SQLDatabase, Settings
-from llama_index.llms.google_genai import GoogleGenAI
-from llama_index.indices.managed.llama_cloud import LlamaCloudIndex
-from llama_index.core.tools import QueryEngineTool
-from llama_index.core.agent import ReActAgent
+# llama_index, the Gemini client and the LlamaCloud client are imported inside the
+# functions that build them, so the page and fast-path answers never wait on them
+from answer_cache import AnswerCache
+from conversation_memory import ConversationMemory, extractive_summary, with_context
+from database import create_read_engine
+from fanout import FanOutExecutor, FanOutPlanner
+from fast_path import FastPathRouter
+from llm_limiter import CircuitBreaker, CircuitOpenError, LLMLimiter
+from model_cascade import DEFAULT_MODELS, DEFAULT_STAGE_MODELS, ModelCascade, parse_stage_models, sql_failure
+from single_flight import SingleFlight, question_key
+from sql_cache import SQLResultCache
+import tracing
 
-# Load environment variables and configure page
+# Load environment variables
 load_dotenv()
 
-st.set_page_config(
-    page_title="US States Information Center",
-    page_icon="🇺🇸",
-    layout="centered"
-)
+# Shared read-only connection pool for states.db
+@st.cache_resource
+def get_database_engine():
+    """Open states.db read-only with a pooled, tuned engine"""
+    engine = create_read_engine(
+        'states.db',
+        pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+        max_overflow=int(os.getenv("DB_POOL_OVERFLOW", "5"))
+    )
+    return tracing.instrument_engine(engine)
 
-# Initialize components just once and cache the result
+# Compact description of the SQL tables for prompts, regenerated when states.db changes
 @st.cache_resource
-def initialize_components():
-    """Initialize LLM, databases, and query engines once"""
-    
-    # Initialize LLM
-    llm = GoogleGenAI(
-        model="models/gemini-2.5-pro-exp-03-25",
+def get_schema_context():
+    """Create the schema context generated from the live states tables"""
+    from schema_context import SchemaContext
+
+    return SchemaContext(
+        get_database_engine(),
+        'states.db',
+        token_budget=int(os.getenv("SCHEMA_TOKEN_BUDGET", "200"))
+    )
+
+# Rows and answers of generated SQL, keyed by normalized statement and dropped when states.db changes
+@st.cache_resource
+def get_sql_result_cache():
+    """Create the SQL result cache from environment settings"""
+    return SQLResultCache('states.db', max_entries=int(os.getenv("SQL_CACHE_MAX_ENTRIES", "256")))
+
+# Guard between the text-to-SQL engine and the database
+@st.cache_resource
+def get_sql_database():
+    """Wrap states.db so generated SQL is plan-checked, limited and time-boxed"""
+    from sql_guard import GuardedSQLDatabase
+
+    return GuardedSQLDatabase(
+        get_database_engine(),
+        include_tables=get_schema_context().table_names(),
+        table_info=get_schema_context().table_info,
+        result_cache=get_sql_result_cache(),
+        max_rows=int(os.getenv("SQL_MAX_ROWS", "50")),
+        time_budget=float(os.getenv("SQL_TIME_BUDGET", "2.0"))
+    )
+
+# Build a Gemini LLM
+def create_llm(model=DEFAULT_MODELS["large"]):
+    """Create the LLM client for one model"""
+    from llama_index.llms.google_genai import GoogleGenAI
+
+    return GoogleGenAI(
+        model=model,
         google_api_key=os.getenv("GOOGLE_API_KEY"),
-        temperature=0.3
+        temperature=0.3,
+        # Retries happen in the shared LLMLimiter, where they are counted and feed the circuit breaker
+        max_retries=0
+    )
+
+# Build the document query engine: LlamaCloud by default, or the local memory-mapped index
+def create_document_engine(llm):
+    """Create the query engine over the Wikipedia documents"""
+    if os.getenv("RETRIEVAL_BACKEND", "cloud") == "local":
+        from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
+        from local_index import LocalVectorIndex
+
+        embed_model = GoogleGenAIEmbedding(
+            model_name=os.getenv("EMBEDDING_MODEL", "text-embedding-004"),
+            api_key=os.getenv("GOOGLE_API_KEY")
+        )
+        index = LocalVectorIndex(os.getenv("LOCAL_INDEX_DIR", "local_index"), embed_model)
+        # Hybrid mode adds BM25 to the vector search and narrows to the states a question names
+        return index.as_query_engine(llm=llm, mode=os.getenv("RETRIEVAL_MODE", "hybrid"))
+
+    from llama_index.indices.managed.llama_cloud import LlamaCloudIndex
+
+    index = LlamaCloudIndex(
+        name=os.getenv("LLAMA_CLOUD_INDEX_NAME"),
+        project_name=os.getenv("LLAMA_CLOUD_PROJECT_NAME"),
+        organization_id=os.getenv("LLAMA_CLOUD_ORG_ID"),
+        api_key=os.getenv("LLAMA_CLOUD_API_KEY")
+    )
+    return index.as_query_engine(llm=llm)
+
+# Concurrency cap, rate budgets, retries and circuit breaker shared by every LLM call
+@st.cache_resource
+def get_llm_limiter():
+    """Create the LLM limiter from environment settings"""
+    return LLMLimiter(
+        rpm=int(os.getenv("LLM_RPM", "0")) or None,
+        tpm=int(os.getenv("LLM_TPM", "0")) or None,
+        max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("LLM_BREAKER_RESET", "30"))
+        )
+    )
+
+# Which model each stage uses: a fast model for routing and SQL, the large one for synthesis
+@st.cache_resource
+def get_model_cascade():
+    """Create the per-stage model assignment from environment settings"""
+    return ModelCascade(
+        parse_stage_models(os.getenv("MODEL_STAGES", DEFAULT_STAGE_MODELS)),
+        models={
+            "fast": os.getenv("MODEL_FAST", DEFAULT_MODELS["fast"]),
+            "large": os.getenv("MODEL_LARGE", DEFAULT_MODELS["large"])
+        }
     )
+
+# One client per model, shared by every stage assigned to it
+@st.cache_resource
+def get_model_client(tier):
+    """Create the LLM client for the "fast" or "large" model"""
+    tracing.install_instrumentation()
+    return create_llm(get_model_cascade().models[tier])
+
+# Each stage gets its own handle so calls are metered per stage; all share the limiter
+@st.cache_resource
+def get_stage_llm(stage, tier=None):
+    """Return the rate-limited LLM for a stage, on its assigned model unless ``tier`` overrides it"""
+    from limited_llm import LimitedLLM
+
+    cascade = get_model_cascade()
+    tier = tier or cascade.tier(stage)
+    return LimitedLLM(
+        get_model_client(tier),
+        get_llm_limiter(),
+        on_usage=functools.partial(cascade.record, stage, tier)
+    )
+
+# The synthesis model is also the llama_index default for anything not given an LLM
+@st.cache_resource
+def get_llm():
+    """Create the default LLM once and make it the llama_index default"""
+    from llama_index.core import Settings
+
+    llm = get_stage_llm("synthesis")
     Settings.llm = llm
-    
-    # Connect to the SQL database
-    engine = sa.create_engine('sqlite:///states.db', future=True)
-    sql_database = SQLDatabase(engine, include_tables=["states"])
-
-    # Generate sample data description to help the LLM understand the data structure
-    table_schema_str = """
-    Database Schema:
-    - states table:
-    - object_id: Object ID like 
-    - name: State name (e.g., "California", "Texas")
-    - flag_url: link to states flag png image
-    - link: url link to states page
-    - postal_abbreviation: Two-letter state code (e.g., "CA", "TX")
-    - capital: Capital city name
-    - largest_city: name of largest city
-    - established: date when state was established
-    - population: state's population
-    - total_area_square_miles= state total area in square miles
-    - total_area_square_kilometers: total area in square kilometers
-    - land_area_square_miles: land area in square miles
-    - land_area_square_kilometers: land area in square kilometers
-    - water_area_square_miles: water area in square miles
-    - water_area_square_kilometers: water area in square kilometers
-    - number_representatives: number of representatives
-    - created_at: date of database creation
-    - updated_at: date of database update
-    """
+    return llm
+
+# Text-to-SQL engine on the SQL stage's model; a fast model escalates to the large one on bad SQL
+@st.cache_resource
+def get_sql_query_engine():
+    """Create the text-to-SQL engine, escalating to the large model when its answer fails validation"""
+    from escalating_engine import EscalatingQueryEngine
+    from lazy_engine import LazyQueryEngine
+
+    cascade = get_model_cascade()
+    engine = create_sql_query_engine(get_stage_llm("sql"))
+    if cascade.tier("sql") == "large":
+        return engine
+    return EscalatingQueryEngine(
+        engine,
+        LazyQueryEngine(lambda: create_sql_query_engine(get_stage_llm("sql", "large"))),
+        validate=sql_failure,
+        on_escalate=functools.partial(cascade.record_escalation, "sql")
+    )
+
+def create_sql_query_engine(llm):
+    """Create the natural language to SQL query engine over the guarded database"""
+    from cached_sql_engine import CachedNLSQLTableQueryEngine
 
-    # Create the natural language to SQL query engine with more context
-    sql_query_engine = NLSQLTableQueryEngine(
+    # Connect to the SQL database through the execution guard
+    sql_database = get_sql_database()
+
+    # Create the natural language to SQL query engine over the states table and the derived
+    # borders and metrics tables; the guard supplies the generated table descriptions and
+    # answers for statements already synthesized come from the SQL result cache
+    return CachedNLSQLTableQueryEngine(
         sql_database=sql_database,
-        tables=["states"],
+        tables=get_schema_context().table_names(),
         # sample_rows_in_table_info=1,
         llm=llm,
         embed_model=llm,
         synthesize_response=True,
-        table_schema_str=table_schema_str,
-        verbose=True
-    )
-    
-    # Initialize LlamaCloud index
-    index = LlamaCloudIndex(
-        name=os.getenv("LLAMA_CLOUD_INDEX_NAME"),
-        project_name=os.getenv("LLAMA_CLOUD_PROJECT_NAME"),
-        organization_id=os.getenv("LLAMA_CLOUD_ORG_ID"),
-        api_key=os.getenv("LLAMA_CLOUD_API_KEY")
+        verbose=True,
+        result_cache=get_sql_result_cache()
     )
-    llama_cloud_query_engine = index.as_query_engine()
-    
+
+# Document engine, built the first time a question needs the documents
+@st.cache_resource
+def get_document_query_engine():
+    """Create the document query engine on the documents stage's model"""
+    return create_document_engine(get_stage_llm("documents"))
+
+# Initialize components just once and cache the result
+@st.cache_resource
+def initialize_components():
+    """Return the LLM and query engines; each engine is built on its first query"""
+    from lazy_engine import LazyQueryEngine
+
     return {
-        "llm": llm,
-        "sql_query_engine": sql_query_engine,
-        "llama_cloud_query_engine": llama_cloud_query_engine
+        "llm": get_llm(),
+        "planning_llm": get_stage_llm("planning"),
+        "sql_query_engine": LazyQueryEngine(get_sql_query_engine),
+        "llama_cloud_query_engine": LazyQueryEngine(get_document_query_engine)
     }
 
 # Create the agent using the cached components
 @st.cache_resource
-def get_agent():
-    """Create and return the agent using already initialized components"""
+def get_agent(escalated=False):
+    """Create and return the agent; ``escalated`` plans with the large model instead of the planning model"""
+    from llama_index.core.agent import ReActAgent
+    from llama_index.core.tools import QueryEngineTool
+
     components = initialize_components()
     
-    # Create a tool for SQL queries
+    # Create a tool for SQL queries; the columns come from the live table so they cannot drift
     sql_tool = QueryEngineTool.from_defaults(
         query_engine=components["sql_query_engine"],
         description=(
-            "Useful for answering factual questions about US states like population, "
-            "capital, land size, postal abbreviation, and other demographic statistics "
-            "stored in a structured database. The states table contains fields: "
-            "name, abbreviation, capital, population, area_sq_miles, region, "
-            "admitted_to_union, and median_household_income."
+            "Useful for factual questions about US states answered from a database of: "
+            + get_schema_context().topics() + "."
         ),
         name="sql_tool"
     )
@@ -120,19 +253,15 @@ def get_agent():
     # Create the agent
     agent = ReActAgent.from_tools(
         [sql_tool, llama_cloud_tool],
-        llm=components["llm"],
+        llm=get_stage_llm("planning", "large") if escalated else components["planning_llm"],
         verbose=False,
         system_prompt=(
             "You are an expert US States information system. "
             "You have access to two sources of information:\n\n"
-            "1. A SQLite database with factual demographic data about US states in the 'states' table "
-            "containing fields: object_id, name, flag_url, link, postal_abbreviation, capital, largest_city, "
-            "established, population, total_area_square_miles, total_area_square_kilometers, land_area_square_miles, "
-            "land_area_square_kilometers, water_area_square_miles, "
-            "water_area_square_kilometers, number_representatives, created_at, updated_at\n\n"
+            "1. The SQL tool, a database of facts about each state (its columns are listed in the tool description)\n\n"
             "2. Document retrieval for detailed information about history, attractions, and more\n\n"
             "Choose the appropriate tool based on the user's question. "
-            "For the SQL tool, formulate clear SQL queries that match the database schema. "
+            "Ask the SQL tool plain-language questions; it writes the SQL itself. "
             "Use the SQL tool for factual queries about population, area, capitals, etc. "
             "Use the document tool for questions about history, attractions, culture, and detailed information. "
             "If needed, you can use both tools and combine the information."
@@ -141,100 +270,592 @@ def get_agent():
     
     return agent
 
-# Cached query execution to improve performance
-@st.cache_data(ttl=3600, show_spinner=False)  # Cache results for 1 hour
-def execute_query(query_text):
-    """Execute a query and cache the results"""
+# Answer cache shared by every session; the SQLite tier is shared across replicas
+@st.cache_resource
+def get_answer_cache():
+    """Create the answer cache from environment settings"""
+    return AnswerCache(
+        db_path=os.getenv("ANSWER_CACHE_PATH", "answer_cache.db"),
+        threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.85")),
+        max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512")),
+        max_bytes=int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+        ttl=int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+    )
+
+# Deterministic router for simple structured questions, no LLM needed
+@st.cache_resource
+def get_fast_path_router():
+    """Create the fast-path router over the states table"""
+    return FastPathRouter(get_database_engine())
+
+# Deduplicates concurrent agent calls for the same question across sessions
+@st.cache_resource
+def get_single_flight():
+    """Create the shared in-flight request registry"""
+    return SingleFlight()
+
+# Per-request stage timings, appended to a JSONL log for rollups and replay
+@st.cache_resource
+def get_request_log():
+    """Open the request log that traces are appended to"""
+    return tracing.RequestLog(
+        os.getenv("REQUEST_LOG_PATH", "request_log.jsonl"),
+        max_bytes=int(os.getenv("REQUEST_LOG_MAX_BYTES", "10000000"))
+    )
+
+# Spots questions that need both the database and the documents
+@st.cache_resource
+def get_fanout_planner():
+    """Create the fan-out planner using the state names known to the fast path"""
+    return FanOutPlanner(get_fast_path_router().state_names.values())
+
+# Runs the SQL and document engines concurrently for compound questions
+@st.cache_resource
+def get_fanout():
+    """Create the fan-out executor over the already initialized query engines"""
+    components = initialize_components()
+    return FanOutExecutor(
+        components["sql_query_engine"],
+        components["llama_cloud_query_engine"],
+        get_stage_llm("synthesis"),
+        branch_timeout=float(os.getenv("FANOUT_BRANCH_TIMEOUT", "30")),
+        parallel=os.getenv("FANOUT_PARALLEL", "true").lower() == "true"
+    )
+
+# Answer with the fan-out executor when the question needs both sources, else with the agent
+def run_agent(query_text, fanout=True):
+    """Run the full LLM pipeline for a question and return the answer and path"""
+    plan = get_fanout_planner().plan(query_text) if fanout else None
+    if plan is not None:
+        with tracing.span("fanout"):
+            result = get_fanout().run(query_text, plan)
+        print(
+            f"[fanout] retrieval {result['retrieval_seconds']:.2f}s "
+            f"(saved {result['saved_seconds']:.2f}s vs sequential), "
+            f"synthesis {result['synthesis_seconds']:.2f}s: {query_text}"
+        )
+        return {"response": result["response"], "path": "fanout"}
+    try:
+        response = get_agent().query(query_text)
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        # A fast planning model that loses its way gets one more try on the large model
+        cascade = get_model_cascade()
+        if cascade.tier("planning") == "large":
+            raise
+        print(f"Escalating to the large model after planning failed: {str(e)}")
+        cascade.record_escalation("planning", f"error: {type(e).__name__}")
+        response = get_agent(escalated=True).query(query_text)
+    return {"response": response.response, "path": "agent"}
+
+# Primes the heavy components in the background so the first question does not build them
+@st.cache_resource
+def start_warmup():
+    """Start a daemon thread that builds the agent and both query engines once"""
+    def warm():
+        start = time.perf_counter()
+        for name, build in [("agent", get_agent), ("sql engine", get_sql_query_engine),
+                            ("document engine", get_document_query_engine)]:
+            try:
+                build()
+            except Exception as e:
+                print(f"Warm-up of the {name} failed: {e}")
+        print(f"[warmup] components ready after {time.perf_counter() - start:.2f}s")
+
+    thread = threading.Thread(target=warm, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+ERROR_MESSAGE = "I encountered an error while processing your question. Please try again or rephrase your question."
+DEGRADED_MESSAGE = (
+    "The language model is temporarily unavailable, so right now I can only answer simple "
+    "questions about state facts such as capitals and populations. Please try again in a minute."
+)
+DEGRADED_CACHE_MESSAGE = (
+    "The language model is temporarily unavailable. The closest answer I have is to the "
+    "question \"{question}\":\n\n{answer}"
+)
+
+# While the LLM circuit is open, answer from a looser cache match instead of calling the agent
+def degraded_answer(query_text, context=None):
+    """Answer without the LLM: a similar cached answer if there is one, else an apology.
+
+    A looser match may answer a neighbouring question ("land area" for "water
+    area"), so the answer says which cached question it was written for.
+    """
+    # A cached answer to a similar follow-up belongs to some other conversation
+    if context is not None:
+        return {"response": DEGRADED_MESSAGE, "path": "degraded"}
+    match = get_answer_cache().match(
+        query_text, threshold=float(os.getenv("DEGRADED_CACHE_THRESHOLD", "0.6"))
+    )
+    if match is not None:
+        cached_question, cached_answer = match
+        return {"response": DEGRADED_CACHE_MESSAGE.format(question=cached_question, answer=cached_answer),
+                "path": "degraded_cache"}
+    return {"response": DEGRADED_MESSAGE, "path": "degraded"}
+
+# Answer a query, reporting which path served it
+def answer_query(query_text, context=None):
+    """Answer a query via the fast path, the answer cache or the agent; ``context`` marks a follow-up"""
+    with tracing.trace(query_text, get_request_log()) as current:
+        if context is not None:
+            result = _answer_follow_up(query_text, context)
+        else:
+            result = _answer_query(query_text)
+        current.path = current.path or result["path"]
+        return result
+
+# A follow-up's answer depends on its conversation, so it skips the fast path and the shared caches
+def _answer_follow_up(query_text, context):
+    if get_llm_limiter().breaker.is_open:
+        return degraded_answer(query_text, context)
+    try:
+        result = run_agent(with_context(query_text, context), fanout=False)
+        return {"response": result["response"], "path": "follow_up"}
+    except CircuitOpenError:
+        return degraded_answer(query_text, context)
+    except Exception as e:
+        print(f"Error details: {str(e)}")
+        return {"response": ERROR_MESSAGE, "path": "error"}
+
+def _answer_query(query_text):
+    fast_answer = _fast_path_route(query_text)
+    if fast_answer is not None:
+        return {"response": fast_answer["response"], "path": "fast_path"}
+
+    cached_answer = _cache_lookup(query_text)
+    if cached_answer is not None:
+        return {"response": cached_answer, "path": "cache"}
+    if get_llm_limiter().breaker.is_open:
+        return degraded_answer(query_text)
+    return _answer_uncached(query_text)
+
+# The agent behind single-flight, for a question the fast path and the cache have already missed
+def _answer_uncached(query_text):
+    def run_and_cache():
+        start = time.perf_counter()
+        result = run_agent(query_text)
+        get_answer_cache().put(query_text, result["response"], cost_seconds=time.perf_counter() - start)
+        return result
+
+    try:
+        result, shared = get_single_flight().do(
+            question_key(query_text),
+            run_and_cache,
+            timeout=float(os.getenv("SINGLE_FLIGHT_TIMEOUT", "120"))
+        )
+        return {"response": result["response"], "path": "coalesced" if shared else result["path"]}
+    except CircuitOpenError:
+        return degraded_answer(query_text)
+    except Exception as e:
+        print(f"Error details: {str(e)}")
+        return {"response": ERROR_MESSAGE, "path": "error"}
+
+# Fast-path routing, timed as its own stage
+def _fast_path_route(query_text):
+    with tracing.span("fast_path"):
+        return get_fast_path_router().route(query_text)
+
+# Answer cache lookup, timed as its own stage
+def _cache_lookup(query_text):
+    with tracing.span("cache_lookup"):
+        return get_answer_cache().get(query_text)
+
+# The agent is shared by every session, so each streamed question plans with an empty memory of
+# its own, as agent.query() does; the agent's memory would otherwise collect every user's turns
+def create_agent_task(agent, prompt):
+    """Create an agent task for one question that starts from an empty chat memory"""
+    from llama_index.core.memory import ChatMemoryBuffer
+
+    task = agent.create_task(prompt)
+    task.memory = ChatMemoryBuffer.from_defaults()
+    return task
+
+# Stream a query: tool-step status events first, then answer tokens as they arrive
+def stream_query(query_text, context=None):
+    """Yield status, token and done events for a query, caching the answer once complete"""
+    with tracing.trace(query_text, get_request_log()) as current:
+        for event in _stream_query(query_text, context):
+            if event["type"] == "done":
+                current.path = event["path"]
+            yield event
+
+def _stream_query(query_text, context=None):
+    start = time.perf_counter()
+    key = question_key(query_text)
+    if context is not None:
+        # A follow-up goes straight to the agent with its conversation, as in _answer_follow_up
+        result = degraded_answer(query_text, context) if get_llm_limiter().breaker.is_open else None
+    elif (fast_answer := _fast_path_route(query_text)) is not None:
+        result = {"response": fast_answer["response"], "path": "fast_path"}
+    elif (cached_answer := _cache_lookup(query_text)) is not None:
+        result = {"response": cached_answer, "path": "cache"}
+    elif get_llm_limiter().breaker.is_open:
+        result = degraded_answer(query_text)
+    elif get_fanout_planner().plan(query_text) is not None:
+        yield {"type": "status", "text": "Querying the database and documents in parallel..."}
+        result = _answer_uncached(query_text)
+    else:
+        result = None
+
+    # A streamed answer is registered in flight like answer_query's, so identical questions wait for it
+    flight = get_single_flight()
+    call = flight.claim(key) if result is None and context is None else None
+    if result is None and context is None and call is None:
+        # Someone is already computing this answer; wait for it instead of streaming a duplicate
+        yield {"type": "status", "text": "Waiting for an identical question in progress..."}
+        result = _answer_uncached(query_text)
+
+    if result is not None:
+        elapsed = time.perf_counter() - start
+        yield {"type": "token", "text": result["response"]}
+        yield {"type": "done", **result, "ttft_seconds": elapsed, "total_seconds": elapsed}
+        return
+
     agent = get_agent()
+    tokens = []
+    ttft = None
+    task = None
+    # What waiting requests receive; a stream abandoned by its reader leaves them an error
+    outcome = (None, RuntimeError("The streamed answer was not completed"))
     try:
-        response = agent.query(query_text)
-        return response.response
+        task = create_agent_task(agent, query_text if context is None else with_context(query_text, context))
+        yield {"type": "status", "text": "Planning..."}
+        seen_sources = 0
+        while True:
+            step_output = agent.stream_step(task.task_id)
+            sources = task.extra_state.get("sources", [])
+            for source in sources[seen_sources:]:
+                yield {"type": "status", "text": f"Consulted {source.tool_name}"}
+            seen_sources = len(sources)
+            if step_output.is_last:
+                break
+        response = agent.finalize_response(task.task_id, step_output)
+
+        chunks = getattr(response, "response_gen", None) or [response.response]
+        for chunk in chunks:
+            if ttft is None:
+                ttft = time.perf_counter() - start
+                tracing.current_trace().add_span("first_token", start, ttft)
+            tokens.append(chunk)
+            yield {"type": "token", "text": chunk}
+        answer = "".join(tokens)
+        total = time.perf_counter() - start
+        if context is None:
+            get_answer_cache().put(query_text, answer, cost_seconds=total)
+        path = "agent_stream" if context is None else "follow_up_stream"
+        outcome = ({"response": answer, "path": path}, None)
+    except CircuitOpenError as e:
+        outcome = (None, e)
+        result = degraded_answer(query_text, context)
+        answer, path = result["response"], result["path"]
+        total = time.perf_counter() - start
+        ttft = ttft if ttft is not None else total
+        yield {"type": "token", "text": answer}
     except Exception as e:
+        outcome = (None, e)
         print(f"Error details: {str(e)}")
-        return f"I encountered an error while processing your question. Please try again or rephrase your question."
+        answer = ERROR_MESSAGE
+        total = time.perf_counter() - start
+        ttft = ttft if ttft is not None else total
+        yield {"type": "token", "text": answer}
+        path = "error"
+    finally:
+        # The shared agent keeps finished tasks until they are deleted
+        if task is not None:
+            agent.delete_task(task.task_id)
+        if call is not None:
+            flight.settle(key, call, *outcome)
+    print(f"[{path}] first token {ttft:.2f}s, total {total:.2f}s: {query_text}")
+    yield {"type": "done", "response": answer, "path": path, "ttft_seconds": ttft, "total_seconds": total}
 
-# App UI
-st.image("us-flag.png", width=200)
-st.title("US States Information Center")
-st.markdown("""
-Ask me anything about US states! I can help with:
-- Demographic data (population, land area, etc.)
-- State capitals and largest cities
-- Popular attractions and landmarks
-- State history and culture
-- And much more!
-""")
-
-# Initialize state if needed
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
-
-# Add clear chat button
-col1, col2 = st.columns([4, 1])
-with col2:
-    if st.button("Clear Chat", type="primary"):
-        st.session_state.chat_history = []
-        st.rerun()
+# Query execution, returning only the answer text
+def execute_query(query_text):
+    """Execute a query and cache the results"""
+    return answer_query(query_text)["response"]
 
-# Display chat history
-for message in st.session_state.chat_history:
-    with st.chat_message(message["role"]):
-        st.write(message["content"])
+# Keep the st.cache_data style clear() hook for callers that reset the cache
+execute_query.clear = lambda: get_answer_cache().clear()
 
-# Chat input
-if prompt := st.chat_input("Ask a question about any US state..."):
-    # Display user message
-    with st.chat_message("user"):
-        st.write(prompt)
-    
-    # Add to history
-    st.session_state.chat_history.append({"role": "user", "content": prompt})
-    
-    # Process the query with spinner
-    with st.spinner("Searching for information..."):
-        response = execute_query(prompt)
-    
-    # Display assistant response
+# Counters shown in the sidebar and served by the API's /stats endpoint
+def pipeline_stats():
+    """Return cache, coalescing, SQL, SQL cache, LLM limiter, model and per-stage latency statistics"""
+    # Guard counters exist only once the SQL engine was built; asking earlier would import llama_index
+    guard_stats = get_sql_database().stats() if "sql_guard" in sys.modules else None
+    return {
+        "cache": get_answer_cache().stats(),
+        "coalescing": get_single_flight().stats(),
+        "sql": get_database_engine().query_stats.summary(),
+        "guard": guard_stats,
+        "sql_cache": get_sql_result_cache().stats(),
+        "llm": get_llm_limiter().stats(),
+        "models": get_model_cascade().stats(),
+        "latency": get_request_log().rollup(),
+    }
+
+# Optional remote pipeline: with API_URL set the UI is a thin client of api.py
+@st.cache_resource
+def get_api_client():
+    """Create the query API client, or return None to answer in-process"""
+    api_url = os.getenv("API_URL")
+    if not api_url:
+        return None
+    from api_client import QueryAPIClient
+
+    return QueryAPIClient(api_url, timeout=float(os.getenv("API_TIMEOUT", "120")))
+
+CONVERSATION_SUMMARY_PROMPT = (
+    "Update the running summary of a conversation about US states with its next turn. "
+    "Keep the states, facts and figures the user may refer back to, in at most {words} words.\n\n"
+    "Summary so far: {summary}\n\nUser: {question}\nAssistant: {answer}\n\nUpdated summary:"
+)
+
+# Folds a turn that left the recent window into the summary, on the planning stage's model
+def summarize_turn(summary, question, answer, words=100):
+    """Return the conversation summary updated with one more turn"""
+    prompt = CONVERSATION_SUMMARY_PROMPT.format(
+        words=words, summary=summary or "(none)", question=question, answer=answer
+    )
+    return get_stage_llm("planning").complete(prompt).text.strip()
+
+# Each browser session remembers its own conversation in a fixed token budget
+def get_conversation_memory():
+    """Return this session's conversation memory, creating it on first use"""
+    if "conversation" not in st.session_state:
+        summary_tokens = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "150"))
+        # A thin client has no model of its own, so it keeps extracts of older turns instead
+        use_llm = os.getenv("CONVERSATION_SUMMARY", "llm") == "llm" and get_api_client() is None
+        st.session_state.conversation = ConversationMemory(
+            max_turns=int(os.getenv("CONVERSATION_MAX_TURNS", "3")),
+            max_pending=int(os.getenv("CONVERSATION_MAX_PENDING", "3")),
+            token_budget=int(os.getenv("CONVERSATION_TOKEN_BUDGET", "400")),
+            summary_tokens=summary_tokens,
+            summarize=(
+                functools.partial(summarize_turn, words=summary_tokens * 3 // 4)
+                if use_llm else extractive_summary
+            )
+        )
+    return st.session_state.conversation
+
+# Render the assistant's answer, streaming it when enabled
+def respond(question):
+    """Answer a question inside an assistant chat message and return the answer text"""
+    client = get_api_client()
+    answer_fn = client.answer_query if client else answer_query
+    stream_fn = client.stream_query if client else stream_query
+    # Only follow-ups carry the conversation; standalone questions keep the fast path and caches
+    context = get_conversation_memory().context_for(question)
     with st.chat_message("assistant"):
-        st.write(response)
-    
-    # Add to history
-    st.session_state.chat_history.append({"role": "assistant", "content": response})
-
-# Sidebar with example questions
-with st.sidebar:
-    st.header("Example Questions")
-    example_questions = [
-        "What are popular tourist attractions in Hawaii?",
-        "Which state has the largest land area?",
-        "Tell me about the history of New York.",
-        "Which states border Florida?"
-    ]
-    
-    st.write("Try asking:")
-    # Use enumeration to create unique keys for each button
-    for i, question in enumerate(example_questions):
-        if st.button(question, key=f"btn_{i}"):
-            # Display user message
-            with st.chat_message("user"):
-                st.write(question)
-            
-            # Add to history
-            st.session_state.chat_history.append({"role": "user", "content": question})
-            
-            # Process the query
+        if os.getenv("STREAM_RESPONSES", "true").lower() != "true":
             with st.spinner("Searching for information..."):
-                response = execute_query(question)
-            
-            # Display assistant response
-            with st.chat_message("assistant"):
-                st.write(response)
-            
-            # Add to history
-            st.session_state.chat_history.append({"role": "assistant", "content": response})
-            
-            # Rerun to update UI
+                result = answer_fn(question, context=context)
+            st.write(result["response"])
+            st.caption(f"Served by: {result['path']}")
+            return result["response"]
+
+        status = st.status("Searching for information...")
+        result = {}
+
+        def answer_tokens():
+            for event in stream_fn(question, context=context):
+                if event["type"] == "status":
+                    status.update(label=event["text"])
+                    status.write(event["text"])
+                elif event["type"] == "token":
+                    yield event["text"]
+                else:
+                    result.update(event)
+
+        st.write_stream(answer_tokens())
+        status.update(label="Done", state="complete", expanded=False)
+        st.caption(
+            f"Served by: {result['path']} · first token {result['ttft_seconds']:.1f}s · "
+            f"total {result['total_seconds']:.1f}s"
+        )
+        return result["response"]
+
+# Keep a finished turn for display and for the next follow-up
+def record_turn(question, response):
+    """Append a turn to the capped chat history and the conversation memory"""
+    history = st.session_state.chat_history
+    history.append({"role": "user", "content": question})
+    history.append({"role": "assistant", "content": response})
+    # Trim whole turns so the history never starts with an answer whose question was dropped
+    max_turns = max(1, int(os.getenv("CHAT_HISTORY_MAX", "100")) // 2)
+    del history[:-2 * max_turns]
+    get_conversation_memory().add(question, response)
+
+# Only the newest page of messages is drawn on each rerun
+def render_history():
+    """Display the latest chat messages, with a button that reveals one more page"""
+    history = st.session_state.chat_history
+    hidden = max(0, len(history) - int(os.getenv("CHAT_PAGE_SIZE", "20")) * st.session_state.chat_pages)
+    if hidden and st.button(f"Show earlier messages ({hidden} hidden)"):
+        st.session_state.chat_pages += 1
+        st.rerun()
+    for message in history[hidden:]:
+        with st.chat_message(message["role"]):
+            st.write(message["content"])
+
+# Pipeline counters in the sidebar, from this process or the query API
+def render_pipeline_stats(stats):
+    """Show cache, SQL, LLM, model and latency statistics as sidebar captions"""
+    cache_stats = stats["cache"]
+    flight_stats = stats["coalescing"]
+    st.caption(
+        f"Answer cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+        f"({cache_stats['saved_seconds']:.0f}s of LLM time saved). "
+        f"Coalesced requests: {flight_stats['coalesced']}"
+    )
+    sql_stats = stats["sql"]
+    guard_stats = stats["guard"]
+    sql_caption = (
+        f"SQL: {sql_stats['queries']} queries, mean {sql_stats['mean_ms']:.1f} ms, "
+        f"p95 {sql_stats['p95_ms']:.1f} ms."
+    )
+    if guard_stats is not None:
+        sql_caption += (
+            f" Guard: {guard_stats['plan_rejected'] + guard_stats['rejected']} refused, "
+            f"{guard_stats['timeouts']} timed out, {guard_stats['truncated']} truncated."
+        )
+    sql_cache_stats = stats["sql_cache"]
+    sql_caption += (
+        f" SQL cache: {sql_cache_stats['row_hit_rate']:.0%} of statements, "
+        f"{sql_cache_stats['answer_hit_rate']:.0%} of answers reused."
+    )
+    st.caption(sql_caption)
+    llm_stats = stats["llm"]
+    st.caption(
+        f"LLM: {llm_stats['succeeded']} calls, {llm_stats['retries']} retries, "
+        f"queue wait p95 {llm_stats['queue_wait_p95_ms']:.0f} ms, "
+        f"provider circuit {llm_stats['breaker']['state'].replace('_', ' ')}"
+    )
+    model_stats = stats["models"]
+    if model_stats["stages"]:
+        with st.expander("Models by stage"):
+            st.dataframe(
+                {
+                    "stage": list(model_stats["stages"]),
+                    "model": [s["tier"] for s in model_stats["stages"].values()],
+                    "calls": [sum(s["calls"].values()) for s in model_stats["stages"].values()],
+                    "escalations": [s["escalations"] for s in model_stats["stages"].values()],
+                    "mean ms": [round(s["mean_ms"]) for s in model_stats["stages"].values()],
+                },
+                hide_index=True
+            )
+            st.caption(
+                f"Estimated cost ${model_stats['cost_usd']:.4f}, "
+                f"{model_stats['saved_ratio']:.0%} less than the large model for every stage"
+            )
+    latency = stats["latency"]
+    if latency:
+        with st.expander("Latency by stage (ms)"):
+            st.dataframe(
+                {
+                    "stage": list(latency),
+                    "count": [s["count"] for s in latency.values()],
+                    "p50": [round(s["p50_ms"]) for s in latency.values()],
+                    "p95": [round(s["p95_ms"]) for s in latency.values()],
+                    "p99": [round(s["p99_ms"]) for s in latency.values()],
+                },
+                hide_index=True
+            )
+
+# App UI
+def main():
+    """Render the chat interface; Streamlit runs this script as __main__"""
+    st.set_page_config(
+        page_title="US States Information Center",
+        page_icon="🇺🇸",
+        layout="centered"
+    )
+
+    st.image("us-flag.png", width=200)
+    st.title("US States Information Center")
+    st.markdown("""
+    Ask me anything about US states! I can help with:
+    - Demographic data (population, land area, etc.)
+    - State capitals and largest cities
+    - Popular attractions and landmarks
+    - State history and culture
+    - And much more!
+    """)
+
+    # Initialize state if needed
+    if "chat_history" not in st.session_state:
+        st.session_state.chat_history = []
+        st.session_state.chat_pages = 1
+
+    # Add clear chat button
+    col1, col2 = st.columns([4, 1])
+    with col2:
+        if st.button("Clear Chat", type="primary"):
+            st.session_state.chat_history = []
+            st.session_state.chat_pages = 1
+            get_conversation_memory().clear()
             st.rerun()
 
-    st.divider()
-    st.caption("This app uses a combination of SQL database querying and document retrieval to provide comprehensive information about US states.")
\ No newline at end of file
+    # Display the latest page of the chat history
+    render_history()
+
+    # Chat input
+    if prompt := st.chat_input("Ask a question about any US state..."):
+        # Display user message
+        with st.chat_message("user"):
+            st.write(prompt)
+
+        # Process the query and display the assistant response
+        response = respond(prompt)
+
+        # Add to history
+        record_turn(prompt, response)
+
+    # Sidebar with example questions
+    with st.sidebar:
+        st.header("Example Questions")
+        example_questions = [
+            "What are popular tourist attractions in Hawaii?",
+            "Which state has the largest land area?",
+            "Tell me about the history of New York.",
+            "Which states border Florida?"
+        ]
+
+        st.write("Try asking:")
+        # Use enumeration to create unique keys for each button
+        for i, question in enumerate(example_questions):
+            if st.button(question, key=f"btn_{i}"):
+                # Display user message
+                with st.chat_message("user"):
+                    st.write(question)
+
+                # Process the query and display the assistant response
+                response = respond(question)
+
+                # Add to history
+                record_turn(question, response)
+
+                # Rerun to update UI
+                st.rerun()
+
+        st.divider()
+        client = get_api_client()
+        stats = client.stats() if client else pipeline_stats()
+        if stats is None:
+            st.caption("Pipeline statistics are unavailable: the query API did not respond.")
+        else:
+            render_pipeline_stats(stats)
+        memory_stats = get_conversation_memory().stats()
+        st.caption(
+            f"Conversation memory: {memory_stats['recent_turns']} recent turns and a "
+            f"{memory_stats['summary_tokens']}-token summary of {memory_stats['compactions']} older ones"
+        )
+        st.caption("This app uses a combination of SQL database querying and document retrieval to provide comprehensive information about US states.")
+
+    # Runs after the page has rendered, so it never delays the first paint
+    if get_api_client() is None and os.getenv("WARMUP_ON_START", "true").lower() == "true":
+        start_warmup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Answer a JSONL file of questions offline through the same pipeline as the app.
+
+    python batch.py questions.jsonl answers.jsonl --workers 8 --rate 2
+
+Each input line is {"question": "...", "id": optional}. Each output line holds
+the id, question, response, path, status, error and latency. The output file
+doubles as the checkpoint: rerunning the same command skips every id that
+already has a successful answer. Answers given while the LLM was unavailable
+are recorded as "degraded" and always asked again on the next run.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from rate_limit import TokenBucket
+
+# Paths the pipeline answers by while the LLM circuit is open: an apology or a loosely matched cached answer
+DEGRADED_PATHS = {"degraded", "degraded_cache"}
+
+
+def read_questions(input_path):
+    """Yield ``(id, question)`` pairs; ids default to the line number"""
+    with open(input_path) as f:
+        for number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"question": record}
+            yield str(record.get("id", number)), record["question"]
+
+
+def completed_ids(output_path, retry_errors=False):
+    """Return the ids already answered in an output file from an earlier run.
+
+    Errors count as answered unless ``retry_errors`` is set; degraded answers never do.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # the run was interrupted mid-write
+            if record["status"] == "ok" or (record["status"] == "error" and not retry_errors):
+                done.add(record["id"])
+    return done
+
+
+def _answer(answer_fn, question_id, question):
+    started_at = time.time()
+    start = time.perf_counter()
+    try:
+        result = answer_fn(question)
+        error = None
+        status = "error" if result.get("path") == "error" else "ok"
+        if result.get("path") in DEGRADED_PATHS:
+            error = "The language model was unavailable"
+            status = "degraded"
+    except Exception as e:
+        result = {"response": None, "path": "error"}
+        error = str(e)
+        status = "error"
+    return {
+        "id": question_id,
+        "question": question,
+        "response": result["response"],
+        "path": result["path"],
+        "status": status,
+        "error": error,
+        "seconds": time.perf_counter() - start,
+        "started_at": started_at,
+    }
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def run_batch(input_path, output_path, answer_fn, workers=4, rate=None, burst=None,
+              retry_errors=False, limit=None, progress=None):
+    """Answer every pending question and append results to ``output_path``.
+
+    At most ``workers`` questions run at once and, with ``rate`` set, new
+    questions start at no more than ``rate`` per second. Results are written
+    and flushed as each one finishes, so an interrupted run loses at most the
+    questions that were in flight. Returns a throughput summary.
+    """
+    done = completed_ids(output_path, retry_errors)
+    bucket = TokenBucket(rate, burst) if rate else None
+    skipped = 0
+    latencies = []
+    counts = {"ok": 0, "error": 0, "degraded": 0}
+    start = time.perf_counter()
+
+    with open(output_path, "a+") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        # Start on a fresh line if the last run was cut off mid-write
+        if out.tell() > 0:
+            out.seek(out.tell() - 1)
+            if out.read(1) != "\n":
+                out.write("\n")
+        pending = set()
+
+        def drain(block_until):
+            nonlocal pending
+            finished, pending = wait(pending, return_when=block_until)
+            for future in finished:
+                record = future.result()
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                counts[record["status"]] += 1
+                latencies.append(record["seconds"])
+                if progress:
+                    progress(record)
+
+        try:
+            submitted = 0
+            for question_id, question in read_questions(input_path):
+                if question_id in done:
+                    skipped += 1
+                    continue
+                if limit is not None and submitted >= limit:
+                    break
+                # Keep only a small window queued so an interrupt or rate limit takes effect quickly
+                if len(pending) >= workers * 2:
+                    drain(FIRST_COMPLETED)
+                if bucket:
+                    bucket.acquire()
+                pending.add(pool.submit(_answer, answer_fn, question_id, question))
+                submitted += 1
+        except KeyboardInterrupt:
+            print("Interrupted: finishing questions in flight; rerun to resume.")
+            for future in pending:
+                future.cancel()
+            pending = {future for future in pending if not future.cancelled()}
+        finally:
+            if pending:
+                drain(ALL_COMPLETED)
+
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    answered = sum(counts.values())
+    return {
+        "answered": answered,
+        "ok": counts["ok"],
+        "errors": counts["error"],
+        "degraded": counts["degraded"],
+        "skipped": skipped,
+        "seconds": elapsed,
+        "throughput_qps": answered / elapsed if elapsed else 0.0,
+        "p50_seconds": _percentile(latencies, 50),
+        "p95_seconds": _percentile(latencies, 95),
+        "max_seconds": latencies[-1] if latencies else 0.0,
+    }
+
+
+def agent_answer(question):
+    """Ask the agent directly, bypassing the fast path and caches"""
+    import app
+
+    response = app.get_agent().query(question)
+    return {"response": response.response, "path": "agent"}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions")
+    parser.add_argument("input", help="JSONL file of {\"question\": ..., \"id\": ...} lines")
+    parser.add_argument("output", help="JSONL file for answers; also the resume checkpoint")
+    parser.add_argument("--workers", type=int, default=4, help="questions answered at once")
+    parser.add_argument("--rate", type=float, default=None, help="max questions started per second")
+    parser.add_argument("--burst", type=float, default=None, help="questions allowed to start at once")
+    parser.add_argument("--limit", type=int, default=None, help="answer at most N pending questions")
+    parser.add_argument("--retry-errors", action="store_true", help="answer failed questions again")
+    parser.add_argument("--mode", choices=["pipeline", "agent"], default="pipeline",
+                        help="pipeline uses the fast path and caches like the app; agent always asks the agent")
+    parser.add_argument("--quiet", action="store_true", help="do not print each answer as it finishes")
+    args = parser.parse_args(argv)
+
+    import app  # deferred so --help does not load the pipeline
+
+    answer_fn = app.answer_query if args.mode == "pipeline" else agent_answer
+
+    def progress(record):
+        print(f"[{record['status']}] {record['id']} ({record['path']}, {record['seconds']:.2f}s)")
+
+    summary = run_batch(
+        args.input, args.output, answer_fn,
+        workers=args.workers, rate=args.rate, burst=args.burst,
+        retry_errors=args.retry_errors, limit=args.limit,
+        progress=None if args.quiet else progress,
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Compare whole-text PDF extraction with streaming chunk extraction.
+
+Each extractor runs in a fresh subprocess so peak RSS is measured in
+isolation. Results are printed as JSON.
+
+    python -m benchmarks.bench_pdf_extraction --pages 400
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def write_sample_pdf(path, pages=50, lines_per_page=40):
+    """Write a plain PDF with real text on every page"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page in range(pages):
+        lines = [
+            f"({'Page %d line %d of the state article with some history and geography' % (page + 1, line)}) Tj T*"
+            for line in range(lines_per_page)
+        ]
+        stream = ("BT /F1 9 Tf 12 TL 36 760 Td " + " ".join(lines) + " ET").encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % pages
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    Path(path).write_bytes(bytes(out))
+
+
+def _measure(mode, pdf_path):
+    """Run one extractor in this process and return its timing and peak RSS"""
+    from llama_index.core import Document
+    from wikipedia_scrapper import extract_text_from_pdf, iter_pdf_chunks
+
+    start = time.perf_counter()
+    if mode == "whole":
+        text = extract_text_from_pdf(pdf_path)
+        documents = 1
+        characters = len(Document(text=text, metadata={"state": "Bench"}).text)
+    else:
+        documents = characters = 0
+        for text, page in iter_pdf_chunks(pdf_path):
+            document = Document(text=text, metadata={"state": "Bench", "page": page})
+            documents += 1
+            characters += len(document.text)
+    elapsed = time.perf_counter() - start
+    return {
+        "mode": mode,
+        "seconds": elapsed,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "documents": documents,
+        "characters": characters,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--pdf", help="benchmark an existing PDF instead of a generated one")
+    parser.add_argument("--measure", choices=["whole", "chunks"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(_measure(args.measure, args.pdf)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = args.pdf or str(Path(tmp) / "sample.pdf")
+        if not args.pdf:
+            write_sample_pdf(pdf_path, pages=args.pages)
+        results = []
+        for mode in ["whole", "chunks"]:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_pdf_extraction", "--measure", mode, "--pdf", pdf_path],
+                check=True, capture_output=True, text=True
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+    print(json.dumps({"benchmark": "pdf_extraction", "pages": args.pages, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Measure the query pipeline end to end, offline, with a scripted LLM and retriever.
+
+Gemini and LlamaCloud are replaced by the fakes in ``benchmarks.fakes``; the
+real states.db, SQL guard, caches, router and agent code run unchanged.
+Results are printed (or written) as JSON and can be compared between commits.
+
+    python -m benchmarks.bench_pipeline --output before.json
+    python -m benchmarks.bench_pipeline --compare before.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from benchmarks.fakes import FakeCloudIndex, ScriptedLLM, load_state_corpus
+
+# Question shapes that the fast path and fan-out leave to the agent
+AGENT_QUESTIONS = [
+    "How does {state} compare with its neighbours on people?",
+    "Tell me about the history of {state}",
+    "Which towns near {state} grew fastest?",
+    "What is the climate like in {state}?",
+]
+
+
+def _summary(seconds):
+    seconds = sorted(seconds)
+    if not seconds:
+        return {"n": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0}
+
+    def percentile(p):
+        return seconds[min(len(seconds) - 1, int(p / 100 * len(seconds)))] * 1000
+
+    return {
+        "n": len(seconds),
+        "mean_ms": sum(seconds) / len(seconds) * 1000,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+    }
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def measure_import():
+    """Time ``import app`` in a fresh interpreter"""
+    code = "import time; s = time.perf_counter(); import app; print(time.perf_counter() - s)"
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+@contextlib.contextmanager
+def fake_services(app, llm, nodes, retrieval_latency):
+    """Route the app's Gemini and document engine factories to the fakes"""
+    index = FakeCloudIndex(llm, nodes, latency=retrieval_latency)
+    with mock.patch.object(app, "create_llm", lambda model=None: llm), \
+            mock.patch.object(app, "create_document_engine", lambda llm: index.as_query_engine(llm=llm)):
+        yield
+
+
+def run_benchmarks(queries=20, concurrency=8, llm_latency=0.05, retrieval_latency=0.02):
+    """Run every measurement against a fresh app instance and return the results"""
+    import streamlit as st
+
+    import app
+
+    llm = ScriptedLLM()
+    results = {}
+    with fake_services(app, llm, load_state_corpus(), retrieval_latency):
+        st.cache_resource.clear()
+        _, results["first_fast_path_seconds"] = _timed(app.answer_query, "What is the capital of Texas?")
+        states = sorted(app.get_fast_path_router().state_names.values())
+        llm.state_names = states
+        _, results["first_answer_seconds"] = _timed(
+            app.answer_query, "Which towns near Texas have the oldest churches?"
+        )
+
+        st.cache_resource.clear()
+        _, results["cold_start_seconds"] = _timed(app.initialize_components)
+        _, results["agent_construction_seconds"] = _timed(app.get_agent)
+
+        questions = iter([q.format(state=s) for q in AGENT_QUESTIONS for s in states])
+
+        # Pipeline cost with zero model and retrieval latency: everything that is ours
+        llm.latency = 0.0
+        overhead, calls, prompt_tokens = [], [], []
+        seen = []
+        for _ in range(queries):
+            question = next(questions)
+            before, tokens_before = llm.calls, llm.prompt_tokens
+            _, seconds = _timed(app.answer_query, question)
+            overhead.append(seconds)
+            calls.append(llm.calls - before)
+            prompt_tokens.append(llm.prompt_tokens - tokens_before)
+            seen.append(question)
+        results["agent_overhead"] = {
+            **_summary(overhead),
+            "llm_calls_per_query": sum(calls) / len(calls),
+            "prompt_tokens_per_query": sum(prompt_tokens) / len(prompt_tokens),
+        }
+
+        hits = [_timed(app.answer_query, q)[1] for q in seen]
+        misses = [_timed(app.get_answer_cache().get, next(questions))[1] for _ in range(queries)]
+        results["cache_hit"] = _summary(hits)
+        results["cache_miss_lookup"] = _summary(misses)
+        results["fast_path"] = _summary(
+            [_timed(app.answer_query, f"What is the capital of {s}?")[1] for s in states[:queries]]
+        )
+
+        # Throughput with simulated network latency, distinct questions so nothing is cached
+        llm.latency = llm_latency
+        batch = [next(questions) for _ in range(queries)]
+        serial_start = time.perf_counter()
+        serial = [_timed(app.answer_query, q)[1] for q in batch[:max(1, queries // 4)]]
+        serial_qps = len(serial) / (time.perf_counter() - serial_start)
+        batch = [next(questions) for _ in range(queries)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            loaded = [seconds for _, seconds in pool.map(lambda q: _timed(app.answer_query, q), batch)]
+        elapsed = time.perf_counter() - start
+        results["serial"] = {**_summary(serial), "throughput_qps": serial_qps}
+        results["concurrent"] = {**_summary(loaded), "throughput_qps": len(batch) / elapsed}
+    return results
+
+
+def _flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline, current, threshold=0.2):
+    """Return per-metric changes between two reports, flagging regressions over ``threshold``"""
+    before, after = _flatten(baseline["results"]), _flatten(current["results"])
+    rows = []
+    for name in sorted(before.keys() & after.keys()):
+        if name.endswith((".n", "llm_calls_per_query", "prompt_tokens_per_query")) or not before[name]:
+            continue
+        change = (after[name] - before[name]) / before[name]
+        higher_is_better = name.endswith("_qps")
+        regressed = (-change if higher_is_better else change) > threshold
+        rows.append({"metric": name, "before": before[name], "after": after[name],
+                     "change": change, "regressed": regressed})
+    return rows
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], check=True, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake LLM call")
+    parser.add_argument("--retrieval-latency", type=float, default=0.02, help="seconds per fake retrieval")
+    parser.add_argument("--output", help="write the report to this file as well as stdout")
+    parser.add_argument("--compare", help="baseline report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative change counted as a regression")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep caches and logs of the run out of the working tree
+        os.environ["ANSWER_CACHE_PATH"] = os.path.join(tmp, "answer_cache.db")
+        os.environ["REQUEST_LOG_PATH"] = os.path.join(tmp, "request_log.jsonl")
+        import_seconds = measure_import()
+        with contextlib.redirect_stdout(io.StringIO()):  # the pipeline prints its progress
+            results = run_benchmarks(args.queries, args.concurrency, args.llm_latency, args.retrieval_latency)
+    results["import_seconds"] = import_seconds
+
+    report = {
+        "benchmark": "pipeline",
+        "commit": _commit(),
+        "timestamp": time.time(),
+        "config": {
+            "queries": args.queries,
+            "concurrency": args.concurrency,
+            "llm_latency": args.llm_latency,
+            "retrieval_latency": args.retrieval_latency,
+        },
+        "results": results,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            report["comparison"] = compare(json.load(f), report, args.threshold)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    if any(row["regressed"] for row in report.get("comparison", [])):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Compare recall@k and latency of vector, BM25 and hybrid retrieval on the local index.
+
+A synthetic corpus gives every state a set of article chunks, each naming
+one made-up landmark among generic article vocabulary. Questions ask for a
+landmark, with or without its state; the chunk naming it is the one correct
+answer. Embeddings come from ``HashedEmbedding`` so the run is offline and
+repeatable. Results are printed as JSON.
+
+    python -m benchmarks.bench_retrieval --chunks-per-state 40 --top-k 5
+"""
+import argparse
+import contextlib
+import io
+import json
+import random
+import tempfile
+import time
+
+from llama_index.core import Document
+
+from benchmarks.bench_pipeline import _summary
+from benchmarks.fakes import HashedEmbedding
+from hybrid_retrieval import HybridRetriever
+from local_index import build_local_index
+
+VOCABULARY = (
+    "history settlers railroad river mountains farming industry museum festival county population "
+    "economy tourism climate winter summer coast valley forest lake capital university cathedral "
+    "governor legislature frontier mining cattle cotton timber harbor trade treaty battle colony "
+    "immigrants culture music cuisine architecture highway bridge canal desert plains prairie "
+    "wildlife national park trail monument historic district downtown region border census"
+).split()
+SYLLABLES = ["ka", "vo", "rel", "min", "dor", "sa", "quil", "tem", "bra", "nok", "fen", "lu", "zar", "pel"]
+LANDMARK_KINDS = ["Falls", "Bridge", "Museum", "Canyon", "Lighthouse", "Springs"]
+
+# (label, retrieval mode, narrow to named states)
+CONFIGURATIONS = [
+    ("vector", "vector", False),
+    ("vector_prefilter", "vector", True),
+    ("bm25", "bm25", False),
+    ("hybrid", "hybrid", False),
+    ("hybrid_prefilter", "hybrid", True),
+]
+
+
+def synthetic_corpus(states, chunks_per_state=20, seed=0):
+    """Return ``(documents, landmarks)``; ``landmarks[i]`` is named only by ``documents[i]``"""
+    rng = random.Random(seed)
+    documents, landmarks, seen = [], [], set()
+    for state in states:
+        for _ in range(chunks_per_state):
+            name = ""
+            while not name or name in seen:
+                name = "".join(rng.choice(SYLLABLES) for _ in range(3)).capitalize()
+            seen.add(name)
+            landmark = f"{name} {rng.choice(LANDMARK_KINDS)}"
+            words = " ".join(rng.choice(VOCABULARY) for _ in range(50))
+            documents.append(Document(
+                text=f"{state} {words}. The {landmark} is a well known site in {state}.",
+                metadata={"state": state, "title": f"{state} State Information",
+                          "source": f"state_pdfs/{state.replace(' ', '_')}_state.pdf"},
+            ))
+            landmarks.append((state, landmark))
+    return documents, landmarks
+
+
+def run_benchmark(states, chunks_per_state=20, queries=200, top_k=5, dim=256, seed=0, candidate_k=None):
+    """Index the synthetic corpus and return recall@k and latency per configuration and question type"""
+    documents, landmarks = synthetic_corpus(states, chunks_per_state, seed)
+    rng = random.Random(seed + 1)
+    targets = rng.sample(range(len(landmarks)), min(queries, len(landmarks)))
+    questions = {
+        "landmark": [(f"Where is the {landmarks[row][1]}?", row) for row in targets],
+        "landmark_in_state": [
+            (f"What is special about the {landmarks[row][1]} in {landmarks[row][0]}?", row) for row in targets
+        ],
+    }
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        with contextlib.redirect_stdout(io.StringIO()):
+            index = build_local_index(documents, HashedEmbedding(dim=dim), index_dir=tmp, cache_file=None)
+        start = time.perf_counter()
+        index.bm25
+        results["bm25_build_seconds"] = time.perf_counter() - start
+        results["chunks"] = len(index.chunks)
+
+        for label, mode, prefilter in CONFIGURATIONS:
+            retriever = HybridRetriever(
+                index, similarity_top_k=top_k, mode=mode, prefilter=prefilter, candidate_k=candidate_k
+            )
+            for kind, items in questions.items():
+                seconds, found = [], 0
+                for question, row in items:
+                    start = time.perf_counter()
+                    hits = retriever.search(question)
+                    seconds.append(time.perf_counter() - start)
+                    # One chunk per document, so row numbers line up with the corpus
+                    found += any(hit_row == row for hit_row, _ in hits)
+                results[f"{label}.{kind}"] = {
+                    f"recall_at_{top_k}": found / len(items),
+                    **_summary(seconds),
+                }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks-per-state", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--dim", type=int, default=256, help="dimensions of the fake embedding")
+    parser.add_argument("--candidate-k", type=int, help="rows each search contributes to the fusion")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with open("states.json") as f:
+        states = [record["name"] for record in json.load(f)["results"]]
+    results = run_benchmark(
+        states, args.chunks_per_state, args.queries, args.top_k, args.dim, args.seed, args.candidate_k
+    )
+    report = {"benchmark": "retrieval", "config": vars(args), "results": results}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Deterministic stand-ins for Gemini and LlamaCloud used by the offline benchmarks.
+
+``ScriptedLLM`` answers each prompt the pipeline sends with a canned reply:
+a ReAct tool call, a SQL statement, or a short synthesis. ``KeywordRetriever``
+searches a small in-memory corpus built from ``states.json``. Both sleep for
+a configurable latency so concurrency behaves as it would against real APIs.
+``HashedEmbedding`` stands in for the embedding model.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+
+import numpy as np
+
+from llama_index.core.base.llms.types import CompletionResponse, LLMMetadata
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.llms import CustomLLM
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, TextNode
+from pydantic import PrivateAttr
+
+DOCUMENT_WORDS = re.compile(
+    r"\b(history|historical|attractions?|tourist|culture|geography|climate|economy|landmarks?)\b",
+    re.IGNORECASE,
+)
+
+
+class ScriptedLLM(CustomLLM):
+    """Fake LLM that replies to the app's prompts without a network call"""
+
+    latency: float = 0.0
+    state_names: list = []
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _calls: int = PrivateAttr(default=0)
+    _prompt_chars: int = PrivateAttr(default=0)
+
+    @property
+    def metadata(self):
+        return LLMMetadata(model_name="scripted", context_window=32768, num_output=512)
+
+    @property
+    def calls(self):
+        return self._calls
+
+    @property
+    def prompt_tokens(self):
+        """Prompt tokens sent so far, estimated at four characters per token"""
+        return self._prompt_chars // 4
+
+    @llm_completion_callback()
+    def complete(self, prompt, formatted=False, **kwargs):
+        with self._lock:
+            self._calls += 1
+            self._prompt_chars += len(prompt)
+        if self.latency:
+            time.sleep(self.latency)
+        return CompletionResponse(text=self._reply(prompt))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        text = self.complete(prompt, formatted=formatted).text
+
+        def gen():
+            so_far = ""
+            for word in re.findall(r"\S+\s*", text):
+                so_far += word
+                yield CompletionResponse(text=so_far, delta=word)
+
+        return gen()
+
+    def _reply(self, prompt):
+        if "Action Input" in prompt:
+            return self._react_step(prompt)
+        if prompt.rstrip().endswith("SQLQuery:"):
+            question = prompt.rsplit("Question:", 1)[-1].split("SQLQuery:")[0]
+            return self._sql_for(question)
+        if "SQL Response:" in prompt:
+            rows = prompt.rsplit("SQL Response:", 1)[-1].split("Response:")[0].strip()
+            return f"According to the database: {rows[:300]}"
+        if "Database result:" in prompt:
+            return "Combined answer from the database and the documents."
+        if "Context information" in prompt:
+            context = prompt.split("---------------------")[1].strip() if "------" in prompt else ""
+            return f"According to the documents: {context[:300]}"
+        return "I do not know."
+
+    def _react_step(self, prompt):
+        last_user = prompt[prompt.rfind("user: ") + len("user: "):]
+        if last_user.startswith("Observation:"):
+            observation = last_user[len("Observation:"):].split("\nassistant:")[0].strip()
+            return f"Thought: I can answer without using any more tools.\nAnswer: {observation}"
+        question = last_user.split("\nassistant:")[0].strip()
+        tool = "llama_cloud_tool" if DOCUMENT_WORDS.search(question) else "sql_tool"
+        return (
+            "Thought: The current language of the user is: English. I need to use a tool.\n"
+            f"Action: {tool}\n"
+            f"Action Input: {json.dumps({'input': question})}"
+        )
+
+    def _sql_for(self, question):
+        for name in sorted(self.state_names, key=len, reverse=True):
+            if name.lower() in question.lower():
+                return f"SELECT name, capital, population FROM states WHERE name = '{name}'"
+        return "SELECT name, population FROM states ORDER BY population DESC LIMIT 5"
+
+
+class HashedEmbedding(BaseEmbedding):
+    """Fake dense embedding: a signed hashed bag of words in ``dim`` dimensions.
+
+    Like a real dense model it represents the gist of a passage well and rare
+    exact terms poorly, since every word shares a few dimensions with others.
+    """
+
+    dim: int = 64
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = int(hashlib.md5(word.encode()).hexdigest(), 16)
+            vector[digest % self.dim] += 1.0 if digest & 1 << 64 else -1.0
+        return vector.tolist()
+
+    def _get_query_embedding(self, query):
+        return self._embed(query)
+
+    def _get_text_embedding(self, text):
+        return self._embed(text)
+
+    async def _aget_query_embedding(self, query):
+        return self._embed(query)
+
+
+def load_state_corpus(json_file="states.json"):
+    """Build one short text node per state from the scraped table"""
+    with open(json_file) as f:
+        states = json.load(f)["results"]
+    nodes = []
+    for state in states:
+        name = state["name"]
+        text = " ".join(
+            f"{key}: {value}." for key, value in state.items()
+            if value and key not in ("objectId", "flag", "link", "createdAt", "updatedAt")
+        )
+        nodes.append(TextNode(text=f"{name} history, geography and culture. {text}", metadata={"state": name}))
+    return nodes
+
+
+def _words(text):
+    return {word for word in re.findall(r"\w+", text.lower()) if len(word) > 2}
+
+
+class KeywordRetriever(BaseRetriever):
+    """Fake document retriever ranking nodes by word overlap with the query"""
+
+    def __init__(self, nodes, top_k=2, latency=0.0):
+        super().__init__()
+        self._nodes = nodes
+        self._words = [_words(node.text) for node in nodes]
+        self._top_k = top_k
+        self._latency = latency
+
+    def _retrieve(self, query_bundle):
+        if self._latency:
+            time.sleep(self._latency)
+        query = _words(query_bundle.query_str)
+        scored = sorted(
+            ((len(query & words), i) for i, words in enumerate(self._words)),
+            key=lambda item: (-item[0], item[1]),
+        )[:self._top_k]
+        return [NodeWithScore(node=self._nodes[i], score=float(score)) for score, i in scored]
+
+
+class FakeCloudIndex:
+    """Stands in for LlamaCloudIndex, answering from ``KeywordRetriever``"""
+
+    def __init__(self, llm, nodes, latency=0.0):
+        self.retriever = KeywordRetriever(nodes, latency=latency)
+        self.llm = llm
+
+    def as_query_engine(self, llm=None, **kwargs):
+        return RetrieverQueryEngine.from_args(self.retriever, llm=llm or self.llm)
@@ -0,0 +1,68 @@
+from llama_index.core.base.response.schema import Response
+from llama_index.core.query_engine import NLSQLTableQueryEngine
+from llama_index.core.response_synthesizers import get_response_synthesizer
+
+
+class CachedNLSQLTableQueryEngine(NLSQLTableQueryEngine):
+    """Text-to-SQL engine that reuses the answer synthesized for a repeated question.
+
+    SQL generation still runs for every question. Once the generated
+    statement normalizes to one in ``result_cache`` and the same question was
+    answered from it before, the cached answer is returned and the synthesis
+    LLM call is skipped; a differently worded question reuses the rows but is
+    synthesized again. Only statements that ran are cached; SQL errors are
+    synthesized every time.
+    """
+
+    def __init__(self, *args, result_cache=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._result_cache = result_cache
+
+    def _query(self, query_bundle):
+        if not self._caches_answers():
+            return super()._query(query_bundle)
+        nodes, metadata = self.sql_retriever.retrieve_with_metadata(query_bundle)
+        cached = self._cached_response(query_bundle, nodes, metadata)
+        if cached is not None:
+            return cached
+        response = self._synthesizer(metadata["sql_query"]).synthesize(query=query_bundle.query_str, nodes=nodes)
+        return self._store(query_bundle, response, metadata)
+
+    async def _aquery(self, query_bundle):
+        if not self._caches_answers():
+            return await super()._aquery(query_bundle)
+        nodes, metadata = await self.sql_retriever.aretrieve_with_metadata(query_bundle)
+        cached = self._cached_response(query_bundle, nodes, metadata)
+        if cached is not None:
+            return cached
+        response = await self._synthesizer(metadata["sql_query"]).asynthesize(
+            query=query_bundle.query_str, nodes=nodes
+        )
+        return self._store(query_bundle, response, metadata)
+
+    def _caches_answers(self):
+        return self._result_cache is not None and self._synthesize_response and not self._streaming
+
+    def _cached_response(self, query_bundle, nodes, metadata):
+        if "result" not in metadata:
+            return None
+        answer = self._result_cache.get_answer(metadata["sql_query"], query_bundle.query_str)
+        if answer is None:
+            return None
+        return Response(response=answer, source_nodes=nodes, metadata={**metadata, "sql_cache": "hit"})
+
+    def _synthesizer(self, sql_query):
+        # Same synthesis as NLSQLTableQueryEngine, with the statement filled into the prompt
+        return get_response_synthesizer(
+            llm=self._llm,
+            callback_manager=self.callback_manager,
+            text_qa_template=self._response_synthesis_prompt.partial_format(sql_query=sql_query),
+            refine_template=self._refine_synthesis_prompt,
+            verbose=self._verbose,
+        )
+
+    def _store(self, query_bundle, response, metadata):
+        response.metadata.update(metadata)
+        if "result" in metadata and response.response:
+            self._result_cache.put_answer(metadata["sql_query"], query_bundle.query_str, str(response.response))
+        return response
@@ -0,0 +1,168 @@
+import re
+from collections import deque
+
+from answer_cache import STATE_NAMES
+
+# A question that opens with a connective or a pronoun continues the conversation
+FOLLOW_UP_OPENING = re.compile(
+    r"^\W*(and|also|but|so|then|what about|how about|same for|compared"
+    r"|it|its|they|them|their|those|these)\b",
+    re.IGNORECASE,
+)
+
+# Words that point back at something already said, as in "what is its capital?"
+BACK_REFERENCE = re.compile(
+    r"\b(it|its|they|them|their|he|she|his|her|former|latter)\b"
+    r"|\b(that|this|those|these|the same) (state|states|one|ones|city|cities|place)\b",
+    re.IGNORECASE,
+)
+
+_STATE_REGEX = re.compile(
+    r"\b(" + "|".join(re.escape(name) for name in sorted(STATE_NAMES, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE,
+)
+
+
+def estimate_tokens(text):
+    """Rough token count of a text, about four characters per token"""
+    return len(text) // 4
+
+
+def is_follow_up(question):
+    """Whether a question needs the earlier conversation to be understood.
+
+    A back-reference only counts when the question names no state, so
+    "capital of Texas and its population" stands on its own.
+    """
+    if FOLLOW_UP_OPENING.search(question):
+        return True
+    return BACK_REFERENCE.search(question) is not None and _STATE_REGEX.search(question) is None
+
+
+def clip_text(text, max_tokens):
+    """Cut a text to ``max_tokens`` at a word boundary, keeping its beginning"""
+    text = " ".join(text.split())
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max_tokens * 4 - 3].rsplit(" ", 1)[0] + "..."
+
+
+def clip_summary(summary, max_tokens):
+    """Drop the oldest lines of a summary until it fits ``max_tokens``, then cut what remains"""
+    lines = summary.strip().splitlines() or [""]
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return clip_text(lines[0], max_tokens) if len(lines) == 1 else "\n".join(lines)
+
+
+def first_sentence(text):
+    """The first sentence of an answer, which usually carries the fact asked for"""
+    match = re.match(r"\s*(.+?[.!?])(\s|$)", text, re.DOTALL)
+    return " ".join((match.group(1) if match else text).split())
+
+
+def extractive_summary(summary, question, answer):
+    """Fold a turn into the summary as one "question -> first sentence of the answer" line"""
+    line = f"{' '.join(question.split())} -> {first_sentence(answer)}"
+    return f"{summary}\n{line}" if summary else line
+
+
+def with_context(question, context):
+    """Prompt for a follow-up: the conversation so far, then the question it refers back to"""
+    return (
+        f"Conversation so far:\n{context}\n\n"
+        "Use the conversation only to work out what the user is referring to, "
+        f"then answer their latest question: {question}"
+    )
+
+
+class ConversationMemory:
+    """Memory of one conversation that stays the same size however long it runs.
+
+    The last ``max_turns`` turns are kept word for word, each answer clipped
+    to ``answer_tokens``. A turn pushed out of that window waits unsummarized
+    until a follow-up needs the context; only then is it folded into a
+    running summary by ``summarize(summary, question, answer)``, so answers
+    to standalone questions never wait on a summary. Beyond ``max_pending``
+    waiting turns the oldest is folded in with ``extractive_summary``, which
+    costs no model call. The summary is clipped to ``summary_tokens``, and
+    ``context`` renders it with the newest turns that fit ``token_budget``.
+    """
+
+    def __init__(self, max_turns=3, token_budget=400, summary_tokens=150, answer_tokens=120, summarize=None,
+                 max_pending=3):
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summary_tokens = min(summary_tokens, token_budget)
+        self.answer_tokens = answer_tokens
+        self.summarize = summarize or extractive_summary
+        self.max_pending = max_pending
+        self.summary = ""
+        self.turns = deque()
+        self._pending = deque()
+        self._stats = self._new_stats()
+
+    @staticmethod
+    def _new_stats():
+        return {"turns": 0, "compactions": 0, "summary_failures": 0, "contexts": 0, "context_tokens": 0}
+
+    def add(self, question, answer):
+        """Remember a finished turn, setting the oldest aside for the summary once the window is full"""
+        self.turns.append((question.strip(), clip_text(answer, self.answer_tokens)))
+        self._stats["turns"] += 1
+        while len(self.turns) > self.max_turns:
+            self._pending.append(self.turns.popleft())
+        while len(self._pending) > self.max_pending:
+            self._compact(*self._pending.popleft(), summarize=extractive_summary)
+
+    def context(self):
+        """Return the summary and the newest turns within the token budget, or None when empty"""
+        while self._pending:
+            self._compact(*self._pending.popleft())
+        parts = [f"Earlier: {self.summary}"] if self.summary else []
+        used = estimate_tokens(parts[0]) if parts else 0
+        recent = []
+        for question, answer in reversed(self.turns):
+            turn = f"User: {question}\nAssistant: {answer}"
+            if used + estimate_tokens(turn) > self.token_budget:
+                break
+            recent.append(turn)
+            used += estimate_tokens(turn)
+        parts.extend(reversed(recent))
+        return "\n".join(parts) or None
+
+    def context_for(self, question):
+        """Return the context a question needs: None for a standalone question or an empty memory"""
+        if not is_follow_up(question):
+            return None
+        context = self.context()
+        if context is not None:
+            self._stats["contexts"] += 1
+            self._stats["context_tokens"] += estimate_tokens(context)
+        return context
+
+    def clear(self):
+        """Forget the conversation and reset the counters"""
+        self.summary = ""
+        self.turns.clear()
+        self._pending.clear()
+        self._stats = self._new_stats()
+
+    def stats(self):
+        """Return turn and compaction counters and the current size of the memory"""
+        stats = dict(self._stats)
+        stats["recent_turns"] = len(self.turns)
+        stats["pending_turns"] = len(self._pending)
+        stats["summary_tokens"] = estimate_tokens(self.summary)
+        stats["context_tokens_avg"] = stats["context_tokens"] / stats["contexts"] if stats["contexts"] else 0.0
+        return stats
+
+    def _compact(self, question, answer, summarize=None):
+        try:
+            summary = (summarize or self.summarize)(self.summary, question, answer)
+        except Exception as e:
+            print(f"Conversation summary fell back to extracts: {str(e)}")
+            self._stats["summary_failures"] += 1
+            summary = extractive_summary(self.summary, question, answer)
+        self.summary = clip_summary(summary, self.summary_tokens)
+        self._stats["compactions"] += 1
@@ -0,0 +1,137 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import sqlalchemy as sa
+from sqlalchemy.pool import QueuePool
+
+# Pragmas applied to every read connection
+READ_PRAGMAS = {
+    "query_only": "ON",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -16000,  # negative means KiB, so ~16 MB of page cache per connection
+    "temp_store": "MEMORY",
+}
+
+
+class QueryStats:
+    """Thread-safe timings of the SQL statements run through an engine"""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)
+        self._slowest = []
+        self.count = 0
+        self.total_seconds = 0.0
+
+    def record(self, statement, seconds):
+        with self._lock:
+            self.count += 1
+            self.total_seconds += seconds
+            self._recent.append(seconds)
+            self._slowest.append((seconds, " ".join(statement.split())))
+            self._slowest.sort(reverse=True)
+            del self._slowest[5:]
+
+    def summary(self):
+        """Return count, mean, max and recent percentiles in milliseconds"""
+        with self._lock:
+            recent = sorted(self._recent)
+            slowest = list(self._slowest)
+            count, total = self.count, self.total_seconds
+
+        def percentile(p):
+            if not recent:
+                return 0.0
+            return recent[min(len(recent) - 1, int(p / 100 * len(recent)))] * 1000
+
+        return {
+            "queries": count,
+            "mean_ms": total / count * 1000 if count else 0.0,
+            "p50_ms": percentile(50),
+            "p95_ms": percentile(95),
+            "max_ms": recent[-1] * 1000 if recent else 0.0,
+            "slowest": [{"ms": s * 1000, "sql": sql} for s, sql in slowest],
+        }
+
+    def reset(self):
+        with self._lock:
+            self._recent.clear()
+            self._slowest.clear()
+            self.count = 0
+            self.total_seconds = 0.0
+
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in READ_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def database_fingerprint(db_file):
+    """Identify the current contents of a SQLite file by the inode, size and mtime of it and its WAL"""
+    parts = []
+    for path in (db_file, f"{db_file}-wal"):
+        # The first reader creates an empty WAL; only one holding changes counts
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            stat = os.stat(path)
+            parts.append(f"{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}")
+    return "/".join(parts)
+
+
+def create_read_engine(db_file="states.db", pool_size=5, max_overflow=5, pool_timeout=10):
+    """Open a database read-only behind a thread-safe connection pool.
+
+    Streamlit runs each script rerun on its own thread, so connections are
+    created with ``check_same_thread=False`` and handed out by a QueuePool.
+    A pooled connection stays on the file it opened, so one opened before
+    ``db_creator`` swapped in a new file is replaced when next checked out.
+    Per-statement timings are collected on ``engine.query_stats``.
+    """
+    if not os.path.exists(db_file):
+        raise FileNotFoundError(f"Database file '{db_file}' not found")
+    uri = f"file:{os.path.abspath(db_file)}?mode=ro"
+
+    def connect():
+        return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    engine = sa.create_engine(
+        "sqlite://",
+        creator=connect,
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+    )
+    stats = QueryStats()
+
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        stats.record(statement, time.perf_counter() - conn.info["query_start"].pop())
+
+    def discard_timer(context):
+        if context.connection is not None and context.connection.info.get("query_start"):
+            context.connection.info["query_start"].pop()
+
+    def remember_file(dbapi_connection, connection_record):
+        connection_record.info["fingerprint"] = database_fingerprint(db_file)
+
+    def check_file(dbapi_connection, connection_record, connection_proxy):
+        # The pool retries the checkout with a new connection on the current file
+        if connection_record.info.get("fingerprint") != database_fingerprint(db_file):
+            raise sa.exc.DisconnectionError("states database was replaced")
+
+    sa.event.listen(engine, "connect", _apply_pragmas)
+    sa.event.listen(engine, "connect", remember_file)
+    sa.event.listen(engine, "checkout", check_file)
+    sa.event.listen(engine, "handle_error", discard_timer)
+    sa.event.listen(engine, "before_cursor_execute", _start_timer)
+    sa.event.listen(engine, "after_cursor_execute", stop_timer)
+    engine.query_stats = stats
+    return engine
@@ -1,8 +1,11 @@
+import argparse
 import json
 import os
+import sqlite3
+import time
 import sqlalchemy as sa
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 
 # Create the base class for our models
 Base = declarative_base()
@@ -10,6 +13,7 @@ Base = declarative_base()
 # Define our State model
 class State(Base):
     __tablename__ = 'states'
+    __table_args__ = {'comment': 'one row per US state'}
     
     id = sa.Column(sa.Integer, primary_key=True)
     object_id = sa.Column(sa.String(50), unique=True)
@@ -17,87 +21,286 @@ class State(Base):
     flag_url = sa.Column(sa.String(255))
     link = sa.Column(sa.String(100))
     postal_abbreviation = sa.Column(sa.String(2), unique=True)
-    capital = sa.Column(sa.String(50))
-    largest_city = sa.Column(sa.String(50))
+    capital = sa.Column(sa.String(50), index=True)
+    largest_city = sa.Column(sa.String(50), index=True)
     established = sa.Column(sa.String(50))
-    population = sa.Column(sa.Integer)
-    total_area_square_miles = sa.Column(sa.Integer)
+    population = sa.Column(sa.Integer, index=True)
+    total_area_square_miles = sa.Column(sa.Integer, index=True)
     total_area_square_kilometers = sa.Column(sa.Integer)
-    land_area_square_miles = sa.Column(sa.Integer)
+    land_area_square_miles = sa.Column(sa.Integer, index=True)
     land_area_square_kilometers = sa.Column(sa.Integer)
-    water_area_square_miles = sa.Column(sa.Integer)
+    water_area_square_miles = sa.Column(sa.Integer, index=True)
     water_area_square_kilometers = sa.Column(sa.Integer)
-    number_representatives = sa.Column(sa.Integer)
+    number_representatives = sa.Column(sa.Integer, index=True)
     created_at = sa.Column(sa.String(100))
     updated_at = sa.Column(sa.String(100))
     capitals_object_id = sa.Column(sa.String(50))
 
-def main():
-    # Check if states.db exists and remove it before creating a new one
-    db_file = 'states.db'
-    if os.path.exists(db_file):
+# Derived tables, rebuilt from the states table on every load so questions about
+# neighbours, density and rankings are single indexed lookups
+class StateBorder(Base):
+    __tablename__ = 'state_borders'
+    __table_args__ = {
+        'comment': 'one row per pair of states sharing a land border, stored in both directions',
+        'info': {'topic': 'bordering states', 'samples': 0},
+    }
+
+    state = sa.Column(sa.String(50), primary_key=True)
+    neighbor = sa.Column(sa.String(50), primary_key=True, index=True)
+
+class StateMetrics(Base):
+    __tablename__ = 'state_metrics'
+    __table_args__ = {
+        'comment': 'one row per US state, population_density is people per square mile of land, '
+                   'water_share is water / total area, ranks start at 1 for the highest',
+        'info': {'topic': 'population density and ranks by population, area and water share', 'samples': 0},
+    }
+
+    name = sa.Column(sa.String(50), primary_key=True)
+    population_density = sa.Column(sa.Float, index=True)
+    water_share = sa.Column(sa.Float, index=True)
+    population_rank = sa.Column(sa.Integer, index=True)
+    area_rank = sa.Column(sa.Integer, index=True)
+    density_rank = sa.Column(sa.Integer, index=True)
+    water_share_rank = sa.Column(sa.Integer, index=True)
+
+DERIVED_TABLES = [StateBorder.__table__, StateMetrics.__table__]
+
+# Map states.json keys to State columns
+FIELD_MAP = {
+    'objectId': 'object_id',
+    'name': 'name',
+    'flag': 'flag_url',
+    'link': 'link',
+    'postalAbreviation': 'postal_abbreviation',
+    'capital': 'capital',
+    'largestCity': 'largest_city',
+    'established': 'established',
+    'population': 'population',
+    'totalAreaSquareMiles': 'total_area_square_miles',
+    'totalAreaSquareKilometers': 'total_area_square_kilometers',
+    'landAreaSquareMiles': 'land_area_square_miles',
+    'landAreaSquareKilometers': 'land_area_square_kilometers',
+    'waterAreaSquareMiles': 'water_area_square_miles',
+    'waterAreaSquareKilometers': 'water_area_square_kilometers',
+    'numberRepresentatives': 'number_representatives',
+    'createdAt': 'created_at',
+    'updatedAt': 'updated_at',
+}
+
+def iter_state_records(json_file, chunk_size=1 << 16):
+    """Stream the objects of the "results" array without loading the whole file"""
+    decoder = json.JSONDecoder()
+    with open(json_file, 'r') as f:
+        buffer = ""
+        # Skip ahead to the opening bracket of the results array
+        while True:
+            key = buffer.find('"results"')
+            bracket = buffer.find('[', key) if key != -1 else -1
+            if bracket != -1:
+                buffer = buffer[bracket + 1:]
+                break
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buffer += chunk
+
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                record, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise
+                buffer += chunk
+                continue
+            yield record
+            buffer = buffer[end:]
+
+def state_row(state_data):
+    """Convert a states.json record into a row for the states table"""
+    row = {column: state_data.get(key) for key, column in FIELD_MAP.items()}
+    # Handle the capitals pointer
+    capitals = state_data.get('capitals')
+    row['capitals_object_id'] = capitals.get('objectId') if isinstance(capitals, dict) else None
+    return row
+
+def _batches(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(state_row(record))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def load_states(db_file='states.db', json_file='states.json', batch_size=500,
+                incremental=False, echo=False, borders_file='state_borders.json'):
+    """Build the database in a temp file with batched upserts, then swap it in atomically.
+
+    In incremental mode the current database is copied first and only rows whose
+    updatedAt changed are rewritten; rows missing from the JSON are removed.
+    The derived tables are rebuilt from the final states table either way.
+    """
+    start = time.perf_counter()
+    tmp_file = db_file + '.tmp'
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    if incremental and os.path.exists(db_file):
+        # Copy with the backup API so the copy is consistent even while readers are active
+        source, target = sqlite3.connect(db_file), sqlite3.connect(tmp_file)
         try:
-            os.remove(db_file)
-            print(f"Existing database '{db_file}' was deleted.")
-        except Exception as e:
-            print(f"Error: Failed to delete existing database. {e}")
-            return
-
-    # Connect to the database
-    engine = sa.create_engine('sqlite:///states.db', echo=True)
-    
-    # Create tables
+            source.backup(target)
+        finally:
+            source.close()
+            target.close()
+
+    engine = sa.create_engine(f'sqlite:///{tmp_file}', echo=echo)
+    try:
+        stats, seen = _upsert_states(engine, json_file, batch_size)
+        stats.update(build_derived_tables(engine, borders_file))
+        optimize_database(engine)
+    except Exception:
+        engine.dispose()
+        os.remove(tmp_file)
+        raise
+    engine.dispose()
+
+    # Atomically replace the live database so readers never see a partial file
+    os.replace(tmp_file, db_file)
+    stats['rows'] = len(seen)
+    stats['seconds'] = time.perf_counter() - start
+    return stats
+
+def _upsert_states(engine, json_file, batch_size):
+    """Upsert changed records batch by batch and return (stats, object ids seen)"""
     Base.metadata.create_all(engine)
-    
-    # Create a session
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    
-    # Load the JSON data
-    with open('states.json', 'r') as f:
-        data = json.load(f)
-        states_data = data.get('results', [])
-    
-    # Insert data
-    for state_data in states_data:
-        # Create a new State object
-        state = State(
-            object_id=state_data.get('objectId'),
-            name=state_data.get('name'),
-            flag_url=state_data.get('flag'),
-            link=state_data.get('link'),
-            postal_abbreviation=state_data.get('postalAbreviation'),
-            capital=state_data.get('capital'),
-            largest_city=state_data.get('largestCity'),
-            established=state_data.get('established'),
-            population=state_data.get('population'),
-            total_area_square_miles=state_data.get('totalAreaSquareMiles'),
-            total_area_square_kilometers=state_data.get('totalAreaSquareKilometers'),
-            land_area_square_miles=state_data.get('landAreaSquareMiles'),
-            land_area_square_kilometers=state_data.get('landAreaSquareKilometers'),
-            water_area_square_miles=state_data.get('waterAreaSquareMiles'),
-            water_area_square_kilometers=state_data.get('waterAreaSquareKilometers'),
-            number_representatives=state_data.get('numberRepresentatives'),
-            created_at=state_data.get('createdAt'),
-            updated_at=state_data.get('updatedAt')
-        )
-        
-        # Handle the capitals pointer
-        if 'capitals' in state_data and isinstance(state_data['capitals'], dict):
-            state.capitals_object_id = state_data['capitals'].get('objectId')
-        
-        # Add to session
-        session.add(state)
-    
-    # Commit the session
+    table = State.__table__
+    stats = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+    seen = set()
+
+    with engine.begin() as conn:
+        for batch in _batches(iter_state_records(json_file), batch_size):
+            ids = [row['object_id'] for row in batch]
+            existing = dict(conn.execute(
+                sa.select(table.c.object_id, table.c.updated_at).where(table.c.object_id.in_(ids))
+            ).all())
+            changed = []
+            for row in batch:
+                seen.add(row['object_id'])
+                if row['object_id'] not in existing:
+                    stats['inserted'] += 1
+                    changed.append(row)
+                elif existing[row['object_id']] != row['updated_at']:
+                    stats['updated'] += 1
+                    changed.append(row)
+                else:
+                    stats['unchanged'] += 1
+            if not changed:
+                continue
+
+            # Upsert the batch with a single executemany
+            stmt = sqlite_insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.object_id],
+                set_={column: stmt.excluded[column] for column in changed[0] if column != 'object_id'}
+            )
+            conn.execute(stmt, changed)
+
+        # Drop states that are no longer in the source data
+        stale = [object_id for (object_id,) in conn.execute(sa.select(table.c.object_id)) if object_id not in seen]
+        if stale:
+            conn.execute(table.delete().where(table.c.object_id.in_(stale)))
+            stats['deleted'] = len(stale)
+    return stats, seen
+
+def load_borders(borders_file):
+    """Return land borders as (postal abbreviation, postal abbreviation) pairs, both directions"""
+    if not borders_file or not os.path.exists(borders_file):
+        return set()
+    with open(borders_file) as f:
+        borders = json.load(f)
+    pairs = set()
+    for state, neighbors in borders.items():
+        for neighbor in neighbors:
+            pairs.update([(state, neighbor), (neighbor, state)])
+    return pairs
+
+# Ranks are computed by SQLite window functions so the whole rebuild is one statement per table
+_METRICS_SQL = """
+INSERT INTO state_metrics (name, population_density, water_share,
+                           population_rank, area_rank, density_rank, water_share_rank)
+SELECT name, density, share,
+       CASE WHEN population IS NOT NULL THEN RANK() OVER (ORDER BY population IS NULL, population DESC) END,
+       CASE WHEN area IS NOT NULL THEN RANK() OVER (ORDER BY area IS NULL, area DESC) END,
+       CASE WHEN density IS NOT NULL THEN RANK() OVER (ORDER BY density IS NULL, density DESC) END,
+       CASE WHEN share IS NOT NULL THEN RANK() OVER (ORDER BY share IS NULL, share DESC) END
+FROM (
+    SELECT name, population, total_area_square_miles AS area,
+           ROUND(CAST(population AS REAL) / NULLIF(land_area_square_miles, 0), 2) AS density,
+           ROUND(CAST(water_area_square_miles AS REAL) / NULLIF(total_area_square_miles, 0), 4) AS share
+    FROM states
+)
+"""
+
+def build_derived_tables(engine, borders_file='state_borders.json'):
+    """Rebuild the borders and metrics tables from the states table and return their row counts"""
+    Base.metadata.create_all(engine, tables=DERIVED_TABLES)
+    borders = StateBorder.__table__
+    with engine.begin() as conn:
+        names = dict(conn.execute(sa.select(State.__table__.c.postal_abbreviation, State.__table__.c.name)).all())
+        rows = [
+            {'state': names[state], 'neighbor': names[neighbor]}
+            for state, neighbor in sorted(load_borders(borders_file))
+            if state in names and neighbor in names
+        ]
+        conn.execute(borders.delete())
+        if rows:
+            conn.execute(borders.insert(), rows)
+        conn.execute(StateMetrics.__table__.delete())
+        conn.exec_driver_sql(_METRICS_SQL)
+    return {'borders': len(rows) // 2}
+
+def optimize_database(engine):
+    """Create secondary indexes, refresh planner statistics and switch to WAL"""
+    with engine.begin() as conn:
+        # Databases copied from older builds may predate the indexes
+        for table in [State.__table__, *DERIVED_TABLES]:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+        conn.exec_driver_sql('ANALYZE')
+    with engine.connect() as conn:
+        conn.exec_driver_sql('PRAGMA journal_mode=WAL')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load states.json into states.db")
+    parser.add_argument('--db', default='states.db')
+    parser.add_argument('--json', default='states.json')
+    parser.add_argument('--borders', default='state_borders.json',
+                        help="land borders as postal abbreviation -> neighbouring abbreviations")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--incremental', action='store_true',
+                        help="update the existing database instead of rebuilding it")
+    parser.add_argument('--echo', action='store_true', help="log every SQL statement")
+    args = parser.parse_args(argv)
+
     try:
-        session.commit()
-        print(f"Successfully imported {len(states_data)} states to the database.")
+        stats = load_states(args.db, args.json, batch_size=args.batch_size,
+                            incremental=args.incremental, echo=args.echo,
+                            borders_file=args.borders)
     except Exception as e:
-        session.rollback()
-        print(f"Error: Failed to commit data to database. {e}")
-    finally:
-        session.close()
+        print(f"Error: Failed to load data into database. {e}")
+        return
+    print(
+        f"Loaded {stats['rows']} states into '{args.db}' in {stats['seconds']:.3f}s: "
+        f"{stats['inserted']} inserted, {stats['updated']} updated, "
+        f"{stats['unchanged']} unchanged, {stats['deleted']} deleted, "
+        f"{stats['borders']} borders."
+    )
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,97 @@
+import hashlib
+import sqlite3
+
+import numpy as np
+
+
+def content_key(text, model_name):
+    """Key of a chunk's embedding: a hash of the embedding model and the exact chunk text"""
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Persistent chunk embeddings in SQLite, keyed by content hash and embedding model.
+
+    ``embed`` returns vectors for a batch of chunk texts, sending only the
+    texts it has not stored before to the embedding function, in one call.
+    Every key used during a run is remembered, so ``collect_garbage`` can drop
+    the vectors of chunks that no longer exist once the run is complete.
+    """
+
+    def __init__(self, path, model_name):
+        self.path = str(path)
+        self.model_name = model_name or "unknown"
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+        self._live = set()
+        self._stats = {
+            "chunks": 0,
+            "reused": 0,
+            "embedded": 0,
+            "batches": 0,
+            "embedding_calls": 0,
+            "deleted": 0,
+        }
+
+    def embed(self, texts, embed_fn):
+        """Return a float32 matrix with one row per text; ``embed_fn(texts)`` embeds the misses"""
+        keys = [content_key(text, self.model_name) for text in texts]
+        vectors = self._lookup(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        self._stats["chunks"] += len(keys)
+        self._stats["reused"] += sum(key in vectors for key in keys)
+        self._stats["batches"] += 1
+        if missing:
+            embedded = np.asarray(embed_fn(list(missing.values())), dtype=np.float32)
+            self._stats["embedding_calls"] += 1
+            self._stats["embedded"] += len(missing)
+            self._store(dict(zip(missing, embedded)))
+            vectors.update(zip(missing, embedded))
+        self._live.update(keys)
+        return np.stack([vectors[key] for key in keys])
+
+    def collect_garbage(self):
+        """Delete vectors whose chunk was not seen in this run and return how many were removed"""
+        self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS live (key TEXT PRIMARY KEY)")
+        self._conn.execute("DELETE FROM live")
+        self._conn.executemany("INSERT OR IGNORE INTO live VALUES (?)", ((key,) for key in self._live))
+        deleted = self._conn.execute("DELETE FROM embeddings WHERE key NOT IN (SELECT key FROM live)").rowcount
+        self._conn.commit()
+        self._stats["deleted"] += deleted
+        return deleted
+
+    def stats(self):
+        """Return reuse counters for the current run; a cold run would make one call per batch"""
+        stats = dict(self._stats)
+        stats["entries"] = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        stats["reuse_ratio"] = stats["reused"] / stats["chunks"] if stats["chunks"] else 0.0
+        stats["embedding_calls_saved"] = stats["batches"] - stats["embedding_calls"]
+        return stats
+
+    def close(self):
+        self._conn.close()
+
+    def _lookup(self, keys):
+        vectors = {}
+        unique = list(dict.fromkeys(keys))
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(unique), 500):
+            batch = unique[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+            )
+            for key, blob in rows:
+                vectors[key] = np.frombuffer(blob, dtype=np.float32)
+        return vectors
+
+    def _store(self, vectors):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, model, dim, vector) VALUES (?, ?, ?, ?)",
+            [(key, self.model_name, len(vector), vector.astype(np.float32).tobytes())
+             for key, vector in vectors.items()],
+        )
+        self._conn.commit()
@@ -0,0 +1,58 @@
+from llama_index.core.base.base_query_engine import BaseQueryEngine
+
+from llm_limiter import CircuitOpenError
+
+
+class EscalatingQueryEngine(BaseQueryEngine):
+    """Query engine that answers with a cheap engine and falls back to a stronger one.
+
+    ``validate`` returns a reason string for a response that cannot be
+    trusted, or None. A failed validation or an error from the cheap engine
+    sends the question to ``escalation_engine`` and reports the reason to
+    ``on_escalate``. An open LLM circuit is raised as is, since the stronger
+    model sits behind the same provider.
+    """
+
+    def __init__(self, engine, escalation_engine, validate, on_escalate=None):
+        super().__init__(callback_manager=None)
+        self.engine = engine
+        self.escalation_engine = escalation_engine
+        self.validate = validate
+        self.on_escalate = on_escalate
+
+    def query(self, str_or_query_bundle):
+        try:
+            response = self.engine.query(str_or_query_bundle)
+            reason = self.validate(response)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            reason = f"error: {type(e).__name__}"
+        if reason is None:
+            return response
+        if self.on_escalate is not None:
+            self.on_escalate(reason)
+        return self.escalation_engine.query(str_or_query_bundle)
+
+    async def aquery(self, str_or_query_bundle):
+        try:
+            response = await self.engine.aquery(str_or_query_bundle)
+            reason = self.validate(response)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            reason = f"error: {type(e).__name__}"
+        if reason is None:
+            return response
+        if self.on_escalate is not None:
+            self.on_escalate(reason)
+        return await self.escalation_engine.aquery(str_or_query_bundle)
+
+    def _query(self, query_bundle):
+        return self.query(query_bundle)
+
+    async def _aquery(self, query_bundle):
+        return await self.aquery(query_bundle)
+
+    def _get_prompt_modules(self):
+        return {}
@@ -0,0 +1,181 @@
+import contextvars
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+# Facets answered by the states table and its derived borders and metrics tables
+SQL_FACETS = {
+    "population density": r"population density|density|densely populated",
+    "population": r"population(?! density)|how many people|populous",
+    "capital": r"capital",
+    "largest city": r"largest city|biggest city",
+    "area": r"area|size|square miles",
+    "postal abbreviation": r"postal|abbreviation",
+    "number of representatives": r"representatives",
+    "date of statehood": r"statehood|established|admitted",
+    "neighbouring states": r"borders?|bordering|neighbou?rs?|neighbou?ring",
+}
+
+# Facets answered by the Wikipedia documents
+DOC_FACETS = {
+    "history": r"history|historical|founded by|settled",
+    "attractions": r"attractions?|tourist|tourism|landmarks?|things to do|visit",
+    "culture": r"culture|cuisine|food|music|traditions?",
+    "geography": r"geography|climate|landscape|mountains|rivers",
+    "economy": r"economy|industr(?:y|ies)|agriculture",
+}
+
+SYNTHESIS_PROMPT = (
+    "You are an expert US States information system. Answer the user's question "
+    "by combining the two sources below. Use the database result for facts and "
+    "figures and the documents for descriptive detail. If a source says it is "
+    "unavailable, answer from the other one and say what is missing.\n\n"
+    "Question: {question}\n\n"
+    "Database result:\n{sql}\n\n"
+    "Documents result:\n{documents}\n\n"
+    "Answer:"
+)
+
+
+def _facets(text, facets):
+    return [name for name, pattern in facets.items() if re.search(rf"\b(?:{pattern})\b", text)]
+
+
+class FanOutPlanner:
+    """Decide whether a question needs both the states table and the documents.
+
+    A question qualifies when it asks for at least one database facet and at
+    least one document facet. Each source then gets the question exactly as
+    asked, so qualifiers such as "in 1900" survive, followed by a hint naming
+    the facets it should answer for the states the question mentions.
+    """
+
+    def __init__(self, state_names=()):
+        self._state_names = {name.lower(): name for name in state_names}
+        names = sorted(self._state_names, key=len, reverse=True)
+        self._state_regex = (
+            re.compile(r"\b(" + "|".join(re.escape(n) for n in names) + r")\b", re.IGNORECASE)
+            if names else None
+        )
+
+    def plan(self, question):
+        """Return ``{"sql": ..., "documents": ...}`` sub-questions, or None if one source is enough"""
+        text = question.lower()
+        sql_facets = _facets(text, SQL_FACETS)
+        doc_facets = _facets(text, DOC_FACETS)
+        if not sql_facets or not doc_facets:
+            return None
+
+        states = []
+        if self._state_regex is not None:
+            for match in self._state_regex.finditer(question):
+                name = self._state_names[match.group(1).lower()]
+                if name not in states:
+                    states.append(name)
+        subject = f" of {' and '.join(states)}" if states else ""
+        return {
+            "sql": f"{question} (Answer only the {' and '.join(sql_facets)}{subject}.)",
+            "documents": f"{question} (Describe only the {' and '.join(doc_facets)}{subject}.)",
+        }
+
+
+class FanOutExecutor:
+    """Answer compound questions by querying the SQL and document engines concurrently.
+
+    ``run`` executes one sub-question per engine in a thread pool, each with
+    its own timeout so a slow retrieval cannot hold back the SQL answer, and
+    then merges them in a single synthesis call.
+
+    A branch that times out is cancelled if it has not started. One that is
+    already running cannot be interrupted, so it is counted as stuck until it
+    returns; while ``max_stuck`` branches of an engine are stuck, later runs
+    skip that engine instead of queueing behind them in the shared pool.
+    """
+
+    def __init__(self, sql_query_engine, document_query_engine, llm,
+                 branch_timeout=30.0, parallel=True, max_workers=8, max_stuck=None):
+        self.engines = {"sql": sql_query_engine, "documents": document_query_engine}
+        self.llm = llm
+        self.branch_timeout = branch_timeout
+        self.parallel = parallel
+        # By default each engine may tie up at most a quarter of the workers after timing out
+        self.max_stuck = max_stuck if max_stuck is not None else max(1, max_workers // 4)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fanout")
+        self._stuck = {name: 0 for name in self.engines}
+        self._lock = threading.Lock()
+
+    def run(self, question, plan):
+        """Run both branches and synthesize one answer, with per-branch timings"""
+        start = time.perf_counter()
+        if self.parallel:
+            branches = {}
+            futures = {}
+            for name in self.engines:
+                with self._lock:
+                    stuck = self._stuck[name] >= self.max_stuck
+                if stuck:
+                    branches[name] = {
+                        "response": f"(The {name} source is busy with earlier requests that timed out.)",
+                        "seconds": 0.0,
+                        "status": "skipped",
+                    }
+                    continue
+                # Each branch runs in the caller's context so tracing spans land on its request
+                futures[name] = self._pool.submit(
+                    contextvars.copy_context().run, self._run_branch, name, plan[name]
+                )
+            for name, future in futures.items():
+                remaining = self.branch_timeout - (time.perf_counter() - start)
+                try:
+                    branches[name] = future.result(timeout=max(0.0, remaining))
+                except FutureTimeout:
+                    if not future.cancel():
+                        self._mark_stuck(name, future)
+                    branches[name] = {
+                        "response": f"(The {name} source did not respond within {self.branch_timeout:.0f}s.)",
+                        "seconds": self.branch_timeout,
+                        "status": "timeout",
+                    }
+        else:
+            branches = {name: self._run_branch(name, plan[name]) for name in self.engines}
+        retrieval_seconds = time.perf_counter() - start
+
+        synthesis_start = time.perf_counter()
+        answer = self.llm.complete(SYNTHESIS_PROMPT.format(
+            question=question,
+            sql=branches["sql"]["response"],
+            documents=branches["documents"]["response"],
+        )).text.strip()
+        synthesis_seconds = time.perf_counter() - synthesis_start
+
+        sequential_seconds = sum(branch["seconds"] for branch in branches.values())
+        return {
+            "response": answer,
+            "branches": branches,
+            "retrieval_seconds": retrieval_seconds,
+            "synthesis_seconds": synthesis_seconds,
+            "total_seconds": time.perf_counter() - start,
+            # What the same branches would have cost one after the other
+            "saved_seconds": max(0.0, sequential_seconds - retrieval_seconds) if self.parallel else 0.0,
+        }
+
+    def _mark_stuck(self, name, future):
+        with self._lock:
+            self._stuck[name] += 1
+        future.add_done_callback(lambda _: self._unmark_stuck(name))
+
+    def _unmark_stuck(self, name):
+        with self._lock:
+            self._stuck[name] -= 1
+
+    def _run_branch(self, name, sub_question):
+        start = time.perf_counter()
+        try:
+            response = str(self.engines[name].query(sub_question))
+            status = "ok"
+        except Exception as e:
+            print(f"Error in {name} branch: {e}")
+            response = f"(The {name} source failed: {e})"
+            status = "error"
+        return {"response": response, "seconds": time.perf_counter() - start, "status": status}
@@ -0,0 +1,324 @@
+import re
+
+import sqlalchemy as sa
+
+# Every word of a fast-path question must be one of these, a state name or a number;
+# anything else (history, comparisons, "and" ...) is left to the agent
+KNOWN_WORDS = {
+    "a", "an", "the", "of", "in", "for", "by", "is", "are", "was", "what", "what's", "which",
+    "when", "how", "many", "much", "does", "do", "did", "has", "have", "with", "its", "s",
+    "tell", "me", "give", "list", "show", "name", "please", "us", "u", "state", "states",
+    "capital", "largest", "biggest", "most", "populous", "postal", "code", "abbreviation",
+    "letter", "number", "house", "representatives", "congressional", "seats",
+    "established", "admitted", "statehood", "founded", "became", "land", "water", "total",
+    "area", "size", "population", "people", "residents", "live", "top", "bottom", "smallest",
+    "least", "highest", "lowest", "greatest", "fewest", "stand", "mean", "square", "miles",
+    "border", "borders", "bordering", "neighbor", "neighbors", "neighboring", "neighbour",
+    "neighbours", "neighbouring", "adjacent", "to", "density", "densely", "dense", "populated", "per",
+}
+
+# The only phrases in which "city" is understood; "New York City" or "Kansas City" is not a state
+CITY_PHRASES = r"\b(?:largest|biggest|most populous|capital) city\b"
+
+# Words that ask for the states sharing a land border with a state
+BORDER_PATTERN = r"borders?|bordering|neighbou?rs?|neighbou?ring|adjacent"
+
+# Phrases that name a column of the states table, most specific first
+ATTRIBUTE_PATTERNS = [
+    ("largest_city", r"largest city|biggest city|most populous city"),
+    ("capital", r"capital(?: city)?"),
+    ("postal_abbreviation", r"postal (?:code|abbreviation)|abbreviation|state code|two[- ]letter code"),
+    ("number_representatives", r"(?:number of )?(?:house )?representatives|congressional seats"),
+    ("established", r"established|admitted|statehood|founded|became a state"),
+    ("land_area_square_miles", r"land area"),
+    ("water_area_square_miles", r"water area"),
+    ("total_area_square_miles", r"total area|area|size"),
+    ("population_density", r"population density|density|densely populated|people per square mile"),
+    ("population", r"population|how many people|how many residents|people live"),
+]
+
+# Rewordings folded into the phrases above before matching
+PHRASE_REWRITES = [
+    (r"\barea of (land|water)\b", r"\1 area"),
+    (r"\bsize of (?:the )?population\b", "population"),
+]
+
+# Columns that can be ranked, with the words that select them
+RANK_METRICS = [
+    ("population_density", r"population density|density|densely populated|densely|dense"),
+    ("land_area_square_miles", r"land area"),
+    ("water_area_square_miles", r"water area|water"),
+    ("population", r"population|populous|people|residents"),
+    ("number_representatives", r"(?:number of )?(?:house )?representatives|congressional seats"),
+    ("total_area_square_miles", r"total area|area|size"),
+]
+
+DESCENDING = r"largest|biggest|most|highest|greatest|top"
+ASCENDING = r"smallest|least|lowest|fewest|bottom"
+# Superlatives that rank by size when no metric follows them, as in "the largest state"
+SIZE_WORDS = {"largest", "biggest", "smallest"}
+
+COLUMN_LABELS = {
+    "capital": "capital",
+    "largest_city": "largest city",
+    "postal_abbreviation": "postal abbreviation",
+    "number_representatives": "number of representatives",
+    "established": "date of statehood",
+    "population": "population",
+    "land_area_square_miles": "land area",
+    "water_area_square_miles": "water area",
+    "total_area_square_miles": "total area",
+    "population_density": "population density",
+}
+
+AREA_COLUMNS = {"land_area_square_miles", "water_area_square_miles", "total_area_square_miles"}
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+
+
+def format_value(column, value):
+    """Format a column value for display"""
+    if value is None:
+        return "unknown"
+    if column in AREA_COLUMNS:
+        return f"{value:,} square miles"
+    if column == "population_density":
+        return f"{value:,.1f} people per square mile"
+    if isinstance(value, int):
+        return f"{value:,}"
+    return str(value)
+
+
+class FastPathRouter:
+    """Answer simple structured questions with parameterized SQL, no LLM involved.
+
+    ``route`` returns a dict with the answer, intent and SQL when the question
+    matches a known shape with confidence, and None otherwise. Borders and
+    population density come from the derived tables built by ``db_creator``;
+    against a database without them those questions fall through.
+    """
+
+    def __init__(self, engine, table="states"):
+        self.engine = engine
+        metadata = sa.MetaData()
+        self.table = sa.Table(table, metadata, autoload_with=engine)
+        present = set(sa.inspect(engine).get_table_names())
+        self.borders = (
+            sa.Table("state_borders", metadata, autoload_with=engine) if "state_borders" in present else None
+        )
+        self.metrics = (
+            sa.Table("state_metrics", metadata, autoload_with=engine) if "state_metrics" in present else None
+        )
+        with engine.connect() as conn:
+            rows = conn.execute(
+                sa.select(self.table.c.name, self.table.c.postal_abbreviation)
+            ).all()
+        self.state_names = {name.lower(): name for name, _ in rows}
+        self.abbreviations = {abbr.upper(): name for name, abbr in rows if abbr}
+        # Longest names first so "West Virginia" wins over "Virginia"
+        names = sorted(self.state_names, key=len, reverse=True)
+        self._state_regex = re.compile(r"\b(" + "|".join(re.escape(n) for n in names) + r")\b")
+
+    def route(self, question):
+        """Return a fast-path answer for the question, or None to fall through"""
+        text = " ".join(re.findall(r"[a-z0-9]+", question.lower()))
+        if not text:
+            return None
+        for pattern, replacement in PHRASE_REWRITES:
+            text = re.sub(pattern, replacement, text)
+
+        states = self._find_states(text)
+        if not states:
+            result = self._abbreviation_lookup(text)
+            if result is not None:
+                return result
+        if len(states) > 1 or not self._fully_understood(text):
+            return None
+        if states:
+            if re.search(rf"\b(?:{BORDER_PATTERN})\b", text):
+                return self._border_lookup(text, states[0])
+            return self._attribute_lookup(text, states[0])
+        return self._ranking(text)
+
+    # ----- intents -----
+
+    def _attribute_lookup(self, text, state):
+        # "land area to water area" asks for two columns at once
+        columns = self._mentioned(text, ATTRIBUTE_PATTERNS)
+        if len(columns) != 1 or re.search(r"\d", text):
+            return None
+        column = columns[0]
+        source = self._column(column)
+        if source is None:
+            return None
+        sql = sa.select(source).where(source.table.c.name == state)
+        rows = self._run(sql)
+        value = rows[0][0] if rows else None
+        label = COLUMN_LABELS[column]
+        return self._result(
+            "attribute", sql, f"The {label} of {state} is {format_value(column, value)}."
+        )
+
+    def _border_lookup(self, text, state):
+        # "population of the states bordering Texas" needs a join the agent is better at
+        if self.borders is None or self._match_attribute(text) is not None or re.search(r"\d", text):
+            return None
+        sql = (
+            sa.select(self.borders.c.neighbor)
+            .where(self.borders.c.state == state)
+            .order_by(self.borders.c.neighbor)
+        )
+        neighbors = [neighbor for (neighbor,) in self._run(sql)]
+        listed = f"{', '.join(neighbors[:-1])} and {neighbors[-1]}" if len(neighbors) > 1 else "".join(neighbors)
+        if not neighbors:
+            answer = f"{state} does not share a land border with any other state."
+        elif re.search(r"\bhow many\b", text):
+            answer = f"{state} borders {len(neighbors)} {'state' if len(neighbors) == 1 else 'states'}: {listed}."
+        else:
+            answer = f"{state} borders {listed}."
+        return self._result("borders", sql, answer)
+
+    def _abbreviation_lookup(self, text):
+        match = re.fullmatch(r"(?:what|which) state is (\w\w)(?: the (?:postal )?(?:code|abbreviation) for)?", text)
+        if not match:
+            match = re.fullmatch(r"what state does (\w\w) (?:stand for|mean)", text)
+        if not match:
+            return None
+        abbreviation = match.group(1).upper()
+        if abbreviation not in self.abbreviations:
+            return None
+        sql = sa.select(self.table.c.name).where(self.table.c.postal_abbreviation == abbreviation)
+        name = self._run(sql)[0][0]
+        return self._result("abbreviation", sql, f"{abbreviation} is the postal abbreviation for {name}.")
+
+    def _ranking(self, text):
+        if not re.search(r"\bstates?\b", text):
+            return None
+        descending = re.search(rf"\b({DESCENDING})\b", text)
+        ascending = re.search(rf"\b({ASCENDING})\b", text)
+        if bool(descending) == bool(ascending):
+            return None
+        # "largest land area to water area" ranks by a ratio the table does not hold
+        if len(self._mentioned(text, RANK_METRICS)) > 1:
+            return None
+        column = self._ranked_column(text, descending or ascending)
+        # "the capital of the most populous state" asks for something other than what is ranked
+        attribute = self._match_attribute(text)
+        if column is None or (attribute is not None and attribute != column):
+            return None
+
+        source = self._column(column)
+        if source is None:
+            return None
+
+        limit = self._requested_count(text)
+        # "the largest states by population" asks for several without saying how many
+        subject = re.sub(r"\bof (?:all )?(?:the )?(?:\d+ |fifty )?states\b", " ", text)
+        if limit == 1 and re.search(r"\bstates\b", subject):
+            return None
+        order = source.desc() if descending else source.asc()
+        sql = (
+            sa.select(source.table.c.name, source)
+            .where(source.is_not(None))
+            .order_by(order)
+            .limit(limit)
+        )
+        rows = self._run(sql)
+        label = COLUMN_LABELS[column]
+        direction = "largest" if descending else "smallest"
+        if limit == 1:
+            name, value = rows[0]
+            answer = f"{name} has the {direction} {label}, at {format_value(column, value)}."
+        else:
+            lines = [
+                f"{rank}. {name} ({format_value(column, value)})"
+                for rank, (name, value) in enumerate(rows, start=1)
+            ]
+            answer = f"The {limit} states with the {direction} {label} are:\n" + "\n".join(lines)
+        return self._result("ranking", sql, answer)
+
+    # ----- helpers -----
+
+    def _find_states(self, text):
+        found = []
+        for match in self._state_regex.finditer(text):
+            name = self.state_names[match.group(1)]
+            if name not in found:
+                found.append(name)
+        return found
+
+    def _fully_understood(self, text):
+        remainder = re.sub(CITY_PHRASES, " ", self._state_regex.sub(" ", text)).split()
+        return all(
+            word in KNOWN_WORDS or word in NUMBER_WORDS or word.isdigit() for word in remainder
+        )
+
+    def _column(self, name):
+        """Return the column for ``name``, from the states table or the derived metrics"""
+        if name in self.table.c:
+            return self.table.c[name]
+        if self.metrics is not None and name in self.metrics.c:
+            return self.metrics.c[name]
+        return None
+
+    @staticmethod
+    def _match_attribute(text):
+        for column, pattern in ATTRIBUTE_PATTERNS:
+            if re.search(rf"\b(?:{pattern})\b", text):
+                return column
+        return None
+
+    @staticmethod
+    def _mentioned(text, patterns):
+        """Return every column whose phrase appears, each phrase consumed by the most specific match"""
+        columns = []
+        for column, pattern in patterns:
+            text, found = re.subn(rf"\b(?:{pattern})\b", " ", text)
+            if found and column not in columns:
+                columns.append(column)
+        return columns
+
+    @staticmethod
+    def _ranked_column(text, superlative):
+        """Return the column a superlative ranks by: the metric right after it, or "by <metric>" """
+        count = rf"(?:\d+|{'|'.join(NUMBER_WORDS)})"
+        after = re.sub(rf"^(?:{count} )?(?:(?:{DESCENDING}|{ASCENDING}) )?", "", text[superlative.end():].strip())
+        for column, pattern in RANK_METRICS:
+            if re.match(rf"(?:{pattern})\b", after) or re.search(rf"\b(?:by|in) (?:{pattern})\b", text):
+                return column
+        # "the largest state" ranks by size; "the most state" means nothing
+        if superlative.group(1) in SIZE_WORDS and not any(
+            re.search(rf"\b(?:{pattern})\b", text) for _, pattern in RANK_METRICS
+        ):
+            return "total_area_square_miles"
+        return None
+
+    @staticmethod
+    def _requested_count(text):
+        # "top 5", "5 largest", "largest 5" and "5 states", but not "of the 50 states"
+        number = rf"(\d+|{'|'.join(NUMBER_WORDS)})"
+        match = (
+            re.search(rf"\b(?:top|bottom) {number}\b", text)
+            or re.search(rf"\b{number} (?:{DESCENDING}|{ASCENDING})\b", text)
+            or re.search(rf"\b(?:{DESCENDING}|{ASCENDING}) {number}\b", text)
+            or re.search(rf"(?<!\bof the )(?<!\ball )(?<!\ball the )\b{number} states\b", text)
+        )
+        if not match:
+            return 1
+        token = match.group(1)
+        count = int(token) if token.isdigit() else NUMBER_WORDS[token]
+        return max(1, min(count, 50))
+
+    def _run(self, sql):
+        with self.engine.connect() as conn:
+            return conn.execute(sql).all()
+
+    def _result(self, intent, sql, response):
+        return {
+            "response": response,
+            "intent": intent,
+            "sql": str(sql.compile(self.engine, compile_kwargs={"literal_binds": True})),
+        }
@@ -0,0 +1,138 @@
+import math
+import re
+
+import numpy as np
+from llama_index.core.retrievers import BaseRetriever
+
+from answer_cache import STOPWORDS
+
+RETRIEVAL_MODES = ("hybrid", "vector", "bm25")
+
+
+def tokenize(text):
+    """Lowercase word tokens without stopwords, as indexed and queried by BM25"""
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over a list of texts, held as an inverted index of NumPy postings.
+
+    Each posting stores the term's length-normalized weight for one row, so a
+    query only touches the rows that contain its terms. ``candidates`` limits
+    scoring to a subset of rows, e.g. the chunks of the states a question names.
+    """
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        postings = {}
+        lengths = []
+        for row, text in enumerate(texts):
+            counts = {}
+            for token in tokenize(text):
+                counts[token] = counts.get(token, 0) + 1
+            lengths.append(sum(counts.values()))
+            for token, count in counts.items():
+                postings.setdefault(token, []).append((row, count))
+
+        self.size = len(lengths)
+        lengths = np.asarray(lengths, dtype=np.float32)
+        average = float(lengths.mean()) if self.size else 0.0
+        norms = k1 * (1 - b + b * lengths / average) if average else np.full(self.size, k1, dtype=np.float32)
+        self.postings = {}
+        for token, entries in postings.items():
+            rows = np.fromiter((row for row, _ in entries), dtype=np.int64, count=len(entries))
+            counts = np.fromiter((count for _, count in entries), dtype=np.float32, count=len(entries))
+            idf = math.log(1 + (self.size - len(entries) + 0.5) / (len(entries) + 0.5))
+            self.postings[token] = (rows, idf * counts * (k1 + 1) / (counts + norms[rows]))
+
+    def search(self, query, top_k=5, candidates=None):
+        """Return ``[(row, score), ...]`` for the best-matching rows, best first"""
+        mask = None
+        if candidates is not None:
+            mask = np.zeros(self.size, dtype=bool)
+            mask[candidates] = True
+        scores = np.zeros(self.size, dtype=np.float32)
+        for token in set(tokenize(query)):
+            if token not in self.postings:
+                continue
+            rows, weights = self.postings[token]
+            if mask is not None:
+                keep = mask[rows]
+                rows, weights = rows[keep], weights[keep]
+            scores[rows] += weights
+        matched = np.flatnonzero(scores)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(int(row), float(scores[row])) for row in matched]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Merge ranked ``[(row, score), ...]`` lists by summing ``1 / (k + rank)`` per row"""
+    fused = {}
+    for ranking in rankings:
+        for rank, (row, _) in enumerate(ranking, start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: (-item[1], item[0]))
+
+
+class HybridRetriever(BaseRetriever):
+    """Retriever over a ``LocalVectorIndex`` combining BM25 and vector search.
+
+    States named in the question narrow the candidates to their chunks before
+    either search scores anything. Each search returns ``candidate_k`` rows and
+    the two rankings are merged with reciprocal rank fusion, so exact terms such
+    as landmark names are found even when the embedding blurs them. ``mode``
+    "vector" or "bm25" runs one search alone, for comparison.
+    """
+
+    def __init__(self, index, similarity_top_k=5, mode="hybrid", candidate_k=None,
+                 rrf_k=60, prefilter=True, state=None):
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}, expected one of {RETRIEVAL_MODES}")
+        super().__init__()
+        self.index = index
+        self.similarity_top_k = similarity_top_k
+        self.mode = mode
+        # Long candidate lists let rows ranked middling by both searches outscore either one's best
+        self.candidate_k = candidate_k or max(10, 2 * similarity_top_k)
+        self.rrf_k = rrf_k
+        self.prefilter = prefilter
+        self.state = state
+        names = sorted(index.rows_by_state, key=len, reverse=True)
+        self._state_regex = (
+            re.compile(r"\b(" + "|".join(re.escape(n) for n in names) + r")\b", re.IGNORECASE)
+            if names else None
+        )
+        self._state_names = {name.lower(): name for name in names}
+
+    def detect_states(self, query):
+        """Return the indexed states a question names, in order of mention"""
+        found = []
+        if self._state_regex is not None:
+            for match in self._state_regex.finditer(query):
+                name = self._state_names[match.group(1).lower()]
+                if name not in found:
+                    found.append(name)
+        return found
+
+    def search(self, query, embedding=None):
+        """Return ``[(row, score), ...]`` for a question, best first"""
+        states = [self.state] if self.state else (self.detect_states(query) if self.prefilter else [])
+        candidates = self.index.candidate_rows(states) if states else None
+
+        rankings = []
+        if self.mode in ("hybrid", "bm25"):
+            # Every candidate names its state, so the names would only add noise to the scores
+            terms = self._state_regex.sub(" ", query) if states and self._state_regex is not None else query
+            rankings.append(self.index.bm25.search(terms, self.candidate_k, candidates))
+        if self.mode in ("hybrid", "vector"):
+            if embedding is None:
+                embedding = self.index.embed_model.get_query_embedding(query)
+            rankings.append(self.index.search([embedding], self.candidate_k, state=states or None)[0])
+        if len(rankings) == 1:
+            return rankings[0][:self.similarity_top_k]
+        return reciprocal_rank_fusion(rankings, self.rrf_k)[:self.similarity_top_k]
+
+    def _retrieve(self, query_bundle):
+        hits = self.search(query_bundle.query_str, query_bundle.embedding)
+        return [self.index.node(row, score) for row, score in hits]
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import httpx
+
+from rate_limit import TokenBucket
+
+WIKIPEDIA_PDF_URL = "https://en.wikipedia.org/api/rest_v1/page/pdf/"
+USER_AGENT = "Wikipedia PDF Downloader for Research (contact@example.com)"
+
+
+def extract_to_file(extract_fn, pdf_path, chunks_path):
+    """Stream ``(text, page)`` chunks from ``extract_fn`` into a JSONL file; runs in a worker"""
+    count = 0
+    tmp_path = chunks_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        for text, page in extract_fn(pdf_path):
+            f.write(json.dumps({"text": text, "page": page}) + "\n")
+            count += 1
+    os.replace(tmp_path, chunks_path)
+    return count
+
+
+def iter_chunks(chunks_path):
+    """Yield the chunk dicts written by ``extract_to_file`` one at a time"""
+    with open(chunks_path) as f:
+        for line in f:
+            yield json.loads(line)
+
+
+class IngestionPipeline:
+    """Download pages concurrently, skip unchanged ones and extract text in worker processes.
+
+    A JSON manifest remembers each page's ETag and Last-Modified so later
+    runs send conditional requests and only refetch pages that changed.
+    ``extract_fn`` yields ``(text, page)`` chunks; workers stream them to a
+    JSONL file next to each PDF, which is reused while the PDF is unchanged.
+    A page that fails to download or extract is reported with its error and
+    does not stop the others; the manifest is saved either way.
+    """
+
+    def __init__(self, extract_fn, pdf_dir="state_pdfs", manifest_path=None,
+                 base_url=WIKIPEDIA_PDF_URL, concurrency=4, rate=2.0, burst=None,
+                 processes=None, timeout=60.0):
+        self.extract_fn = extract_fn
+        self.pdf_dir = Path(pdf_dir)
+        self.manifest_path = Path(manifest_path) if manifest_path else self.pdf_dir / "manifest.json"
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, burst)
+        self.processes = processes
+        self.timeout = timeout
+        self.manifest = {}
+        if self.manifest_path.exists():
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+    def run(self, pages):
+        """Ingest ``{name: page title}`` and return ``(records, stats)``"""
+        self.pdf_dir.mkdir(parents=True, exist_ok=True)
+        start = time.perf_counter()
+        try:
+            if self.processes == 0:
+                records = asyncio.run(self._ingest_all(pages, None))
+            else:
+                with ProcessPoolExecutor(max_workers=self.processes) as pool:
+                    records = asyncio.run(self._ingest_all(pages, pool))
+        finally:
+            # Pages finished before a failure are not fetched and extracted again next run
+            self._save_manifest()
+        elapsed = time.perf_counter() - start
+
+        downloaded = [r for r in records if r["status"] == "downloaded"]
+        fetched_bytes = sum(r["bytes"] for r in downloaded)
+        stats = {
+            "pages": len(records),
+            "downloaded": len(downloaded),
+            "unchanged": sum(r["status"] == "unchanged" for r in records),
+            "failed": sum(r["status"] == "failed" for r in records),
+            "errors": {r["name"]: r["error"] for r in records if r["status"] == "failed"},
+            "bytes": fetched_bytes,
+            "seconds": elapsed,
+            "pages_per_sec": len(records) / elapsed if elapsed else 0.0,
+            "bytes_per_sec": fetched_bytes / elapsed if elapsed else 0.0,
+        }
+        return records, stats
+
+    async def _ingest_all(self, pages, pool):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        async with httpx.AsyncClient(timeout=self.timeout, follow_redirects=True) as client:
+            tasks = [
+                self._ingest(client, semaphore, pool, name, title)
+                for name, title in pages.items()
+            ]
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        records = []
+        # One page failing to extract or write must not discard the others
+        for (name, title), result in zip(pages.items(), results):
+            if isinstance(result, Exception):
+                print(f"Error ingesting {title}: {result}")
+                result = dict(self._record(name, title), error=f"{type(result).__name__}: {result}")
+            records.append(result)
+        return records
+
+    def _record(self, name, title):
+        pdf_path = self.pdf_dir / f"{name.replace(' ', '_')}_state.pdf"
+        return {
+            "name": name,
+            "title": title,
+            "path": str(pdf_path),
+            "chunks_path": str(pdf_path.with_suffix(".chunks.jsonl")),
+            "status": "failed",
+            "error": None,
+            "bytes": 0,
+            "chunks": 0,
+        }
+
+    async def _ingest(self, client, semaphore, pool, name, title):
+        record = self._record(name, title)
+        pdf_path = Path(record["path"])
+        chunks_path = Path(record["chunks_path"])
+        entry = self.manifest.get(name, {})
+
+        headers = {"User-Agent": USER_AGENT}
+        if pdf_path.exists() and entry.get("title") == title:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        await self.bucket.acquire_async()
+        async with semaphore:
+            try:
+                response = await client.get(self.base_url + title.replace(" ", "_"), headers=headers)
+            except httpx.HTTPError as e:
+                print(f"Error downloading {title}: {e}")
+                record["error"] = str(e) or type(e).__name__
+                return record
+
+        loop = asyncio.get_running_loop()
+        if response.status_code == 304:
+            record["status"] = "unchanged"
+        elif response.status_code == 200:
+            await loop.run_in_executor(None, pdf_path.write_bytes, response.content)
+            # Chunks of the previous PDF must not outlive it if extracting the new one fails
+            chunks_path.unlink(missing_ok=True)
+            record["status"] = "downloaded"
+            record["bytes"] = len(response.content)
+        else:
+            print(f"Error downloading {title}: {response.status_code}")
+            record["error"] = f"HTTP {response.status_code}"
+            return record
+
+        # Re-extract only when the PDF changed or its chunks were never written
+        if record["status"] == "unchanged" and chunks_path.exists():
+            record["chunks"] = entry.get("chunks", 0)
+            return record
+        record["chunks"] = await loop.run_in_executor(
+            pool, extract_to_file, self.extract_fn, str(pdf_path), str(chunks_path)
+        )
+        # The new ETag is only remembered once its chunks are written, so a failed
+        # extraction is retried with a full download next run
+        if record["status"] == "downloaded":
+            self.manifest[name] = {
+                "title": title,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "bytes": len(response.content),
+                "fetched_at": time.time(),
+            }
+        self.manifest[name]["chunks"] = record["chunks"]
+        return record
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
@@ -0,0 +1,46 @@
+import threading
+
+from llama_index.core.base.base_query_engine import BaseQueryEngine
+
+
+class LazyQueryEngine(BaseQueryEngine):
+    """Query engine that builds the real engine on its first query.
+
+    Lets the agent be created with both tools while a question that only
+    needs one of them never pays for constructing the other. ``factory`` is
+    called at most once, even when the first queries arrive concurrently.
+    """
+
+    def __init__(self, factory):
+        super().__init__(callback_manager=None)
+        self._factory = factory
+        self._engine = None
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    self._engine = self._factory()
+        return self._engine
+
+    @property
+    def is_built(self):
+        return self._engine is not None
+
+    # Delegate whole calls so the wrapped engine's own spans and callbacks are the only ones recorded
+    def query(self, str_or_query_bundle):
+        return self.engine.query(str_or_query_bundle)
+
+    async def aquery(self, str_or_query_bundle):
+        return await self.engine.aquery(str_or_query_bundle)
+
+    def _query(self, query_bundle):
+        return self.engine.query(query_bundle)
+
+    async def _aquery(self, query_bundle):
+        return await self.engine.aquery(query_bundle)
+
+    def _get_prompt_modules(self):
+        return {}
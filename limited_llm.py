@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+from llama_index.core.llms import LLM
+from pydantic import PrivateAttr
+
+from trace_handlers import token_usage
+
+_END = object()
+
+
+def _estimate_tokens(text):
+    """Rough prompt size for the token budget, about four characters per token"""
+    return max(1, len(text) // 4)
+
+
+def _messages_text(messages):
+    return "".join(str(message.content or "") for message in messages)
+
+
+def _response_text(response):
+    message = getattr(response, "message", None)
+    return str(message.content or "") if message is not None else response.text or ""
+
+
+async def _iterate_in_thread(iterator):
+    """Consume a blocking iterator from asyncio without stalling the event loop"""
+    while (item := await asyncio.to_thread(next, iterator, _END)) is not _END:
+        yield item
+
+
+class LimitedLLM(LLM):
+    """LLM that sends every call of the wrapped model through an ``LLMLimiter``.
+
+    The agent, the SQL engine and response synthesis share one limiter, so
+    the concurrency cap, the request and token budgets, the retries and the
+    circuit breaker apply to the whole process. Async calls run the sync
+    path on a worker thread so they are limited the same way.
+
+    ``on_usage(seconds, prompt_tokens, completion_tokens)`` is called after
+    each completed call, with token counts estimated when the provider does
+    not report them.
+    """
+
+    _llm: LLM = PrivateAttr()
+    _limiter = PrivateAttr()
+    _on_usage = PrivateAttr()
+
+    def __init__(self, llm, limiter, on_usage=None):
+        super().__init__(callback_manager=llm.callback_manager)
+        self._llm = llm
+        self._limiter = limiter
+        self._on_usage = on_usage
+
+    @classmethod
+    def class_name(cls):
+        return "LimitedLLM"
+
+    @property
+    def llm(self):
+        return self._llm
+
+    @property
+    def limiter(self):
+        return self._limiter
+
+    @property
+    def metadata(self):
+        return self._llm.metadata
+
+    def chat(self, messages, **kwargs):
+        return self._call(lambda: self._llm.chat(messages, **kwargs), _messages_text(messages))
+
+    def complete(self, prompt, formatted=False, **kwargs):
+        return self._call(lambda: self._llm.complete(prompt, formatted=formatted, **kwargs), prompt)
+
+    def stream_chat(self, messages, **kwargs):
+        return self._stream(lambda: self._llm.stream_chat(messages, **kwargs), _messages_text(messages))
+
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        return self._stream(lambda: self._llm.stream_complete(prompt, formatted=formatted, **kwargs), prompt)
+
+    async def achat(self, messages, **kwargs):
+        return await asyncio.to_thread(self.chat, messages, **kwargs)
+
+    async def acomplete(self, prompt, formatted=False, **kwargs):
+        return await asyncio.to_thread(self.complete, prompt, formatted, **kwargs)
+
+    async def astream_chat(self, messages, **kwargs):
+        return _iterate_in_thread(self.stream_chat(messages, **kwargs))
+
+    async def astream_complete(self, prompt, formatted=False, **kwargs):
+        return _iterate_in_thread(self.stream_complete(prompt, formatted, **kwargs))
+
+    def _call(self, fn, prompt_text):
+        start = time.perf_counter()
+        response = self._limiter.call(fn, _estimate_tokens(prompt_text))
+        self._report(start, response, prompt_text)
+        return response
+
+    def _stream(self, fn, prompt_text):
+        start = time.perf_counter()
+        response = None
+        for response in self._limiter.stream(fn, _estimate_tokens(prompt_text)):
+            yield response
+        if response is not None:
+            self._report(start, response, prompt_text)
+
+    def _report(self, start, response, prompt_text):
+        if self._on_usage is None:
+            return
+        prompt, completion = token_usage(response)
+        if prompt is None or completion is None:
+            prompt, completion = len(prompt_text) // 4, len(_response_text(response)) // 4
+        self._on_usage(time.perf_counter() - start, prompt, completion)
@@ -0,0 +1,231 @@
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from rate_limit import TokenBucket
+
+# Provider responses worth retrying: rate limits, overload and transient network failures
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_STATUSES = ("RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED", "INTERNAL")
+
+_END = object()
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the provider while the circuit breaker is open"""
+
+
+def is_retryable(error):
+    """Return True for errors that a later attempt could succeed after"""
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_CODES
+    message = str(error)
+    return "429" in message or any(status in message for status in RETRYABLE_STATUSES)
+
+
+class CircuitBreaker:
+    """Stop calling a provider after repeated failures and probe it again later.
+
+    ``failure_threshold`` consecutive retryable failures open the circuit.
+    After ``reset_timeout`` seconds one trial call is let through (half open);
+    its success closes the circuit and its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+        self._stats = {"opened": 0, "rejected": 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(time.monotonic())
+
+    @property
+    def is_open(self):
+        """True while every call is refused; half open lets a trial call through"""
+        return self.state == "open"
+
+    def _state(self, now):
+        if self._opened_at is None:
+            return "closed"
+        if now - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def before_call(self):
+        """Raise ``CircuitOpenError`` unless a call may go to the provider now"""
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == "closed":
+                return
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return
+            self._stats["rejected"] += 1
+        raise CircuitOpenError("The language model provider is unavailable; retrying shortly")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            trial_failed = self._trial_running
+            self._trial_running = False
+            if trial_failed or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._stats["opened"] += 1
+
+    def release_trial(self):
+        """Give up a trial call that ended without telling us anything about the provider"""
+        with self._lock:
+            self._trial_running = False
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "state": self._state(time.monotonic()), "failures": self._failures}
+
+
+class LLMLimiter:
+    """Shared admission control in front of every LLM call of the process.
+
+    Each call waits for one of ``max_concurrency`` slots, then for the
+    request and token budgets (``rpm`` and ``tpm`` per minute, either may be
+    None for no limit). Retryable failures are retried up to ``max_retries``
+    times with full-jitter exponential backoff and feed the circuit breaker;
+    the call whose failure opens it, and every call while it is open, raise
+    ``CircuitOpenError``.
+    """
+
+    def __init__(self, rpm=None, tpm=None, max_concurrency=8, max_retries=3,
+                 base_backoff=0.5, max_backoff=8.0, breaker=None, window=1000):
+        self.requests = TokenBucket(rpm / 60, capacity=rpm) if rpm else None
+        self.tokens = TokenBucket(tpm / 60, capacity=tpm) if tpm else None
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queue_waits = deque(maxlen=window)
+        self._stats = {
+            "calls": 0, "succeeded": 0, "failed": 0, "retries": 0,
+            "rejected": 0, "queue_wait_seconds": 0.0, "throttle_seconds": 0.0,
+        }
+
+    def call(self, fn, tokens=1):
+        """Run ``fn()`` within the limits and return its result"""
+        with self._admitted(tokens):
+            return self._with_retries(fn)
+
+    def stream(self, fn, tokens=1):
+        """Yield from the iterator ``fn()`` returns, holding a slot until it is exhausted.
+
+        Only opening the stream and waiting for its first item are retried;
+        a failure halfway through a streamed answer is raised to the caller.
+        """
+        with self._admitted(tokens):
+            def first_item():
+                iterator = iter(fn())
+                return iterator, next(iterator, _END)
+
+            iterator, item = self._with_retries(first_item)
+            while item is not _END:
+                yield item
+                item = next(iterator, _END)
+
+    def backoff(self, attempt):
+        """Seconds to sleep before retry number ``attempt`` (1-based)"""
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** (attempt - 1)))
+
+    @contextmanager
+    def _admitted(self, tokens):
+        with self._lock:
+            self._stats["calls"] += 1
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise
+        start = time.perf_counter()
+        with self._slots:
+            queued = time.perf_counter() - start
+            throttled = 0.0
+            if self.requests:
+                throttled += self.requests.acquire()
+            if self.tokens:
+                throttled += self.tokens.acquire(min(max(1, tokens), self.tokens.capacity))
+            with self._lock:
+                self._in_flight += 1
+                self._queue_waits.append(queued + throttled)
+                self._stats["queue_wait_seconds"] += queued
+                self._stats["throttle_seconds"] += throttled
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+
+    def _with_retries(self, fn):
+        attempt = 0
+        while True:
+            try:
+                result = fn()
+            except Exception as e:
+                retryable = is_retryable(e)
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.release_trial()
+                attempt += 1
+                if not retryable or attempt > self.max_retries or self.breaker.is_open:
+                    with self._lock:
+                        self._stats["failed"] += 1
+                    # Callers treat an open circuit as an outage, not as a reason to try another model
+                    if retryable and self.breaker.is_open:
+                        raise CircuitOpenError("The LLM circuit opened after repeated failures") from e
+                    raise
+                with self._lock:
+                    self._stats["retries"] += 1
+                time.sleep(self.backoff(attempt))
+                continue
+            self.breaker.record_success()
+            with self._lock:
+                self._stats["succeeded"] += 1
+            return result
+
+    def stats(self):
+        """Return call, retry and rejection counters, queue wait percentiles and breaker state"""
+        with self._lock:
+            stats = dict(self._stats)
+            waits = sorted(self._queue_waits)
+            stats["in_flight"] = self._in_flight
+        stats["max_concurrency"] = self.max_concurrency
+
+        def percentile(p):
+            return waits[min(len(waits) - 1, int(p / 100 * len(waits)))] * 1000 if waits else 0.0
+
+        stats["queue_wait_p50_ms"] = percentile(50)
+        stats["queue_wait_p95_ms"] = percentile(95)
+        stats["queue_wait_max_ms"] = waits[-1] * 1000 if waits else 0.0
+        stats["breaker"] = self.breaker.stats()
+        return stats
+
@@ -0,0 +1,247 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from embedding_cache import EmbeddingCache
+
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_FILE = "chunks.jsonl"
+INFO_FILE = "index.json"
+# Kept in the index directory across rebuilds so unchanged chunks are not embedded again
+EMBEDDING_CACHE_FILE = "embedding_cache.sqlite"
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _node_batches(splitter, documents, batch_size):
+    """Split documents one at a time and yield nodes in batches of batch_size"""
+    batch = []
+    for document in documents:
+        batch.extend(splitter.get_nodes_from_documents([document]))
+        while len(batch) >= batch_size:
+            yield batch[:batch_size]
+            batch = batch[batch_size:]
+    if batch:
+        yield batch
+
+
+def build_local_index(documents, embed_model, index_dir="local_index",
+                      chunk_size=512, chunk_overlap=50, batch_size=64,
+                      cache_file=EMBEDDING_CACHE_FILE):
+    """Chunk a stream of documents, embed them in batches and write a memory-mapped index.
+
+    With ``cache_file`` (relative to ``index_dir``; None disables it) chunk
+    embeddings are stored by content hash, so a rebuild only embeds chunks
+    that are new or changed and drops the vectors of chunks that are gone.
+    """
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    raw_path = index_dir / (EMBEDDINGS_FILE + ".part")
+    model_name = getattr(embed_model, "model_name", None)
+    cache = EmbeddingCache(index_dir / cache_file, model_name) if cache_file else None
+
+    # Append chunk metadata and raw vectors as batches arrive, so memory stays flat
+    count, dim = 0, None
+    try:
+        with open(index_dir / CHUNKS_FILE, "w") as chunks_file, open(raw_path, "wb") as raw_file:
+            for nodes in _node_batches(splitter, documents, batch_size):
+                for node in nodes:
+                    chunks_file.write(json.dumps({"text": node.get_content(), "metadata": node.metadata}) + "\n")
+                texts = [node.get_content() for node in nodes]
+                if cache is not None:
+                    vectors = cache.embed(texts, embed_model.get_text_embedding_batch)
+                else:
+                    vectors = np.asarray(embed_model.get_text_embedding_batch(texts), dtype=np.float32)
+                raw_file.write(_normalize_rows(vectors).tobytes())
+                count += len(nodes)
+                dim = vectors.shape[1]
+        if not count:
+            os.remove(raw_path)
+            raise ValueError("No text to index")
+        # Only a complete run knows every live chunk, so only then are orphaned vectors removed
+        cache_stats = None
+        if cache is not None:
+            cache.collect_garbage()
+            cache_stats = cache.stats()
+    finally:
+        if cache is not None:
+            cache.close()
+
+    # Copy the raw vectors into a .npy file that can be memory-mapped with its shape
+    raw = np.memmap(raw_path, dtype=np.float32, mode="r", shape=(count, dim))
+    embeddings = np.lib.format.open_memmap(
+        index_dir / EMBEDDINGS_FILE, mode="w+", dtype=np.float32, shape=(count, dim)
+    )
+    for start in range(0, count, 8192):
+        embeddings[start:start + 8192] = raw[start:start + 8192]
+    embeddings.flush()
+    del embeddings, raw
+    os.remove(raw_path)
+
+    with open(index_dir / INFO_FILE, "w") as f:
+        json.dump({"model": model_name, "dim": dim, "chunks": count, "embedding_cache": cache_stats}, f)
+    print(f"Indexed {count} chunks into {index_dir}")
+    if cache_stats is not None:
+        print(
+            f"Reused {cache_stats['reused']} of {cache_stats['chunks']} embeddings "
+            f"({cache_stats['reuse_ratio']:.0%}), embedded {cache_stats['embedded']} chunks in "
+            f"{cache_stats['embedding_calls']} calls ({cache_stats['embedding_calls_saved']} calls saved), "
+            f"removed {cache_stats['deleted']} orphaned vectors"
+        )
+    return LocalVectorIndex(index_dir, embed_model)
+
+
+class LocalVectorIndex:
+    """Read-only vector index over a memory-mapped NumPy embedding matrix.
+
+    Rows are unit-normalized so a dot product is the cosine similarity. The
+    matrix is scanned in blocks so memory use does not grow with its size.
+    """
+
+    def __init__(self, index_dir, embed_model, block_rows=8192):
+        self.index_dir = Path(index_dir)
+        self.embed_model = embed_model
+        self.block_rows = block_rows
+        with open(self.index_dir / INFO_FILE) as f:
+            self.info = json.load(f)
+        model_name = getattr(embed_model, "model_name", None)
+        if self.info.get("model") and model_name and self.info["model"] != model_name:
+            raise ValueError(
+                f"Index was built with {self.info['model']} but the embed model is {model_name}"
+            )
+        self.embeddings = np.load(self.index_dir / EMBEDDINGS_FILE, mmap_mode="r")
+        self.chunks = []
+        with open(self.index_dir / CHUNKS_FILE) as f:
+            for line in f:
+                self.chunks.append(json.loads(line))
+
+        # Row ids per state for metadata pre-filtering
+        rows_by_state = {}
+        for row, chunk in enumerate(self.chunks):
+            state = chunk["metadata"].get("state")
+            if state:
+                rows_by_state.setdefault(state, []).append(row)
+        self.rows_by_state = {s: np.asarray(r, dtype=np.int64) for s, r in rows_by_state.items()}
+        self._bm25 = None
+
+    @property
+    def bm25(self):
+        """BM25 index over the chunk texts and titles, built on first use"""
+        if self._bm25 is None:
+            from hybrid_retrieval import BM25Index
+
+            self._bm25 = BM25Index(
+                f"{chunk['metadata'].get('title', '')} {chunk['text']}" for chunk in self.chunks
+            )
+        return self._bm25
+
+    def candidate_rows(self, states):
+        """Return the sorted rows of the chunks of ``states``; unknown states have none"""
+        rows = [self.rows_by_state[state] for state in states if state in self.rows_by_state]
+        return np.sort(np.concatenate(rows)) if rows else np.empty(0, dtype=np.int64)
+
+    def search(self, query_embeddings, top_k=5, state=None):
+        """Return ``[(row, score), ...]`` for each query embedding, best first.
+
+        ``state`` restricts the search to the chunks of one state or a list of states.
+        """
+        queries = _normalize_rows(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        if state is not None:
+            candidates = self.candidate_rows([state] if isinstance(state, str) else state)
+            if not len(candidates):
+                return [[] for _ in queries]
+        else:
+            candidates = None
+        total = len(candidates) if candidates is not None else len(self.embeddings)
+
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, total, self.block_rows):
+            if candidates is not None:
+                rows = candidates[start:start + self.block_rows]
+                block = self.embeddings[rows]
+            else:
+                rows = np.arange(start, min(start + self.block_rows, total))
+                block = self.embeddings[start:start + self.block_rows]
+            scores = queries @ block.T
+            best_rows = np.concatenate([best_rows, np.broadcast_to(rows, scores.shape)], axis=1)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            if best_scores.shape[1] > top_k:
+                keep = np.argpartition(-best_scores, top_k - 1, axis=1)[:, :top_k]
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+
+        results = []
+        for rows, scores in zip(best_rows, best_scores):
+            order = np.argsort(-scores)
+            results.append([(int(rows[i]), float(scores[i])) for i in order])
+        return results
+
+    def node(self, row, score):
+        """Return chunk ``row`` as a scored llama_index node"""
+        return NodeWithScore(
+            node=TextNode(id_=f"chunk-{row}", text=self.chunks[row]["text"], metadata=self.chunks[row]["metadata"]),
+            score=score
+        )
+
+    def as_retriever(self, similarity_top_k=5, state=None, mode="vector"):
+        """Return a llama_index retriever over this index.
+
+        ``mode`` "vector" searches embeddings only; "hybrid" and "bm25" use a
+        ``HybridRetriever``, which also narrows to the states a question names.
+        """
+        if mode == "vector":
+            return LocalVectorRetriever(self, similarity_top_k=similarity_top_k, state=state)
+        from hybrid_retrieval import HybridRetriever
+
+        return HybridRetriever(self, similarity_top_k=similarity_top_k, mode=mode, state=state)
+
+    def as_query_engine(self, llm=None, similarity_top_k=5, state=None, mode="vector", **kwargs):
+        """Return a query engine, a drop-in for LlamaCloudIndex.as_query_engine()"""
+        return RetrieverQueryEngine.from_args(
+            self.as_retriever(similarity_top_k=similarity_top_k, state=state, mode=mode), llm=llm, **kwargs
+        )
+
+
+class LocalVectorRetriever(BaseRetriever):
+    """Retriever adapter for LocalVectorIndex"""
+
+    def __init__(self, index, similarity_top_k=5, state=None):
+        super().__init__()
+        self.index = index
+        self.similarity_top_k = similarity_top_k
+        self.state = state
+
+    def _retrieve(self, query_bundle):
+        embedding = query_bundle.embedding
+        if embedding is None:
+            embedding = self.index.embed_model.get_query_embedding(query_bundle.query_str)
+        hits = self.index.search([embedding], top_k=self.similarity_top_k, state=self.state)[0]
+        return [self.index.node(row, score) for row, score in hits]
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
+    from wikipedia_scrapper import load_state_documents, states
+
+    load_dotenv()
+    build_local_index(
+        load_state_documents(states),
+        GoogleGenAIEmbedding(
+            model_name=os.getenv("EMBEDDING_MODEL", "text-embedding-004"),
+            api_key=os.getenv("GOOGLE_API_KEY")
+        ),
+        index_dir=os.getenv("LOCAL_INDEX_DIR", "local_index")
+    )
@@ -0,0 +1,109 @@
+import threading
+
+# Pipeline stages that call the LLM, and the model tiers they can be assigned to
+STAGES = ("planning", "sql", "documents", "synthesis")
+TIERS = ("fast", "large")
+DEFAULT_STAGE_MODELS = "planning=fast,sql=fast,documents=fast,synthesis=large"
+DEFAULT_MODELS = {"fast": "models/gemini-2.0-flash", "large": "models/gemini-2.5-pro-exp-03-25"}
+
+# Estimated USD per million prompt and completion tokens, only used to report savings
+MODEL_PRICES = {"fast": (0.10, 0.40), "large": (1.25, 10.00)}
+
+
+def parse_stage_models(text):
+    """Parse ``"stage=tier,..."`` into a stage to tier dict; unnamed stages use the large model"""
+    assignment = dict.fromkeys(STAGES, "large")
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        stage, _, tier = (part.strip() for part in item.partition("="))
+        if stage not in STAGES or tier not in TIERS:
+            raise ValueError(
+                f"Invalid stage model {item!r}: expected stage=tier with stage in {STAGES} and tier in {TIERS}"
+            )
+        assignment[stage] = tier
+    return assignment
+
+
+def sql_failure(response):
+    """Return why a text-to-SQL response cannot be trusted, or None when it can"""
+    metadata = response.metadata or {}
+    if "result" not in metadata:
+        return "sql_error"  # the statement did not parse, was refused or failed to run
+    if not metadata["result"]:
+        return "empty_result"
+    return None
+
+
+class ModelCascade:
+    """Which model each stage uses, and what that costs compared with the large model.
+
+    Every LLM call is recorded against its stage and tier, so the stats show
+    per-stage latency, how often a cheap step had to be escalated, and the
+    estimated cost next to what the same tokens would have cost on the large
+    model.
+    """
+
+    def __init__(self, stage_models, models=None, prices=None):
+        self.stage_models = stage_models
+        self.models = {**DEFAULT_MODELS, **(models or {})}
+        self.prices = prices or MODEL_PRICES
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def tier(self, stage):
+        return self.stage_models[stage]
+
+    def _stage(self, stage):
+        if stage not in self._stages:
+            self._stages[stage] = {
+                "calls": dict.fromkeys(TIERS, 0), "seconds": dict.fromkeys(TIERS, 0.0),
+                "escalations": {}, "cost": 0.0, "large_cost": 0.0,
+            }
+        return self._stages[stage]
+
+    def _cost(self, tier, prompt_tokens, completion_tokens):
+        prompt_price, completion_price = self.prices[tier]
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+    def record(self, stage, tier, seconds, prompt_tokens, completion_tokens):
+        """Record one LLM call made for ``stage`` on the ``tier`` model"""
+        with self._lock:
+            stats = self._stage(stage)
+            stats["calls"][tier] += 1
+            stats["seconds"][tier] += seconds
+            stats["cost"] += self._cost(tier, prompt_tokens, completion_tokens)
+            stats["large_cost"] += self._cost("large", prompt_tokens, completion_tokens)
+
+    def record_escalation(self, stage, reason):
+        """Record that a fast-model step failed validation and was redone on the large model"""
+        with self._lock:
+            escalations = self._stage(stage)["escalations"]
+            escalations[reason] = escalations.get(reason, 0) + 1
+
+    def stats(self):
+        """Return per-stage calls, mean latency per tier, escalations and estimated savings"""
+        with self._lock:
+            stages = {}
+            for stage, stats in self._stages.items():
+                stages[stage] = {
+                    "tier": self.stage_models.get(stage),
+                    "calls": dict(stats["calls"]),
+                    "mean_ms": sum(stats["seconds"].values()) / max(1, sum(stats["calls"].values())) * 1000,
+                    "mean_ms_by_tier": {
+                        tier: stats["seconds"][tier] / stats["calls"][tier] * 1000
+                        for tier in TIERS if stats["calls"][tier]
+                    },
+                    "escalations": sum(stats["escalations"].values()),
+                    "escalation_reasons": dict(stats["escalations"]),
+                    "cost_usd": stats["cost"],
+                    "large_model_cost_usd": stats["large_cost"],
+                }
+        cost = sum(s["cost_usd"] for s in stages.values())
+        large_cost = sum(s["large_model_cost_usd"] for s in stages.values())
+        return {
+            "models": dict(self.models),
+            "stages": stages,
+            "cost_usd": cost,
+            "large_model_cost_usd": large_cost,
+            "saved_usd": large_cost - cost,
+            "saved_ratio": (large_cost - cost) / large_cost if large_cost else 0.0,
+        }
@@ -0,0 +1,46 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """Token-bucket rate limiter usable from threads and from asyncio.
+
+    Tokens refill continuously at ``rate`` per second up to ``capacity``.
+    ``acquire`` blocks until enough tokens are available and returns how long
+    the caller waited.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens):
+        """Take tokens now, going into debt if needed; return seconds to wait"""
+        if tokens > self.capacity:
+            raise ValueError(f"Cannot acquire {tokens} tokens from a bucket of {self.capacity}")
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self, tokens=1):
+        """Block the calling thread until ``tokens`` are available"""
+        wait = self._reserve(tokens)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens=1):
+        """Wait without blocking the event loop until ``tokens`` are available"""
+        wait = self._reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
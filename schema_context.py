@@ -0,0 +1,224 @@
+"""Compact description of the states tables for text-to-SQL prompts, generated from the live data.
+
+    python schema_context.py --budget 200
+
+prints the context next to llama_index's default table description with
+their estimated token counts.
+"""
+import argparse
+import threading
+
+import sqlalchemy as sa
+
+from database import database_fingerprint
+from db_creator import DERIVED_TABLES, State
+
+# Tables the text-to-SQL engine may query, the states table first
+SQL_TABLES = [State.__table__, *DERIVED_TABLES]
+
+# Bookkeeping columns that never answer a question about a state
+HIDDEN_COLUMNS = {"id", "object_id", "created_at", "updated_at", "capitals_object_id"}
+
+# Columns whose values are too long to be worth sampling
+UNSAMPLED_COLUMNS = {"flag_url", "link"}
+
+
+def estimate_tokens(text):
+    """Rough token count, about four characters per token"""
+    return len(text) // 4
+
+
+def describe_columns(engine, table=State.__table__, samples=2):
+    """Return the type, value range and a few sample values of each visible column"""
+    columns = []
+    with engine.connect() as conn:
+        for column in table.columns:
+            if column.name in HIDDEN_COLUMNS:
+                continue
+            info = {"name": column.name, "numeric": isinstance(column.type, (sa.Integer, sa.Float)),
+                    "type": "real" if isinstance(column.type, sa.Float) else "int", "range": None, "samples": []}
+            if info["numeric"]:
+                low, high = conn.execute(sa.select(sa.func.min(column), sa.func.max(column))).one()
+                if low is not None:
+                    info["range"] = (low, high)
+            elif samples and column.name not in UNSAMPLED_COLUMNS:
+                info["samples"] = list(conn.execute(
+                    sa.select(column).where(column.is_not(None)).distinct().order_by(column).limit(samples)
+                ).scalars())
+            columns.append(info)
+    return columns
+
+
+def _number(value):
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+
+def render_schema(columns, table_name="states", samples=2, ranges=True, note=State.__table__.comment):
+    """Render column summaries as one dense line: ``name (type range, samples)`` per column"""
+    names = {column["name"] for column in columns}
+    parts = []
+    twins = False
+    for column in columns:
+        name = column["name"]
+        # Metric twins of imperial columns add nothing but tokens; one note covers them all
+        if name.endswith("_square_kilometers") and name.replace("_kilometers", "_miles") in names:
+            twins = True
+            continue
+        details = [column["type"] if column["numeric"] else "text"]
+        if ranges and column["range"] is not None:
+            details.append(f"{_number(column['range'][0])}-{_number(column['range'][1])}")
+        if samples and column["samples"]:
+            details.append("e.g. " + ", ".join(repr(value) for value in column["samples"][:samples]))
+        parts.append(f"{name} ({' '.join(details)})")
+    text = f"SQLite table {table_name}, {note}: " + "; ".join(parts) + "."
+    if twins:
+        text += " Each *_square_miles column has a *_square_kilometers twin."
+    return text
+
+
+# Detail levels tried in turn: samples per text column and whether numeric ranges are shown
+DETAIL_LEVELS = [(2, True), (1, True), (0, True), (0, False)]
+
+
+def _total_tokens(texts):
+    return estimate_tokens("\n\n".join(texts.values()))
+
+
+def build_schema_contexts(engine, token_budget=200, tables=SQL_TABLES):
+    """Return ``{table name: description}`` at the most detail that fits ``token_budget`` in total.
+
+    Every table drops to the next detail level together. Tables whose
+    ``info["samples"]`` is 0 (derived tables keyed by state names already
+    sampled in the states table) are never sampled. When even the barest
+    level is over budget, whole columns are dropped from the end, the last
+    table's last column first, and a table left without columns is omitted.
+    """
+    described = [(table, describe_columns(engine, table, table.info.get("samples", 2))) for table in tables]
+    for samples, ranges in DETAIL_LEVELS:
+        texts = {
+            table.name: render_schema(
+                columns, table.name, min(samples, table.info.get("samples", 2)), ranges, table.comment
+            )
+            for table, columns in described
+        }
+        if _total_tokens(texts) <= token_budget:
+            return texts
+    kept = [(table, list(columns)) for table, columns in described]
+    while True:
+        texts = {
+            table.name: render_schema(columns, table.name, 0, False, table.comment)
+            for table, columns in kept if columns
+        }
+        if _total_tokens(texts) <= token_budget:
+            return texts
+        for table, columns in reversed(kept):
+            if columns:
+                columns.pop()
+                break
+        else:
+            return {}
+
+
+def build_schema_context(engine, token_budget=200, table=State.__table__):
+    """Return the most detailed description of one table that fits in ``token_budget`` tokens"""
+    return build_schema_contexts(engine, token_budget, [table]).get(table.name, "")
+
+
+class SchemaContext:
+    """Schema descriptions of the SQL tables, rebuilt only when the database file changes.
+
+    ``text(table_name)`` is what the text-to-SQL prompt sees in place of the
+    full column dump, all tables together within ``token_budget``; ``topics()`` is the
+    short list for tool descriptions. Tables missing from an older database
+    are left out.
+    """
+
+    def __init__(self, engine, db_file, token_budget=200, tables=SQL_TABLES):
+        self.engine = engine
+        self.db_file = db_file
+        self.token_budget = token_budget
+        self.tables = tables
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._texts = None
+        self._builds = 0
+
+    def _descriptions(self):
+        # Taken before reading: the engine replaces connections opened on an older file, and a
+        # swap during the build leaves a stale fingerprint, so the next call rebuilds
+        fingerprint = database_fingerprint(self.db_file)
+        with self._lock:
+            if self._texts is None or fingerprint != self._fingerprint:
+                present = set(sa.inspect(self.engine).get_table_names())
+                self._texts = build_schema_contexts(
+                    self.engine, self.token_budget, [table for table in self.tables if table.name in present]
+                )
+                self._fingerprint = fingerprint
+                self._builds += 1
+            return self._texts
+
+    def text(self, table_name="states"):
+        return self._descriptions().get(table_name)
+
+    def table_info(self, table_name):
+        """Return the description for ``table_name``, or None for tables it does not cover"""
+        return self.text(table_name)
+
+    def table_names(self):
+        """Return the covered tables that exist in the database"""
+        return list(self._descriptions())
+
+    def column_names(self, table_name="states"):
+        table = next(table for table in self.tables if table.name == table_name)
+        return [column.name for column in table.columns if column.name not in HIDDEN_COLUMNS]
+
+    def topics(self):
+        """Return the states columns as short readable labels plus the derived tables' topics"""
+        names = self.column_names(self.tables[0].name)
+        labels = []
+        for name in names:
+            if name.endswith("_square_kilometers") and name.replace("_kilometers", "_miles") in names:
+                continue
+            labels.append(name.replace("_square_miles", "").replace("_", " "))
+        text = ", ".join(labels)
+        if any(name.endswith("_square_kilometers") for name in names):
+            text += " (areas in square miles and kilometers)"
+        extra = [table.info["topic"] for table in self.tables[1:]
+                 if table.name in self.table_names() and "topic" in table.info]
+        if extra:
+            text += "; also " + ", ".join(extra)
+        return text
+
+    def stats(self):
+        texts = self._descriptions()
+        with self._lock:
+            return {
+                "tokens": sum(estimate_tokens(text) for text in texts.values()),
+                "tables": {name: estimate_tokens(text) for name, text in texts.items()},
+                "token_budget": self.token_budget,
+                "builds": self._builds,
+            }
+
+
+def main(argv=None):
+    from llama_index.core import SQLDatabase
+
+    from database import create_read_engine
+
+    parser = argparse.ArgumentParser(description="Show the generated schema context for states.db")
+    parser.add_argument("--db", default="states.db")
+    parser.add_argument("--budget", type=int, default=200, help="maximum tokens of schema context, all tables together")
+    args = parser.parse_args(argv)
+
+    engine = create_read_engine(args.db)
+    context = SchemaContext(engine, args.db, args.budget)
+    tables = context.table_names()
+    default_db = SQLDatabase(engine, include_tables=tables)
+    default = "\n\n".join(default_db.get_single_table_info(table) for table in tables)
+    compact = "\n\n".join(context.text(table) for table in tables)
+    print(f"llama_index default ({estimate_tokens(default)} tokens):\n{default}\n")
+    print(f"Generated ({estimate_tokens(compact)} tokens):\n{compact}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import re
+import threading
+
+
+def question_key(text):
+    """Key a question by its exact wording: lowercase with whitespace and punctuation folded.
+
+    Unlike the answer cache's key no words are dropped, so only the same
+    question, not a similar one, shares an in-flight call.
+    """
+    return " ".join(re.findall(r"[\w']+", text.lower()))
+
+
+class SingleFlightTimeout(TimeoutError):
+    """Raised to a waiter whose in-flight call did not finish in time"""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Run at most one call per key at a time and share its outcome.
+
+    The first caller for a key runs ``fn``; callers that arrive while it is
+    still running wait for the same result, or get the same exception.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "executions": 0, "coalesced": 0, "timeouts": 0, "errors": 0}
+
+    def do(self, key, fn, timeout=None):
+        """Return ``(result, shared)`` where ``shared`` is True for waiters"""
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats["executions"] += 1
+            else:
+                call.waiters += 1
+                self._stats["coalesced"] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                self.settle(key, call, call.result, call.error)
+        elif not call.done.wait(timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise SingleFlightTimeout(f"Timed out after {timeout}s waiting for in-flight call")
+
+        if call.error is not None:
+            raise call.error
+        return call.result, not leader
+
+    def claim(self, key):
+        """Make the caller the leader for ``key`` without running a function for it.
+
+        Returns the call to pass to ``settle`` once the result is known, or
+        None when another caller is already computing ``key``. Meant for
+        leaders that produce their result incrementally, such as a stream.
+        """
+        with self._lock:
+            if key in self._calls:
+                return None
+            self._stats["calls"] += 1
+            self._stats["executions"] += 1
+            call = self._calls[key] = _Call()
+            return call
+
+    def settle(self, key, call, result=None, error=None):
+        """Hand a claimed call's result, or its exception, to every waiter"""
+        call.result, call.error = result, error
+        with self._lock:
+            del self._calls[key]
+            if error is not None:
+                self._stats["errors"] += 1
+        call.done.set()
+
+    def is_in_flight(self, key):
+        """Return True while a call for ``key`` is running"""
+        with self._lock:
+            return key in self._calls
+
+    def in_flight(self):
+        """Return the number of keys currently being computed"""
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        """Return counters of executions, coalesced waiters, timeouts and errors"""
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,165 @@
+import re
+import threading
+from collections import OrderedDict
+
+from database import database_fingerprint
+from single_flight import question_key
+
+# String literals, quoted identifiers, punctuation, operators and everything else
+_TOKEN = re.compile(
+    r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|[(),;]|[<>=!|+\-*/%]+|[^\s'\"(),;<>=!|+\-*/%]+"
+)
+_LITERAL = re.compile(r"'(?:[^']|'')*'|(?:- )?\d+(?:\.\d+)?")
+_IN_LIST = re.compile(r"\bin\(([^()]*)\)")
+
+
+def _sorted_in_list(match):
+    items = match.group(1).split(",")
+    # Only reorder lists of plain literals; anything containing a comma inside a literal is left alone
+    if all(_LITERAL.fullmatch(item) for item in items):
+        items.sort()
+    return "in(" + ",".join(items) + ")"
+
+
+def normalize_sql(sql):
+    """Canonical form of a statement: case, whitespace, quoting and IN-list order folded.
+
+    String literals keep their case and so do double-quoted tokens, which
+    SQLite reads as a string when they name no column; bare identifiers and
+    keywords are lowercased, since SQLite compares them case-insensitively.
+    """
+    parts = []
+    for token in _TOKEN.findall(sql):
+        if token.startswith(("'", '"')):
+            parts.append(token)
+        else:
+            parts.append(token.lower())
+    while parts and parts[-1] == ";":
+        parts.pop()
+
+    text = ""
+    for part in parts:
+        if part in "(),;" or not text or text[-1] in "(,":
+            text += part
+        else:
+            text += " " + part
+    return _IN_LIST.sub(_sorted_in_list, text)
+
+
+class SQLResultCache:
+    """Bounded LRU of text-to-SQL results keyed by normalized SQL.
+
+    Each entry holds the guarded rows of a statement, so differently phrased
+    questions that produce the same query skip execution. The answer text
+    synthesized from those rows is kept per question wording as well, since
+    the same rows answer "What is the population of Texas?" and "Is Texas's
+    population over 20 million?" differently; only a repeat of the same
+    question skips synthesis. At most ``max_answers`` wordings are kept per
+    statement.
+    Everything is dropped when the fingerprint of ``db_file`` changes, e.g.
+    after ``db_creator`` swaps in a reloaded database. Rows read before such
+    a change are not stored afterwards: ``put_rows`` takes the fingerprint
+    seen before the statement ran, and answers are only kept alongside
+    cached rows.
+    """
+
+    def __init__(self, db_file, max_entries=256, max_answers=8):
+        self.db_file = db_file
+        self.max_entries = max_entries
+        self.max_answers = max_answers
+        self._entries = OrderedDict()
+        self._fingerprint = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "row_hits": 0,
+            "row_misses": 0,
+            "answer_hits": 0,
+            "answer_misses": 0,
+            "evictions": 0,
+            "invalidations": 0,
+            "stale_puts": 0,
+        }
+
+    def get_rows(self, sql):
+        """Return the cached ``(text, metadata)`` of a statement, or None"""
+        entry = self._get(sql, "row")
+        if entry is None:
+            return None
+        text, metadata = entry["rows"]
+        return text, {**metadata, "result": list(metadata["result"])}
+
+    def put_rows(self, sql, text, metadata, fingerprint=None):
+        """Cache a statement's rows; ``fingerprint`` is the one taken before it ran"""
+        # Callers add keys such as sql_query to the metadata they get back, so store a copy
+        self._put(sql, fingerprint, rows=(text, {**metadata, "result": list(metadata["result"])}))
+
+    def get_answer(self, sql, question):
+        """Return the answer synthesized from a statement's rows for ``question``, or None"""
+        entry = self._get(sql, "answer", question=question_key(question))
+        return entry["answers"][question_key(question)] if entry is not None else None
+
+    def put_answer(self, sql, question, answer):
+        # Without cached rows the answer may come from rows of a database since replaced
+        self._put(sql, require="rows", question=question_key(question), answer=answer)
+
+    def fingerprint(self):
+        """Return the current fingerprint of the database, to pass to ``put_rows``"""
+        return database_fingerprint(self.db_file)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return row and answer hit counters, kept apart from the question-level answer cache"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["max_entries"] = self.max_entries
+        for kind in ("row", "answer"):
+            lookups = stats[f"{kind}_hits"] + stats[f"{kind}_misses"]
+            stats[f"{kind}_hit_rate"] = stats[f"{kind}_hits"] / lookups if lookups else 0.0
+        return stats
+
+    def _get(self, sql, kind, question=None):
+        key = normalize_sql(sql)
+        fingerprint = database_fingerprint(self.db_file)
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            entry = self._entries.get(key)
+            if entry is None or entry["rows"] is None or (
+                question is not None and question not in entry["answers"]
+            ):
+                self._stats[f"{kind}_misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats[f"{kind}_hits"] += 1
+            return entry
+
+    def _put(self, sql, read_fingerprint=None, require=None, question=None, answer=None, **values):
+        key = normalize_sql(sql)
+        fingerprint = database_fingerprint(self.db_file)
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            stale = read_fingerprint is not None and read_fingerprint != fingerprint
+            if stale or (require and self._entries.get(key, {}).get(require) is None):
+                self._stats["stale_puts"] += 1
+                return
+            entry = self._entries.setdefault(key, {"rows": None, "answers": OrderedDict()})
+            entry.update(values)
+            if answer is not None:
+                entry["answers"][question] = answer
+                entry["answers"].move_to_end(question)
+                while len(entry["answers"]) > self.max_answers:
+                    entry["answers"].popitem(last=False)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def _check_fingerprint(self, fingerprint):
+        if fingerprint != self._fingerprint:
+            if self._entries:
+                self._entries.clear()
+                self._stats["invalidations"] += 1
+            self._fingerprint = fingerprint
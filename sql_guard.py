@@ -0,0 +1,147 @@
+import re
+import threading
+import time
+
+import sqlalchemy as sa
+from llama_index.core import SQLDatabase
+
+
+class SQLGuardError(Exception):
+    """Raised when generated SQL is refused or cancelled by the guard"""
+
+
+class GuardedSQLDatabase(SQLDatabase):
+    """SQLDatabase that checks and bounds LLM-generated SQL before running it.
+
+    Each statement must be a single SELECT. Its query plan is inspected and
+    refused when it nests more full-table scans than ``max_full_scans`` (the
+    signature of an accidental cross join). A LIMIT is appended when the
+    statement has none, and execution is cancelled through SQLite's progress
+    handler once ``time_budget`` seconds have passed. At most ``max_rows`` rows
+    reach response synthesis.
+
+    ``table_info(table_name)`` may supply the table description used in
+    text-to-SQL prompts; when it returns None the column list is read from
+    the database as usual. With a ``result_cache`` (an ``SQLResultCache``)
+    statements that normalize to one already run are answered from it.
+    """
+
+    def __init__(self, engine, max_rows=50, time_budget=2.0, max_full_scans=1, table_info=None,
+                 result_cache=None, **kwargs):
+        super().__init__(engine, **kwargs)
+        self.table_info_fn = table_info
+        self.result_cache = result_cache
+        self.max_rows = max_rows
+        self.time_budget = time_budget
+        self.max_full_scans = max_full_scans
+        self._lock = threading.Lock()
+        self._stats = {
+            "queries": 0,
+            "rejected": 0,
+            "plan_rejected": 0,
+            "limit_added": 0,
+            "timeouts": 0,
+            "truncated": 0,
+        }
+
+    def run_sql(self, command):
+        """Check, bound and run a statement, returning (text, metadata) like SQLDatabase"""
+        self._count("queries")
+        command = self._check_statement(command)
+        if self.result_cache is not None:
+            cached = self.result_cache.get_rows(command)
+            if cached is not None:
+                return cached
+        key = command
+        # Taken before the statement runs, so rows read from a file replaced meanwhile are not cached
+        fingerprint = self.result_cache.fingerprint() if self.result_cache is not None else None
+        if not re.search(r"\blimit\s+\d+", command, re.IGNORECASE):
+            command = f"{command} LIMIT {self.max_rows + 1}"
+            self._count("limit_added")
+
+        with self._engine.connect() as connection:
+            self._check_plan(connection, command)
+            rows, col_keys = self._execute_with_budget(connection, command)
+
+        truncated = len(rows) > self.max_rows
+        if truncated:
+            rows = rows[:self.max_rows]
+            self._count("truncated")
+        result = [
+            tuple(self.truncate_word(column, length=self._max_string_length) for column in row)
+            for row in rows
+        ]
+        text = str(result)
+        if truncated:
+            text += f"\n(Only the first {self.max_rows} rows are shown.)"
+        metadata = {"result": result, "col_keys": col_keys, "truncated": truncated}
+        if self.result_cache is not None:
+            self.result_cache.put_rows(key, text, metadata, fingerprint=fingerprint)
+        return text, metadata
+
+    def get_single_table_info(self, table_name):
+        """Describe a table for the text-to-SQL prompt"""
+        info = self.table_info_fn(table_name) if self.table_info_fn is not None else None
+        return info if info is not None else super().get_single_table_info(table_name)
+
+    def stats(self):
+        """Return counters for each type of intervention"""
+        with self._lock:
+            return dict(self._stats)
+
+    # ----- checks -----
+
+    def _check_statement(self, command):
+        command = command.strip().rstrip(";").strip()
+        if ";" in command:
+            self._count("rejected")
+            raise SQLGuardError("Only a single SQL statement can be run.")
+        if not re.match(r"(select|with)\b", command, re.IGNORECASE):
+            self._count("rejected")
+            raise SQLGuardError("Only SELECT queries can be run against the states database.")
+        return command
+
+    def _check_plan(self, connection, command):
+        try:
+            plan = connection.execute(sa.text(f"EXPLAIN QUERY PLAN {command}")).all()
+        except (sa.exc.ProgrammingError, sa.exc.OperationalError) as exc:
+            raise NotImplementedError(
+                f"Statement {command!r} is invalid SQL.\nError: {exc.orig}"
+            ) from exc
+        # SEARCH steps use an index lookup; SCAN steps read a whole table or index.
+        # Scans sharing a parent are nested loops, so their row counts multiply.
+        scans_by_parent = {}
+        for _, parent, _, detail in plan:
+            if detail.startswith("SCAN") and "CONSTANT ROW" not in detail:
+                scans_by_parent.setdefault(parent, []).append(detail)
+        full_scans = max(scans_by_parent.values(), key=len, default=[])
+        if len(full_scans) > self.max_full_scans:
+            self._count("plan_rejected")
+            raise SQLGuardError(
+                f"Query would join {len(full_scans)} full table scans ({'; '.join(full_scans)}). "
+                "Add a join condition or a more selective filter."
+            )
+
+    def _execute_with_budget(self, connection, command):
+        dbapi_connection = connection.connection.dbapi_connection
+        deadline = time.monotonic() + self.time_budget
+        dbapi_connection.set_progress_handler(lambda: int(time.monotonic() > deadline), 1000)
+        try:
+            cursor = connection.execute(sa.text(command))
+            rows = cursor.fetchmany(self.max_rows + 1)
+            return rows, list(cursor.keys())
+        except sa.exc.OperationalError as exc:
+            if "interrupted" in str(exc.orig):
+                self._count("timeouts")
+                raise SQLGuardError(
+                    f"Query was cancelled after exceeding its {self.time_budget}s time budget."
+                ) from exc
+            raise NotImplementedError(
+                f"Statement {command!r} is invalid SQL.\nError: {exc.orig}"
+            ) from exc
+        finally:
+            dbapi_connection.set_progress_handler(None, 0)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
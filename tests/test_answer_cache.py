@@ -0,0 +1,128 @@
+# test_answer_cache.py
+import sqlite3
+import time
+
+from answer_cache import AnswerCache, normalize_question
+
+
+def test_paraphrase_hits_cache():
+    """A reworded question should be served from the cache"""
+    cache = AnswerCache()
+    cache.put("Which state has the largest land area?", "Alaska")
+
+    assert cache.get("largest state by area?") == "Alaska"
+    assert cache.get("What is the capital of Texas?") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["similar_hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_different_states_and_numbers_do_not_collide():
+    """Questions about different entities or counts must not share answers"""
+    cache = AnswerCache()
+    cache.put("Tell me about California", "California answer")
+    cache.put("Top 5 states by population", "five states")
+
+    assert normalize_question("Tell me about California") == "california"
+    assert cache.get("Tell me about New York") is None
+    assert cache.get("Top 10 states by population") is None
+
+
+def test_paraphrases_must_name_the_same_states_and_superlatives():
+    """Near-identical wording about another state or the opposite superlative is a miss"""
+    cache = AnswerCache()
+    cache.put("What are the top attractions in North Carolina?", "North Carolina answer")
+    cache.put("Tell me about the history of West Virginia", "West Virginia answer")
+    cache.put("Which state has the largest population?", "California")
+
+    for threshold in (None, 0.6):
+        assert cache.get("What are the top attractions in South Carolina?", threshold=threshold) is None
+        assert cache.get("Tell me about the history of Virginia", threshold=threshold) is None
+        assert cache.get("Which state has the smallest population?", threshold=threshold) is None
+    assert cache.get("Which state has the largest population in the US?") == "California"
+
+
+def test_questions_differing_in_kind_tense_negation_or_unit_do_not_collide():
+    """Another interrogative, tense, negation, unit or a yes/no form asks a different question"""
+    pairs = [
+        ("When did Hawaii become a state?", "Why did Hawaii become a state?"),
+        ("When was Texas founded?", "Who founded Texas?"),
+        ("Which states border Florida?", "Which states do not border Florida?"),
+        ("Which states border Florida?", "Which states don't border Florida?"),
+        ("What is the largest city in Texas?", "Is the largest city in Texas the capital?"),
+        ("What is the population of Texas?", "What was the population of Texas?"),
+        ("What is the area of Texas in square miles?", "What is the area of Texas in square kilometers?"),
+    ]
+    for cached, asked in pairs:
+        cache = AnswerCache()
+        cache.put(cached, "cached answer")
+        assert cache.get(asked) is None, asked
+        assert cache.get(asked, threshold=0.6) is None, asked
+        assert cache.get(cached) == "cached answer"
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    """The memory tier stays within its entry and byte limits"""
+    cache = AnswerCache(max_entries=2)
+    cache.put("capital of Ohio", "Columbus")
+    cache.put("capital of Texas", "Austin")
+    cache.get("capital of Ohio")
+    cache.put("capital of Utah", "Salt Lake City")
+
+    assert cache.get("capital of Texas") is None
+    assert cache.get("capital of Ohio") == "Columbus"
+    assert cache.stats()["evictions"] == 1
+
+    small = AnswerCache(max_bytes=400)
+    small.put("history of Hawaii", "x" * 150)
+    small.put("history of Alaska", "y" * 150)
+    assert small.stats()["entries"] == 1
+    assert small.stats()["bytes"] <= 400
+
+
+def test_disk_tier_is_shared_and_persistent(tmp_path):
+    """A second cache on the same file sees answers written by the first"""
+    db_path = str(tmp_path / "answers.db")
+    AnswerCache(db_path=db_path).put("population of Texas", "29 million", cost_seconds=4.0)
+
+    other = AnswerCache(db_path=db_path)
+    assert other.get("What's the population of Texas?") == "29 million"
+    assert other.stats()["disk_hits"] == 1
+    assert other.stats()["saved_seconds"] == 4.0
+
+
+def test_disk_index_reads_only_new_rows_and_evicts_past_the_cap(tmp_path):
+    """Paraphrase lookups see other processes' writes without re-reading every row"""
+    db_path = str(tmp_path / "answers.db")
+    writer = AnswerCache(db_path=db_path, max_disk_entries=3)
+    reader = AnswerCache(db_path=db_path)
+    writer.put("Which state has the largest land area?", "Alaska")
+    assert reader.get("largest state by area?") == "Alaska"
+
+    decoded = []
+    decode = reader._decode_vector
+    reader._decode_vector = lambda text: decoded.append(text) or decode(text)
+    writer.put("What is the history of Vermont statehood?", "1791")
+    assert reader.get("Vermont statehood history") == "1791"
+    assert len(decoded) == 1  # only the row written since the previous lookup
+
+    for state in ["Ohio", "Utah", "Iowa"]:
+        writer.put(f"capital of {state}", state)
+    with sqlite3.connect(db_path) as conn:
+        keys = {key for (key,) in conn.execute("SELECT key FROM answers")}
+    conn.close()
+    assert keys == {"capital ohio", "capital utah", "capital iowa"}
+
+
+def test_expired_entries_are_ignored(tmp_path):
+    """Entries older than the TTL are treated as misses"""
+    cache = AnswerCache(db_path=str(tmp_path / "answers.db"), ttl=60)
+    cache.put("capital of Ohio", "Columbus")
+    cache._entries["capital ohio"]["created_at"] = time.time() - 120
+
+    assert cache.get("capital of Ohio") == "Columbus"  # still fresh on disk
+
+    cache.clear()
+    assert cache.get("capital of Ohio") is None
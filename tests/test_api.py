@@ -0,0 +1,158 @@
+# test_api.py
+import asyncio
+import threading
+
+import httpx
+from starlette.testclient import TestClient
+
+from api import create_api
+from api_client import BUSY_MESSAGE, QueryAPIClient
+
+
+def fake_answer(question):
+    return {"response": f"Answer to {question}", "path": "agent"}
+
+
+def fake_stream(question):
+    yield {"type": "status", "text": "Planning..."}
+    yield {"type": "token", "text": "Answer "}
+    yield {"type": "token", "text": "streamed"}
+    yield {"type": "done", "response": "Answer streamed", "path": "agent_stream",
+           "ttft_seconds": 0.1, "total_seconds": 0.2}
+
+
+def test_query_returns_answer_json():
+    """POST /query answers with the pipeline's response and path"""
+    client = TestClient(create_api(fake_answer, fake_stream, workers=2, max_queue=2))
+    response = client.post("/query", json={"question": "Capital of Ohio?"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["response"] == "Answer to Capital of Ohio?"
+    assert body["path"] == "agent"
+    assert body["seconds"] >= 0
+
+
+def test_invalid_requests_are_rejected():
+    """A missing or blank question is a client error"""
+    client = TestClient(create_api(fake_answer, fake_stream))
+    assert client.post("/query", json={}).status_code == 400
+    assert client.post("/query", json={"question": "  "}).status_code == 400
+    assert client.post("/query", content="not json").status_code == 400
+
+
+def test_full_queue_returns_429():
+    """Requests beyond workers plus queue are refused instead of waiting"""
+    release = threading.Event()
+
+    def slow_answer(question):
+        release.wait(5)
+        return fake_answer(question)
+
+    api = create_api(slow_answer, fake_stream, workers=1, max_queue=0)
+    service = api.state.service
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=api)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = asyncio.create_task(client.post("/query", json={"question": "first"}))
+            while service.stats()["admitted"] < 1:
+                await asyncio.sleep(0.01)
+            second = await client.post("/query", json={"question": "second"})
+            release.set()
+            return await first, second
+
+    first, second = asyncio.run(scenario())
+    assert second.status_code == 429
+    assert second.headers["Retry-After"] == "1"
+    assert first.status_code == 200
+    assert service.stats()["rejected"] == 1
+    assert service.stats()["admitted"] == 0
+
+
+def test_slots_are_held_until_the_worker_finishes():
+    """A timed-out or abandoned question keeps its slot while its worker is still busy"""
+    release = threading.Event()
+    closed = threading.Event()
+
+    def slow_answer(question):
+        release.wait(5)
+        return fake_answer(question)
+
+    def endless_stream(question):
+        try:
+            for _ in range(500):
+                yield {"type": "token", "text": "more "}
+                release.wait(0.01)
+        finally:
+            closed.set()
+
+    api = create_api(slow_answer, endless_stream, workers=1, max_queue=1, timeout=0.1)
+    service = api.state.service
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=api)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            timed_out = await client.post("/query", json={"question": "slow"})
+            admitted_after_timeout = service.stats()["admitted"]
+            release.set()
+            while service.stats()["admitted"]:
+                await asyncio.sleep(0.01)
+
+            assert service.try_admit()
+            events = service.stream("History of Ohio")
+            assert (await events.__anext__())["text"] == "more "
+            await events.aclose()
+            while service.stats()["admitted"]:
+                await asyncio.sleep(0.01)
+            return timed_out, admitted_after_timeout
+
+    timed_out, admitted_after_timeout = asyncio.run(scenario())
+    assert timed_out.status_code == 504
+    assert admitted_after_timeout == 1
+    assert closed.is_set()
+
+
+def test_stream_sends_server_sent_events():
+    """?stream=true relays the pipeline's events as SSE"""
+    client = TestClient(create_api(fake_answer, fake_stream))
+    response = client.post("/query?stream=true", json={"question": "History of Ohio"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [line.split(": ", 1)[1] for line in response.text.splitlines() if line.startswith("event:")]
+    assert events == ["status", "token", "token", "done"]
+
+
+def test_client_matches_in_process_shapes():
+    """The thin client returns answers and events shaped like the local pipeline"""
+    api = create_api(fake_answer, fake_stream)
+    client = QueryAPIClient("http://testserver", client=TestClient(api))
+
+    result = client.answer_query("Capital of Ohio?")
+    assert result["response"] == "Answer to Capital of Ohio?"
+    assert result["path"] == "agent"
+    events = list(client.stream_query("History of Ohio"))
+    assert "".join(e["text"] for e in events if e["type"] == "token") == "Answer streamed"
+    assert events[-1]["path"] == "agent_stream"
+
+
+def test_client_reports_busy_service():
+    """A 429 becomes a friendly answer rather than an exception"""
+    api = create_api(fake_answer, fake_stream, workers=1, max_queue=0)
+    api.state.service._admitted = 1  # simulate a question already running
+    client = QueryAPIClient("http://testserver", client=TestClient(api))
+
+    assert client.answer_query("Capital of Ohio?") == {"response": BUSY_MESSAGE, "path": "busy"}
+    events = list(client.stream_query("Capital of Ohio?"))
+    assert events[-1]["path"] == "busy"
+
+
+def test_client_stats_are_none_when_the_service_fails():
+    """An unreachable or failing service gives no stats instead of raising"""
+    def failing_stats():
+        raise RuntimeError("pipeline not ready")
+
+    api = create_api(fake_answer, fake_stream, stats_fn=failing_stats)
+    client = QueryAPIClient("http://testserver", client=TestClient(api, raise_server_exceptions=False))
+    assert client.stats() is None
+
+    offline = QueryAPIClient("http://127.0.0.1:9", timeout=1.0)
+    assert offline.stats() is None
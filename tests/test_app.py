@@ -10,7 +10,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Import the functions from your app
 # Note: You may need to adjust the import based on how you've structured your files
-from app import initialize_components, get_agent, execute_query
+from app import initialize_components, get_agent, execute_query, answer_query, stream_query
 
 # test_app.py
 import pytest
@@ -24,7 +24,19 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Import the functions from your app
 # Note: You may need to adjust the import based on how you've structured your files
-from app import initialize_components, get_agent, execute_query
+from app import initialize_components, get_agent, execute_query, answer_query, stream_query, get_llm_limiter
+from llama_index.core.llms import MockLLM
+
+
+@pytest.fixture(autouse=True)
+def isolated_runtime_files(tmp_path, monkeypatch):
+    """Point the answer cache and request log at a temporary directory for every test"""
+    monkeypatch.setenv("ANSWER_CACHE_PATH", str(tmp_path / "answer_cache.db"))
+    monkeypatch.setenv("REQUEST_LOG_PATH", str(tmp_path / "request_log.jsonl"))
+    # Cached resources built by an earlier test would still hold the old paths
+    st.cache_resource.clear()
+    yield
+    st.cache_resource.clear()
 
 # Test 1: Test component initialization
 # Test 2: Test agent creation
@@ -39,6 +51,7 @@ def test_get_agent(mock_react_agent):
     with patch('app.initialize_components') as mock_init:
         mock_init.return_value = {
             "llm": MagicMock(),
+            "planning_llm": MagicMock(),
             "sql_query_engine": MagicMock(),
             "llama_cloud_query_engine": MagicMock()
         }
@@ -99,4 +112,241 @@ def test_execute_query(mock_get_agent):
     
     # Should return the new response
     assert result3 == "Test response about New York"
-    mock_agent.query.assert_called_once_with("Tell me about New York")
\ No newline at end of file
+    mock_agent.query.assert_called_once_with("Tell me about New York")
+
+# Test 4: Test that structured questions bypass the agent
+@patch('app.get_agent')
+def test_fast_path_bypasses_agent(mock_get_agent):
+    """Simple structured questions are answered locally without the agent"""
+    result = answer_query("What is the capital of Texas?")
+
+    assert result == {"response": "The capital of Texas is Austin.", "path": "fast_path"}
+    mock_get_agent.assert_not_called()
+
+
+# Test 5: Test streaming execution
+@patch('app.get_agent')
+def test_stream_query_yields_status_then_tokens(mock_get_agent):
+    """Streaming reports tool steps, then answer tokens, and fills the answer cache"""
+    task = MagicMock(task_id="task-1", extra_state={"sources": []})
+    tool_step = MagicMock(is_last=False)
+    final_step = MagicMock(is_last=True)
+
+    def stream_step(task_id):
+        if not task.extra_state["sources"]:
+            task.extra_state["sources"].append(MagicMock(tool_name="llama_cloud_tool"))
+            return tool_step
+        return final_step
+
+    mock_agent = MagicMock()
+    mock_agent.create_task.return_value = task
+    mock_agent.stream_step.side_effect = stream_step
+    mock_agent.finalize_response.return_value = MagicMock(response_gen=iter(["Volcanoes", " and beaches"]))
+    mock_get_agent.return_value = mock_agent
+    execute_query.clear()
+
+    events = list(stream_query("What are popular tourist attractions in Hawaii?"))
+
+    assert [e["text"] for e in events if e["type"] == "status"] == ["Planning...", "Consulted llama_cloud_tool"]
+    assert [e["text"] for e in events if e["type"] == "token"] == ["Volcanoes", " and beaches"]
+    done = events[-1]
+    assert done["type"] == "done"
+    assert done["response"] == "Volcanoes and beaches"
+    assert done["path"] == "agent_stream"
+    assert 0 <= done["ttft_seconds"] <= done["total_seconds"]
+
+    # The streamed answer is now served from the cache
+    assert answer_query("popular tourist attractions in Hawaii") == {
+        "response": "Volcanoes and beaches", "path": "cache"
+    }
+
+
+# Test 6: Query engines are only built when a question needs them
+def test_components_build_engines_on_first_use():
+    """initialize_components returns without constructing either query engine"""
+    st.cache_resource.clear()
+    document_engine = MagicMock()
+    document_engine.query.return_value = "Documents answer"
+    llm = MockLLM()
+    with patch('app.create_llm', return_value=llm), \
+            patch('app.create_document_engine', return_value=document_engine) as mock_documents, \
+            patch('app.get_sql_query_engine') as mock_sql:
+        components = initialize_components()
+        assert components["llm"].llm is llm
+        mock_documents.assert_not_called()
+
+        assert components["llama_cloud_query_engine"].query("History of Ohio") == "Documents answer"
+        mock_documents.assert_called_once()
+        mock_sql.assert_not_called()
+    st.cache_resource.clear()
+
+
+# Test 7: Questions are answered without the LLM while its circuit is open
+@patch('app.get_agent')
+def test_open_circuit_serves_cached_answers(mock_get_agent):
+    """An open circuit skips the agent and falls back to similar cached answers, naming their question"""
+    execute_query.clear()
+    st.cache_resource.clear()
+    from app import get_answer_cache
+    get_answer_cache().put("What is the history of Vermont statehood?", "Vermont joined the union in 1791.")
+    get_answer_cache().put("land area of Texas", "Texas has 261,232 square miles of land.")
+    breaker = get_llm_limiter().breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+    try:
+        result = answer_query("Vermont history")
+        assert result["path"] == "degraded_cache"
+        assert '"What is the history of Vermont statehood?"' in result["response"]
+        assert result["response"].endswith("Vermont joined the union in 1791.")
+        # A neighbouring question's answer is never passed off as an answer to this one
+        from app import degraded_answer
+        result = degraded_answer("water area of Texas")
+        assert result["path"] == "degraded_cache"
+        assert 'question "land area of Texas"' in result["response"]
+        assert answer_query("Tell me about the culture of Oregon")["path"] == "degraded"
+        events = list(stream_query("Tell me about the culture of Oregon"))
+        assert events[-1]["path"] == "degraded"
+        assert answer_query("What is the capital of Texas?")["path"] == "fast_path"
+        mock_get_agent.assert_not_called()
+    finally:
+        st.cache_resource.clear()
+
+
+# Test 8: A failed plan on the fast model is retried on the large model
+@patch('app.get_agent')
+def test_failed_planning_escalates_to_large_model(mock_get_agent):
+    """The agent is rebuilt on the large model when the fast planning model fails"""
+    execute_query.clear()
+    st.cache_resource.clear()
+    fast_agent, large_agent = MagicMock(), MagicMock()
+    fast_agent.query.side_effect = ValueError("Could not parse output")
+    large_agent.query.return_value = MagicMock(response="Ohio has a humid continental climate.")
+    mock_get_agent.side_effect = lambda escalated=False: large_agent if escalated else fast_agent
+
+    try:
+        result = answer_query("What is the climate like in Ohio?")
+        assert result == {"response": "Ohio has a humid continental climate.", "path": "agent"}
+        from app import get_model_cascade
+        assert get_model_cascade().stats()["stages"]["planning"]["escalation_reasons"] == {
+            "error: ValueError": 1
+        }
+    finally:
+        st.cache_resource.clear()
+
+
+# Test 9: Follow-ups carry the conversation to the agent and stay out of the shared caches
+@patch('app.get_agent')
+def test_follow_up_sends_context_to_agent(mock_get_agent):
+    """A follow-up with context skips the fast path and cache and is not cached itself"""
+    execute_query.clear()
+    mock_agent = MagicMock()
+    mock_agent.query.return_value = MagicMock(response="The capital of Texas is Austin.")
+    mock_get_agent.return_value = mock_agent
+    context = "User: How big is Texas?\nAssistant: Texas covers 268,596 square miles."
+
+    result = answer_query("And what is its capital?", context=context)
+
+    assert result == {"response": "The capital of Texas is Austin.", "path": "follow_up"}
+    prompt = mock_agent.query.call_args.args[0]
+    assert context in prompt and prompt.endswith("And what is its capital?")
+    assert answer_query("And what is its capital?")["path"] != "cache"
+
+
+# Test 10: Streamed questions do not see each other's conversations
+def test_streamed_tasks_do_not_share_agent_memory():
+    """Each streamed question plans with its own memory and leaves nothing on the shared agent"""
+    from llama_index.core.agent import ReActAgent
+    from benchmarks.fakes import ScriptedLLM
+
+    llm = ScriptedLLM()
+    agent = ReActAgent.from_tools([], llm=llm)
+    try:
+        prompt_tokens = []
+        with patch('app.get_agent', return_value=agent):
+            for question in ["Tell me about the culture of Oregon", "Tell me about the culture of Maine"]:
+                before = llm.prompt_tokens
+                assert list(stream_query(question))[-1]["path"] == "agent_stream"
+                prompt_tokens.append(llm.prompt_tokens - before)
+        # The second prompt would carry the first question and answer if memory were shared
+        assert abs(prompt_tokens[1] - prompt_tokens[0]) < 10
+        assert agent.memory.get_all() == []
+        assert agent.state.task_dict == {}
+    finally:
+        st.cache_resource.clear()
+
+
+# Test 11: Identical questions wait for a streamed answer instead of running the agent again
+def test_streamed_answer_is_shared_with_identical_requests():
+    """Requests arriving while a question streams coalesce onto it, streaming or not"""
+    import threading
+    import time
+    from app import get_single_flight
+
+    release = threading.Event()
+    task = MagicMock(task_id="task-1", extra_state={"sources": []})
+    mock_agent = MagicMock()
+    mock_agent.create_task.return_value = task
+    mock_agent.stream_step.side_effect = lambda task_id: release.wait(5) and MagicMock(is_last=True)
+    mock_agent.finalize_response.return_value = MagicMock(response_gen=iter(["Lobster", " and lighthouses"]))
+    question = "What is Maine known for?"
+    results = {}
+    try:
+        with patch('app.get_agent', return_value=mock_agent):
+            leader = threading.Thread(target=lambda: results.update(leader=list(stream_query(question))))
+            leader.start()
+            flight = get_single_flight()
+            while not flight.in_flight():
+                time.sleep(0.01)
+            followers = [
+                threading.Thread(target=lambda: results.update(answer=answer_query(question))),
+                threading.Thread(target=lambda: results.update(stream=list(stream_query(question)))),
+            ]
+            for thread in followers:
+                thread.start()
+            while flight.stats()["coalesced"] < 2:
+                time.sleep(0.01)
+            release.set()
+            for thread in [leader] + followers:
+                thread.join(5)
+
+        assert mock_agent.create_task.call_count == 1
+        mock_agent.query.assert_not_called()
+        assert results["leader"][-1]["path"] == "agent_stream"
+        assert results["answer"] == {"response": "Lobster and lighthouses", "path": "coalesced"}
+        assert results["stream"][-1]["response"] == "Lobster and lighthouses"
+        assert results["stream"][-1]["path"] == "coalesced"
+    finally:
+        st.cache_resource.clear()
+
+
+# Test 12: The chat history is trimmed a whole turn at a time
+def test_chat_history_keeps_question_and_answer_pairs(monkeypatch):
+    """An odd CHAT_HISTORY_MAX never leaves an answer without its question"""
+    from app import record_turn
+
+    monkeypatch.setenv("CHAT_HISTORY_MAX", "5")
+    st.session_state.chat_history = []
+    with patch('app.get_conversation_memory'):
+        for i in range(4):
+            record_turn(f"Question {i}", f"Answer {i}")
+
+    history = st.session_state.chat_history
+    assert [m["role"] for m in history] == ["user", "assistant"] * 2
+    assert history[0]["content"] == "Question 2"
+    del st.session_state.chat_history
+
+
+# Test 13: A streamed question is looked up in the answer cache once
+def test_streamed_fanout_question_is_looked_up_once():
+    """Handing a streamed question to the fan-out path does not repeat the cache lookup"""
+    from app import get_answer_cache
+
+    planner = MagicMock()
+    planner.plan.return_value = {"sql": "population?", "documents": "history?"}
+    with patch('app.get_fanout_planner', return_value=planner), \
+            patch('app.run_agent', return_value={"response": "Combined answer", "path": "fanout"}):
+        events = list(stream_query("What is the population of Ohio and its history?"))
+
+    assert events[-1]["response"] == "Combined answer"
+    assert get_answer_cache().stats()["misses"] == 1
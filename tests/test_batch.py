@@ -0,0 +1,127 @@
+# test_batch.py
+import json
+import threading
+import time
+
+from batch import completed_ids, run_batch
+
+
+def write_questions(path, questions):
+    with open(path, "w") as f:
+        for question in questions:
+            f.write(json.dumps(question) + "\n")
+
+
+def read_results(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_answers_every_question_with_latency(tmp_path):
+    """Each question gets one output line with its response, path and timing"""
+    source, output = tmp_path / "questions.jsonl", tmp_path / "answers.jsonl"
+    write_questions(source, [{"id": "tx", "question": "Capital of Texas?"}, "Capital of Ohio?"])
+
+    summary = run_batch(str(source), str(output), lambda q: {"response": q.upper(), "path": "agent"})
+
+    results = {r["id"]: r for r in read_results(output)}
+    assert set(results) == {"tx", "2"}
+    assert results["tx"]["response"] == "CAPITAL OF TEXAS?"
+    assert results["2"]["status"] == "ok" and results["2"]["seconds"] >= 0
+    assert summary["answered"] == 2 and summary["errors"] == 0
+
+
+def test_failures_are_recorded_not_raised(tmp_path):
+    """An exception or an error answer is written as an error record"""
+    source, output = tmp_path / "questions.jsonl", tmp_path / "answers.jsonl"
+    write_questions(source, [{"question": "boom"}, {"question": "bad"}, {"question": "fine"}])
+
+    def answer(question):
+        if question == "boom":
+            raise RuntimeError("LLM unavailable")
+        return {"response": "sorry" if question == "bad" else "ok", "path": "error" if question == "bad" else "agent"}
+
+    summary = run_batch(str(source), str(output), answer)
+    results = {r["question"]: r for r in read_results(output)}
+    assert results["boom"]["error"] == "LLM unavailable"
+    assert results["bad"]["status"] == "error"
+    assert summary["ok"] == 1 and summary["errors"] == 2
+
+
+def test_rerun_resumes_from_checkpoint(tmp_path):
+    """A second run skips answered ids and, when asked, retries failed ones"""
+    source, output = tmp_path / "questions.jsonl", tmp_path / "answers.jsonl"
+    write_questions(source, [{"question": f"q{i}"} for i in range(6)])
+    calls = []
+
+    def answer(question):
+        calls.append(question)
+        return {"response": "ok", "path": "error" if question == "q5" else "agent"}
+
+    first = run_batch(str(source), str(output), answer, limit=4)
+    assert first["answered"] == 4
+    with open(output, "a") as f:
+        f.write('{"id": "trunc')  # interrupted mid-write
+
+    second = run_batch(str(source), str(output), answer)
+    assert second["skipped"] == 4 and second["answered"] == 2
+    assert sorted(calls) == [f"q{i}" for i in range(6)]
+
+    third = run_batch(str(source), str(output), answer, retry_errors=True)
+    assert third["answered"] == 1 and calls[-1] == "q5"
+    assert "6" in completed_ids(str(output))
+
+
+def test_degraded_answers_are_retried_on_rerun(tmp_path):
+    """Apologies and loose cache matches from an outage are not checkpointed as answers"""
+    source, output = tmp_path / "questions.jsonl", tmp_path / "answers.jsonl"
+    write_questions(source, [{"question": "q1"}, {"question": "q2"}, {"question": "q3"}])
+    paths = {"q1": "degraded", "q2": "degraded_cache", "q3": "agent"}
+
+    summary = run_batch(str(source), str(output), lambda q: {"response": "sorry", "path": paths[q]})
+    results = {r["question"]: r for r in read_results(output)}
+    assert results["q1"]["status"] == results["q2"]["status"] == "degraded"
+    assert summary["ok"] == 1 and summary["degraded"] == 2
+    assert completed_ids(str(output)) == {"3"}
+
+    calls = []
+
+    def recovered(question):
+        calls.append(question)
+        return {"response": "answer", "path": "agent"}
+
+    second = run_batch(str(source), str(output), recovered)
+    assert sorted(calls) == ["q1", "q2"] and second["ok"] == 2
+    assert completed_ids(str(output)) == {"1", "2", "3"}
+
+
+def test_workers_run_questions_in_parallel(tmp_path):
+    """Slow answers overlap up to the number of workers"""
+    source, output = tmp_path / "questions.jsonl", tmp_path / "answers.jsonl"
+    write_questions(source, [{"question": f"q{i}"} for i in range(8)])
+    running, peak = 0, 0
+    lock = threading.Lock()
+
+    def answer(question):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+        return {"response": "ok", "path": "agent"}
+
+    summary = run_batch(str(source), str(output), answer, workers=4)
+    assert peak == 4
+    assert summary["seconds"] < 8 * 0.05
+
+
+def test_rate_limit_spaces_question_starts(tmp_path):
+    """With a rate set, questions start no faster than the limit"""
+    source, output = tmp_path / "questions.jsonl", tmp_path / "answers.jsonl"
+    write_questions(source, [{"question": f"q{i}"} for i in range(5)])
+
+    summary = run_batch(str(source), str(output), lambda q: {"response": "ok", "path": "agent"},
+                        workers=5, rate=20, burst=1)
+    assert summary["seconds"] >= 4 / 20 * 0.9
@@ -0,0 +1,30 @@
+# test_bench_pipeline.py
+import streamlit as st
+
+from benchmarks.bench_pipeline import compare, run_benchmarks
+
+
+def test_pipeline_benchmark_runs_offline(tmp_path, monkeypatch):
+    """The scripted LLM and fake retriever drive the real pipeline without network access"""
+    monkeypatch.setenv("ANSWER_CACHE_PATH", str(tmp_path / "answer_cache.db"))
+    monkeypatch.setenv("REQUEST_LOG_PATH", str(tmp_path / "request_log.jsonl"))
+    try:
+        results = run_benchmarks(queries=3, concurrency=2, llm_latency=0.0, retrieval_latency=0.0)
+    finally:
+        st.cache_resource.clear()
+
+    assert results["agent_overhead"]["n"] == 3
+    assert results["agent_overhead"]["llm_calls_per_query"] >= 2
+    assert results["cache_hit"]["p50_ms"] < results["agent_overhead"]["p50_ms"]
+    assert results["concurrent"]["throughput_qps"] > 0
+
+
+def test_compare_flags_regressions():
+    """Latency increases and throughput drops beyond the threshold are regressions"""
+    baseline = {"results": {"cache_hit": {"n": 5, "p50_ms": 1.0}, "concurrent": {"throughput_qps": 10.0}}}
+    current = {"results": {"cache_hit": {"n": 5, "p50_ms": 1.5}, "concurrent": {"throughput_qps": 11.0}}}
+    rows = {row["metric"]: row for row in compare(baseline, current, threshold=0.2)}
+
+    assert set(rows) == {"cache_hit.p50_ms", "concurrent.throughput_qps"}
+    assert rows["cache_hit.p50_ms"]["regressed"]
+    assert not rows["concurrent.throughput_qps"]["regressed"]
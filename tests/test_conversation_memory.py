@@ -0,0 +1,86 @@
+# test_conversation_memory.py
+from conversation_memory import ConversationMemory, estimate_tokens, is_follow_up
+
+
+def test_follow_ups_are_told_apart_from_standalone_questions():
+    """Connectives and back-references mark a follow-up; a self-contained question is not one"""
+    assert is_follow_up("and its capital?")
+    assert is_follow_up("What about the population of that state?")
+    assert is_follow_up("How big are they?")
+    assert not is_follow_up("What is the capital of Texas?")
+    assert not is_follow_up("Are there national parks in Utah?")
+    assert is_follow_up("What is its capital?")
+    assert is_follow_up("Its population?")
+    assert is_follow_up("And what about Ohio?")
+    assert not is_follow_up("capital of Texas and its population")
+
+
+def test_memory_and_context_stay_bounded_over_a_long_conversation():
+    """After many long turns the recent window, summary and context all stay within their budgets"""
+    memory = ConversationMemory(max_turns=3, token_budget=200, summary_tokens=60, answer_tokens=40)
+    for i in range(50):
+        memory.add(f"Question {i} about Ohio?", f"Answer {i} about Ohio. " + "More detail. " * 100)
+
+    assert memory.stats()["pending_turns"] == 3
+    assert all(estimate_tokens(answer) <= 40 for _, answer in memory.turns)
+    context = memory.context_for("and its capital?")
+    stats = memory.stats()
+    assert (stats["turns"], stats["recent_turns"], stats["compactions"]) == (50, 3, 47)
+    assert stats["summary_tokens"] <= 60
+    assert estimate_tokens(context) <= 200
+    assert context.startswith("Earlier: ") and "User: Question 49 about Ohio?\nAssistant: Answer 49" in context
+    assert memory.context_for("What is the capital of Ohio?") is None
+
+
+def test_older_turns_are_summarized_incrementally():
+    """Each turn leaving the window is folded into the previous summary exactly once"""
+    calls = []
+
+    def summarize(summary, question, answer):
+        calls.append(summary)
+        return f"{summary} {question}".strip()
+
+    memory = ConversationMemory(max_turns=1, summarize=summarize)
+    for question in ["Texas?", "Ohio?", "Utah?"]:
+        memory.add(question, "An answer.")
+
+    assert calls == []
+    assert memory.context() == "Earlier: Texas? Ohio?\nUser: Utah?\nAssistant: An answer."
+    assert calls == ["", "Texas?"]
+    assert memory.summary == "Texas? Ohio?"
+
+
+def test_failed_summary_falls_back_to_extracts():
+    """A summarizer error keeps the first sentence of the answer instead of losing the turn"""
+    def summarize(summary, question, answer):
+        raise RuntimeError("circuit open")
+
+    memory = ConversationMemory(max_turns=1, summarize=summarize)
+    memory.add("How big is Texas?", "Texas covers 268,596 square miles. It is the second largest state.")
+    memory.add("And its capital?", "Austin.")
+    memory.context()
+
+    assert memory.summary == "How big is Texas? -> Texas covers 268,596 square miles."
+    assert memory.stats()["summary_failures"] == 1
+
+
+def test_standalone_questions_never_call_the_summarizer():
+    """Turns wait unsummarized until a follow-up, and overflow is folded in without a model call"""
+    calls = []
+
+    def summarize(summary, question, answer):
+        calls.append(question)
+        return f"{summary} {question}".strip()
+
+    memory = ConversationMemory(max_turns=2, max_pending=2, summarize=summarize)
+    for i in range(6):
+        memory.add(f"Question {i} about Ohio?", f"Answer {i}.")
+        assert memory.context_for(f"What is the capital of state {i}?") is None
+
+    assert calls == []
+    assert memory.summary == "Question 0 about Ohio? -> Answer 0.\nQuestion 1 about Ohio? -> Answer 1."
+    assert "Question 5" in memory.context_for("and its population?")
+    assert calls == ["Question 2 about Ohio?", "Question 3 about Ohio?"]
+
+    memory.clear()
+    assert memory.stats()["turns"] == 0 and memory.stats()["compactions"] == 0
@@ -0,0 +1,54 @@
+# test_db_access.py
+import threading
+
+import pytest
+import sqlalchemy as sa
+
+from database import create_read_engine
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = create_read_engine("states.db", pool_size=2, max_overflow=2)
+    yield engine
+    engine.dispose()
+
+
+def test_pooled_reads_across_threads(engine):
+    """Connections are shared safely across threads and every query is timed"""
+    engine.query_stats.reset()
+    results = []
+
+    def worker():
+        with engine.connect() as conn:
+            for _ in range(10):
+                results.append(conn.execute(sa.text("SELECT COUNT(*) FROM states")).scalar())
+
+    threads = [threading.Thread(target=worker) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [50] * 60
+    summary = engine.query_stats.summary()
+    assert summary["queries"] == 60
+    assert summary["p95_ms"] <= summary["max_ms"]
+
+
+def test_connections_are_read_only_and_tuned(engine):
+    """Writes are rejected and the read pragmas are applied"""
+    with engine.connect() as conn:
+        with pytest.raises(sa.exc.OperationalError):
+            conn.execute(sa.text("DELETE FROM states"))
+        assert conn.execute(sa.text("PRAGMA query_only")).scalar() == 1
+        assert conn.execute(sa.text("PRAGMA mmap_size")).scalar() > 0
+
+
+def test_ranking_queries_use_indexes(engine):
+    """Sorting on commonly queried columns is served by an index"""
+    with engine.connect() as conn:
+        plan = conn.execute(sa.text(
+            "EXPLAIN QUERY PLAN SELECT name FROM states ORDER BY population DESC LIMIT 3"
+        )).all()
+    assert "USING INDEX ix_states_population" in plan[0][-1]
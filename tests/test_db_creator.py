@@ -0,0 +1,144 @@
+# test_db_creator.py
+import json
+import os
+
+import pytest
+import sqlalchemy as sa
+
+from database import create_read_engine
+from db_creator import build_derived_tables, iter_state_records, load_states
+
+
+def _write_states(path, records):
+    with open(path, "w") as f:
+        json.dump({"results": records}, f)
+
+
+def _record(object_id, name, population, updated_at):
+    return {
+        "objectId": object_id,
+        "name": name,
+        "postalAbreviation": name[:2].upper(),
+        "capital": f"{name} City",
+        "population": population,
+        "updatedAt": updated_at,
+        "capitals": {"__type": "Pointer", "objectId": f"cap-{object_id}"},
+    }
+
+
+def _rows(db_file):
+    engine = sa.create_engine(f"sqlite:///{db_file}")
+    with engine.connect() as conn:
+        rows = conn.execute(sa.text("SELECT name, population, capitals_object_id FROM states ORDER BY name")).all()
+    engine.dispose()
+    return [tuple(row) for row in rows]
+
+
+def test_streaming_reader_matches_json_load():
+    """The incremental reader yields the same records as json.load"""
+    with open("states.json") as f:
+        expected = json.load(f)["results"]
+
+    assert list(iter_state_records("states.json", chunk_size=97)) == expected
+
+
+def test_full_then_incremental_load(tmp_path):
+    """Incremental loads only rewrite changed rows and remove deleted ones"""
+    db_file = str(tmp_path / "states.db")
+    json_file = str(tmp_path / "states.json")
+    _write_states(json_file, [
+        _record("a1", "Alpha", 100, "2019-01-01"),
+        _record("b2", "Beta", 200, "2019-01-01"),
+        _record("c3", "Gamma", 300, "2019-01-01"),
+    ])
+
+    stats = load_states(db_file, json_file, batch_size=2)
+    assert (stats["inserted"], stats["rows"]) == (3, 3)
+    assert _rows(db_file)[0] == ("Alpha", 100, "cap-a1")
+
+    _write_states(json_file, [
+        _record("a1", "Alpha", 150, "2020-01-01"),
+        _record("b2", "Beta", 999, "2019-01-01"),
+        _record("d4", "Delta", 400, "2020-01-01"),
+    ])
+    stats = load_states(db_file, json_file, batch_size=2, incremental=True)
+
+    assert {k: stats[k] for k in ["inserted", "updated", "unchanged", "deleted"]} == {
+        "inserted": 1, "updated": 1, "unchanged": 1, "deleted": 1
+    }
+    # Beta keeps its old population because its updatedAt did not change
+    assert _rows(db_file) == [("Alpha", 150, "cap-a1"), ("Beta", 200, "cap-b2"), ("Delta", 400, "cap-d4")]
+    assert not os.path.exists(db_file + ".tmp")
+
+
+def test_pooled_readers_see_the_swapped_database(tmp_path):
+    """A connection pooled before a reload is replaced instead of reading the old file"""
+    db_file = str(tmp_path / "states.db")
+    json_file = str(tmp_path / "states.json")
+    _write_states(json_file, [_record("a1", "Alpha", 100, "2019-01-01")])
+    load_states(db_file, json_file)
+    engine = create_read_engine(db_file, pool_size=1, max_overflow=0)
+    query = sa.text("SELECT population FROM states WHERE name = 'Alpha'")
+    with engine.connect() as conn:
+        assert conn.execute(query).scalar() == 100
+
+    _write_states(json_file, [_record("a1", "Alpha", 1, "2020-01-01")])
+    load_states(db_file, json_file, incremental=True)
+    with engine.connect() as conn:
+        assert conn.execute(query).scalar() == 1
+    engine.dispose()
+
+
+def test_failed_load_keeps_existing_database(tmp_path):
+    """A broken source file leaves the live database untouched"""
+    db_file = str(tmp_path / "states.db")
+    json_file = str(tmp_path / "states.json")
+    _write_states(json_file, [_record("a1", "Alpha", 100, "2019-01-01")])
+    load_states(db_file, json_file)
+
+    with open(json_file, "w") as f:
+        f.write('{"results": [{"objectId": "b2", "name": ')
+    with pytest.raises(ValueError):
+        load_states(db_file, json_file, incremental=True)
+
+    assert _rows(db_file) == [("Alpha", 100, "cap-a1")]
+    assert not os.path.exists(db_file + ".tmp")
+
+
+def test_derived_tables_are_rebuilt_on_load(tmp_path):
+    """Borders are stored both ways and densities and ranks follow the states table"""
+    db_file = str(tmp_path / "states.db")
+    json_file = str(tmp_path / "states.json")
+    borders_file = str(tmp_path / "borders.json")
+    records = [_record("a1", "Alpha", 1000, "2019-01-01"), _record("b2", "Beta", 4000, "2019-01-01"),
+               _record("c3", "Gamma", 3000, "2019-01-01")]
+    for record, land, water in zip(records, [10, 100, 20], [10, 0, 5]):
+        record.update(landAreaSquareMiles=land, waterAreaSquareMiles=water, totalAreaSquareMiles=land + water)
+    _write_states(json_file, records)
+    with open(borders_file, "w") as f:
+        json.dump({"AL": ["BE"], "BE": [], "GA": [], "ZZ": ["AL"]}, f)
+
+    stats = load_states(db_file, json_file, borders_file=borders_file)
+    assert stats["borders"] == 1
+
+    engine = sa.create_engine(f"sqlite:///{db_file}")
+    with engine.connect() as conn:
+        borders = conn.execute(sa.text("SELECT state, neighbor FROM state_borders ORDER BY state")).all()
+        metrics = conn.execute(sa.text(
+            "SELECT name, population_density, water_share, population_rank, area_rank, density_rank, "
+            "water_share_rank FROM state_metrics ORDER BY name"
+        )).all()
+        indexes = {row[1] for row in conn.execute(sa.text("PRAGMA index_list('state_metrics')"))}
+    assert [tuple(row) for row in borders] == [("Alpha", "Beta"), ("Beta", "Alpha")]
+    assert [tuple(row) for row in metrics] == [
+        ("Alpha", 100.0, 0.5, 3, 3, 2, 1),
+        ("Beta", 40.0, 0.0, 1, 1, 3, 3),
+        ("Gamma", 150.0, 0.2, 2, 2, 1, 2),
+    ]
+    assert "ix_state_metrics_density_rank" in indexes
+
+    # Rebuilding replaces the rows instead of adding to them
+    assert build_derived_tables(engine, borders_file)["borders"] == 1
+    with engine.connect() as conn:
+        assert conn.execute(sa.text("SELECT COUNT(*) FROM state_metrics")).scalar() == 3
+    engine.dispose()
@@ -0,0 +1,122 @@
+# test_fanout.py
+import time
+from types import SimpleNamespace
+
+from fanout import FanOutExecutor, FanOutPlanner
+
+STATES = ["California", "New York", "Texas"]
+
+
+class SlowEngine:
+    def __init__(self, answer, delay):
+        self.answer = answer
+        self.delay = delay
+        self.questions = []
+
+    def query(self, question):
+        self.questions.append(question)
+        time.sleep(self.delay)
+        return self.answer
+
+
+class FailingEngine:
+    def query(self, question):
+        raise RuntimeError("index unavailable")
+
+
+class EchoLLM:
+    def __init__(self):
+        self.prompts = []
+
+    def complete(self, prompt):
+        self.prompts.append(prompt)
+        return SimpleNamespace(text="combined answer")
+
+
+def test_plan_splits_compound_question():
+    """A question needing both sources gets one sub-question per engine"""
+    plan = FanOutPlanner(STATES).plan("What is the population of new york and its history?")
+    assert plan == {
+        "sql": "What is the population of new york and its history? "
+               "(Answer only the population of New York.)",
+        "documents": "What is the population of new york and its history? "
+                     "(Describe only the history of New York.)",
+    }
+
+
+def test_plan_keeps_qualifiers_of_the_question():
+    """Each branch sees the question as asked, so a year or other qualifier is not dropped"""
+    plan = FanOutPlanner(STATES).plan("What was the population of Texas in 1900 and its history?")
+    assert "in 1900" in plan["sql"] and "in 1900" in plan["documents"]
+
+
+def test_plan_skips_single_source_questions():
+    """Questions answered by one source stay with the agent"""
+    planner = FanOutPlanner(STATES)
+    assert planner.plan("What is the capital of Texas?") is None
+    assert planner.plan("Tell me about the history of Texas") is None
+
+
+def test_parallel_branches_beat_sequential():
+    """Both branches run at once, so retrieval costs about the slower branch"""
+    llm = EchoLLM()
+    parallel = FanOutExecutor(SlowEngine("39 million", 0.3), SlowEngine("Gold rush", 0.3), llm)
+    plan = {"sql": "population?", "documents": "history?"}
+
+    result = parallel.run("question", plan)
+    assert result["response"] == "combined answer"
+    assert result["retrieval_seconds"] < 0.5
+    assert result["saved_seconds"] > 0.1
+    assert "39 million" in llm.prompts[0] and "Gold rush" in llm.prompts[0]
+
+    sequential = FanOutExecutor(
+        SlowEngine("39 million", 0.3), SlowEngine("Gold rush", 0.3), llm, parallel=False
+    )
+    assert sequential.run("question", plan)["retrieval_seconds"] >= 0.6
+
+
+def test_slow_branch_times_out_without_blocking_sql():
+    """A slow document branch is cut off and the SQL answer still gets through"""
+    llm = EchoLLM()
+    executor = FanOutExecutor(
+        SlowEngine("39 million", 0.0), SlowEngine("late", 2.0), llm, branch_timeout=0.2
+    )
+    start = time.perf_counter()
+    result = executor.run("question", {"sql": "population?", "documents": "history?"})
+
+    assert time.perf_counter() - start < 1.0
+    assert result["branches"]["sql"]["status"] == "ok"
+    assert result["branches"]["documents"]["status"] == "timeout"
+    assert "39 million" in llm.prompts[0]
+
+
+def test_timed_out_branches_do_not_starve_later_runs():
+    """Branches still running after a timeout are capped, so later runs skip that engine"""
+    llm = EchoLLM()
+    documents = SlowEngine("late", 1.0)
+    executor = FanOutExecutor(
+        SlowEngine("39 million", 0.0), documents, llm, branch_timeout=0.2, max_workers=2, max_stuck=1
+    )
+    plan = {"sql": "population?", "documents": "history?"}
+    assert executor.run("question", plan)["branches"]["documents"]["status"] == "timeout"
+
+    start = time.perf_counter()
+    result = executor.run("question", plan)
+    assert time.perf_counter() - start < 0.2
+    assert result["branches"]["sql"]["status"] == "ok"
+    assert result["branches"]["documents"]["status"] == "skipped"
+    assert len(documents.questions) == 1
+
+    time.sleep(1.0)
+    assert executor.run("question", plan)["branches"]["documents"]["status"] == "timeout"
+    assert len(documents.questions) == 2
+
+
+def test_branch_error_is_reported_to_synthesis():
+    """A failing branch is described to the synthesis step instead of raising"""
+    llm = EchoLLM()
+    executor = FanOutExecutor(SlowEngine("39 million", 0.0), FailingEngine(), llm)
+    result = executor.run("question", {"sql": "population?", "documents": "history?"})
+
+    assert result["branches"]["documents"]["status"] == "error"
+    assert "index unavailable" in llm.prompts[0]
@@ -0,0 +1,82 @@
+# test_fast_path.py
+import pytest
+import sqlalchemy as sa
+
+from fast_path import FastPathRouter
+
+
+@pytest.fixture(scope="module")
+def router():
+    return FastPathRouter(sa.create_engine("sqlite:///states.db"))
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What is the capital of Texas?", "The capital of Texas is Austin."),
+    ("What's the postal code for West Virginia?", "The postal abbreviation of West Virginia is WV."),
+    ("What state is TX?", "TX is the postal abbreviation for Texas."),
+    ("Which state has the largest land area?", "Alaska has the largest land area, at 570,641 square miles."),
+    ("least populous state", "Wyoming has the smallest population, at 579,315."),
+    ("Which states border Florida?", "Florida borders Alabama and Georgia."),
+    ("What states are adjacent to Hawaii?", "Hawaii does not share a land border with any other state."),
+    ("Which state has the highest population density?",
+     "New Jersey has the largest population density, at 1,224.6 people per square mile."),
+    ("What is the population density of Alaska?", "The population density of Alaska is 1.3 people per square mile."),
+    ("Which of the 50 states has the largest population?", "California has the largest population, at 39,536,653."),
+    ("What is the largest city in Texas?", "The largest city of Texas is Houston."),
+    ("What is the area of water in Michigan?", "The water area of Michigan is 40,175 square miles."),
+    ("Which state has the smallest area of water?",
+     "West Virginia has the smallest water area, at 192 square miles."),
+    ("What is the size of the population of Texas", "The population of Texas is 28,304,596."),
+    ("How many states border Texas?", "Texas borders 4 states: Arkansas, Louisiana, New Mexico and Oklahoma."),
+])
+def test_structured_questions_are_answered(router, question, expected):
+    """Simple lookups and rankings are answered without the agent"""
+    assert router.route(question)["response"] == expected
+
+
+def test_top_n_ranking(router):
+    """Top-N questions return the requested number of ranked rows"""
+    result = router.route("What are the three most populous states?")
+    assert result["intent"] == "ranking"
+    assert result["response"].splitlines()[1:] == [
+        "1. California (39,536,653)",
+        "2. Texas (28,304,596)",
+        "3. Florida (20,984,400)",
+    ]
+    assert "LIMIT 3" in result["sql"]
+
+
+@pytest.mark.parametrize("question", [
+    "Tell me about California",
+    "What are popular tourist attractions in Hawaii?",
+    "What is the capital of Texas and Ohio?",
+    "What is the population of the states bordering Texas?",
+    "What is the capital of Georgia in 1800?",
+    "What is the population of New York City?",
+    "What is the population of Kansas City?",
+    "What is the population density of the largest state?",
+    "What is the capital of the most populous state?",
+    "What is the population of the smallest state?",
+    "What is the land area of the most populous state?",
+    "Which state has the largest land area to water area",
+    "What is the land area to water area of Michigan?",
+    "What are the largest states by population",
+])
+def test_unmatched_questions_fall_through(router, question):
+    """Anything the router does not fully understand goes to the agent"""
+    assert router.route(question) is None
+
+
+def test_derived_questions_fall_through_without_derived_tables(tmp_path):
+    """A database built before the derived tables leaves borders and density to the agent"""
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'states.db'}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE states (name TEXT, postal_abbreviation TEXT, population INTEGER)")
+        conn.exec_driver_sql("INSERT INTO states VALUES ('Florida', 'FL', 20984400)")
+    router = FastPathRouter(engine)
+
+    assert router.route("Which states border Florida?") is None
+    assert router.route("Which state has the highest population density?") is None
+    assert router.route("What is the population of Florida?")["response"] == (
+        "The population of Florida is 20,984,400."
+    )
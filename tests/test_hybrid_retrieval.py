@@ -0,0 +1,50 @@
+# test_hybrid_retrieval.py
+from llama_index.core import Document
+
+from benchmarks.bench_retrieval import run_benchmark
+from benchmarks.fakes import HashedEmbedding
+from hybrid_retrieval import BM25Index, HybridRetriever, reciprocal_rank_fusion
+from local_index import build_local_index
+
+DOCUMENTS = [
+    Document(text="Hawaii volcanoes beaches surfing and the Haleakala crater", metadata={"state": "Hawaii"}),
+    Document(text="Hawaii beaches surfing luau and volcanoes", metadata={"state": "Hawaii"}),
+    Document(text="Alaska glaciers tundra moose and volcanoes", metadata={"state": "Alaska"}),
+    Document(text="Arizona canyon desert cactus and the Haleakala cafe", metadata={"state": "Arizona"}),
+]
+
+
+def test_bm25_ranks_rare_terms_and_respects_candidates():
+    """Rare terms outweigh common ones and scoring stays inside the candidate rows"""
+    bm25 = BM25Index([document.text for document in DOCUMENTS])
+
+    assert [row for row, _ in bm25.search("haleakala crater")] == [0, 3]
+    assert [row for row, _ in bm25.search("haleakala", candidates=[2, 3])] == [3]
+    assert bm25.search("the and") == []
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    """A row ranked by both lists beats rows that only one list found"""
+    fused = reciprocal_rank_fusion([[(1, 9.0), (2, 5.0)], [(3, 0.9), (2, 0.8)]])
+    assert [row for row, _ in fused] == [2, 1, 3]
+
+
+def test_hybrid_retriever_prefilters_named_states(tmp_path):
+    """Named states narrow both searches, and exact terms are found by the BM25 half"""
+    index = build_local_index(DOCUMENTS, HashedEmbedding(dim=8), index_dir=tmp_path, cache_file=None)
+    retriever = HybridRetriever(index, similarity_top_k=2)
+
+    assert retriever.detect_states("volcanoes in hawaii or alaska?") == ["Hawaii", "Alaska"]
+    nodes = retriever.retrieve("Where is the Haleakala crater in Hawaii?")
+    assert {node.node.metadata["state"] for node in nodes} == {"Hawaii"}
+    assert "Haleakala crater" in nodes[0].node.text
+    assert index.as_retriever(similarity_top_k=1, mode="bm25").retrieve("cactus")[0].node.metadata["state"] == "Arizona"
+
+
+def test_benchmark_reports_recall_against_pure_vector_search():
+    """Hybrid retrieval recalls exact-term questions at least as well as vectors alone"""
+    results = run_benchmark(["Ohio", "Texas", "Utah"], chunks_per_state=8, queries=12, top_k=3, dim=32)
+
+    for kind in ["landmark", "landmark_in_state"]:
+        assert results[f"hybrid.{kind}"]["recall_at_3"] >= results[f"vector.{kind}"]["recall_at_3"]
+        assert results[f"bm25.{kind}"]["n"] == 12
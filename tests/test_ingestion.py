@@ -0,0 +1,147 @@
+# test_ingestion.py
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ingestion import IngestionPipeline, iter_chunks
+from rate_limit import TokenBucket
+
+
+def fake_extract(pdf_path):
+    """Stand-in for PDF chunk extraction that runs in a worker process"""
+    with open(pdf_path, "rb") as f:
+        for page, text in enumerate(f.read().decode().split(" and "), start=1):
+            yield text.upper(), page
+
+
+def flaky_extract(pdf_path):
+    """Extraction that breaks on one document, as a corrupt PDF would"""
+    if "Alaska" in pdf_path:
+        raise ValueError("corrupt PDF")
+    yield from fake_extract(pdf_path)
+
+
+def _texts(records):
+    return {r["name"]: [c["text"] for c in iter_chunks(r["chunks_path"])] for r in records}
+
+
+class FakeWikipedia(BaseHTTPRequestHandler):
+    """Serves one small 'PDF' per title with ETag support"""
+    pages = {}
+    requests = []
+
+    def do_GET(self):
+        title = self.path.rsplit("/", 1)[-1]
+        self.requests.append(title)
+        body = self.pages.get(title)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    FakeWikipedia.pages = {
+        "Hawaii_(state)": b"aloha volcanoes",
+        "Alaska_(state)": b"glaciers",
+        "Arizona_(state)": b"canyon",
+    }
+    FakeWikipedia.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeWikipedia)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}/page/pdf/"
+    httpd.shutdown()
+
+
+def test_incremental_ingestion(server, tmp_path):
+    """Unchanged pages are skipped on the second run and changed ones refetched"""
+    pages = {name: f"{name} (state)" for name in ["Hawaii", "Alaska", "Arizona"]}
+    pipeline = IngestionPipeline(fake_extract, pdf_dir=tmp_path, base_url=server, rate=100, processes=2)
+    records, stats = pipeline.run(pages)
+
+    assert stats["downloaded"] == 3
+    assert stats["bytes"] == len(b"aloha volcanoes") + len(b"glaciers") + len(b"canyon")
+    assert stats["pages_per_sec"] > 0 and stats["bytes_per_sec"] > 0
+    assert _texts(records)["Hawaii"] == ["ALOHA VOLCANOES"]
+
+    FakeWikipedia.pages["Alaska_(state)"] = b"glaciers and moose"
+    pipeline = IngestionPipeline(fake_extract, pdf_dir=tmp_path, base_url=server, rate=100, processes=0)
+    records, stats = pipeline.run(pages)
+
+    assert stats["downloaded"] == 1
+    assert stats["unchanged"] == 2
+    texts = _texts(records)
+    assert texts["Alaska"] == ["GLACIERS", "MOOSE"]
+    assert texts["Hawaii"] == ["ALOHA VOLCANOES"]
+    assert {r["name"]: r["chunks"] for r in records} == {"Hawaii": 1, "Alaska": 2, "Arizona": 1}
+
+
+def test_failed_pages_are_reported(server, tmp_path):
+    """Missing pages are counted as failures without stopping the run"""
+    pipeline = IngestionPipeline(fake_extract, pdf_dir=tmp_path, base_url=server, rate=100, processes=0)
+    records, stats = pipeline.run({"Hawaii": "Hawaii (state)", "Atlantis": "Atlantis (state)"})
+
+    assert stats["downloaded"] == 1
+    assert stats["failed"] == 1
+    assert stats["errors"] == {"Atlantis": "HTTP 404"}
+
+
+def test_extraction_errors_are_collected_per_page(server, tmp_path):
+    """A page that fails to extract is reported while the others finish and are remembered"""
+    pages = {name: f"{name} (state)" for name in ["Hawaii", "Alaska", "Arizona"]}
+    pipeline = IngestionPipeline(flaky_extract, pdf_dir=tmp_path, base_url=server, rate=100, processes=0)
+    records, stats = pipeline.run(pages)
+
+    assert stats["downloaded"] == 2
+    assert stats["failed"] == 1
+    assert stats["errors"] == {"Alaska": "ValueError: corrupt PDF"}
+    assert _texts([r for r in records if r["status"] != "failed"])["Arizona"] == ["CANYON"]
+
+    FakeWikipedia.requests = []
+    pipeline = IngestionPipeline(fake_extract, pdf_dir=tmp_path, base_url=server, rate=100, processes=0)
+    records, stats = pipeline.run(pages)
+    assert (stats["unchanged"], stats["downloaded"], stats["failed"]) == (2, 1, 0)
+    assert _texts(records)["Alaska"] == ["GLACIERS"]
+
+
+def test_failed_extraction_does_not_keep_stale_chunks(server, tmp_path):
+    """A changed page that fails to extract is downloaded again instead of serving its old chunks"""
+    pages = {"Alaska": "Alaska (state)"}
+    IngestionPipeline(fake_extract, pdf_dir=tmp_path, base_url=server, rate=100, processes=0).run(pages)
+
+    FakeWikipedia.pages["Alaska_(state)"] = b"glaciers and moose"
+    pipeline = IngestionPipeline(flaky_extract, pdf_dir=tmp_path, base_url=server, rate=100, processes=0)
+    records, stats = pipeline.run(pages)
+    assert stats["failed"] == 1
+    assert not (tmp_path / "Alaska_state.chunks.jsonl").exists()
+
+    pipeline = IngestionPipeline(fake_extract, pdf_dir=tmp_path, base_url=server, rate=100, processes=0)
+    records, stats = pipeline.run(pages)
+    assert stats["downloaded"] == 1
+    assert _texts(records)["Alaska"] == ["GLACIERS", "MOOSE"]
+
+
+def test_token_bucket_limits_rate():
+    """Acquiring beyond the burst waits for tokens to refill"""
+    bucket = TokenBucket(rate=50, capacity=2)
+    waits = [bucket.acquire() for _ in range(4)]
+
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[3] > 0
@@ -0,0 +1,44 @@
+# test_lazy_engine.py
+import threading
+import time
+
+from lazy_engine import LazyQueryEngine
+
+
+class FakeEngine:
+    def query(self, question):
+        return f"answer to {question}"
+
+
+def test_engine_is_built_on_first_query():
+    """Creating the wrapper does not build the engine; the first query does"""
+    built = []
+
+    def factory():
+        built.append(1)
+        return FakeEngine()
+
+    engine = LazyQueryEngine(factory)
+    assert not engine.is_built and built == []
+
+    assert engine.query("Texas") == "answer to Texas"
+    assert engine.query("Ohio") == "answer to Ohio"
+    assert engine.is_built and built == [1]
+
+
+def test_concurrent_first_queries_build_once():
+    """Queries racing on a cold engine share a single build"""
+    built = []
+
+    def factory():
+        built.append(1)
+        time.sleep(0.1)
+        return FakeEngine()
+
+    engine = LazyQueryEngine(factory)
+    threads = [threading.Thread(target=engine.query, args=("Texas",)) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert built == [1]
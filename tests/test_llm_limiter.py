@@ -0,0 +1,182 @@
+# test_llm_limiter.py
+import threading
+import time
+
+import pytest
+
+from llm_limiter import CircuitBreaker, CircuitOpenError, LLMLimiter, is_retryable
+
+
+class ProviderError(Exception):
+    """Stand-in for google.genai.errors.APIError, which carries the HTTP status as ``code``"""
+
+    def __init__(self, code):
+        super().__init__(f"{code} RESOURCE_EXHAUSTED" if code == 429 else f"{code} error")
+        self.code = code
+
+
+def flaky(failures, error=None, result="ok"):
+    """Return a function that raises ``failures`` times before returning ``result``"""
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise error or ProviderError(429)
+        return result
+
+    fn.calls = calls
+    return fn
+
+
+def test_retryable_errors():
+    """Rate limits, overload and timeouts are retried; bad requests are not"""
+    assert is_retryable(ProviderError(429))
+    assert is_retryable(ProviderError(503))
+    assert is_retryable(TimeoutError())
+    assert is_retryable(RuntimeError("429 Too Many Requests"))
+    assert not is_retryable(ProviderError(400))
+    assert not is_retryable(ValueError("bad prompt"))
+    assert not is_retryable(CircuitOpenError())
+
+
+def test_retries_with_backoff_until_success():
+    """Transient failures are retried and counted, and the caller gets the result"""
+    limiter = LLMLimiter(max_retries=3, base_backoff=0.001, max_backoff=0.01)
+    fn = flaky(2)
+
+    assert limiter.call(fn) == "ok"
+    assert len(fn.calls) == 3
+    stats = limiter.stats()
+    assert stats["retries"] == 2
+    assert stats["succeeded"] == 1
+    assert stats["breaker"]["state"] == "closed"
+
+
+def test_gives_up_after_max_retries_and_on_permanent_errors():
+    """Retries are bounded, and errors that cannot succeed later are raised at once"""
+    limiter = LLMLimiter(max_retries=2, base_backoff=0.001, breaker=CircuitBreaker(failure_threshold=10))
+    with pytest.raises(ProviderError):
+        limiter.call(flaky(5))
+
+    permanent = flaky(1, error=ProviderError(400))
+    with pytest.raises(ProviderError):
+        limiter.call(permanent)
+    assert len(permanent.calls) == 1
+    assert limiter.stats()["failed"] == 2
+
+
+def test_circuit_opens_fails_fast_and_recovers():
+    """Repeated failures open the circuit; after the reset timeout one trial call closes it"""
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.1)
+    limiter = LLMLimiter(max_retries=5, base_backoff=0.001, breaker=breaker)
+    failing = flaky(100)
+
+    with pytest.raises(CircuitOpenError) as raised:
+        limiter.call(failing)
+    assert isinstance(raised.value.__cause__, ProviderError)
+    assert len(failing.calls) == 3  # stopped retrying as soon as the circuit opened
+    assert breaker.is_open
+
+    with pytest.raises(CircuitOpenError):
+        limiter.call(flaky(0))
+    assert limiter.stats()["rejected"] == 1
+
+    time.sleep(0.15)
+    assert breaker.state == "half_open"
+    assert limiter.call(flaky(0)) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_failed_trial_reopens_circuit():
+    """A trial call that fails opens the circuit again straight away"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # only one trial at a time
+    breaker.record_failure()
+    assert breaker.is_open
+    assert breaker.stats()["opened"] == 2
+
+
+def test_concurrency_cap_and_queue_wait():
+    """No more than max_concurrency calls run at once; the rest wait and the wait is measured"""
+    limiter = LLMLimiter(max_concurrency=2)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def slow_call():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+        return "ok"
+
+    threads = [threading.Thread(target=limiter.call, args=(slow_call,)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) == 2
+    stats = limiter.stats()
+    assert stats["succeeded"] == 6
+    assert stats["in_flight"] == 0
+    assert stats["queue_wait_max_ms"] >= 40
+
+
+def test_token_budget_throttles_calls():
+    """Calls wait for the token budget, and a prompt larger than the budget is clamped to it"""
+    limiter = LLMLimiter(tpm=6000)  # 100 tokens per second
+    limiter.call(flaky(0), tokens=10000)
+
+    start = time.perf_counter()
+    limiter.call(flaky(0), tokens=10)
+    assert time.perf_counter() - start >= 0.08
+    assert limiter.stats()["throttle_seconds"] >= 0.08
+
+
+def test_stream_retries_until_first_chunk():
+    """Opening a stream is retried; chunks are passed through and the slot is released at the end"""
+    limiter = LLMLimiter(max_concurrency=1, base_backoff=0.001)
+    attempts = []
+
+    def open_stream():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ProviderError(503)
+        return iter(["Volcanoes", " and beaches"])
+
+    assert list(limiter.stream(open_stream)) == ["Volcanoes", " and beaches"]
+    assert limiter.stats()["retries"] == 1
+    assert limiter.stats()["in_flight"] == 0
+    assert limiter.call(flaky(0)) == "ok"  # the only slot was given back
+
+
+def test_limited_llm_wraps_fake_llm():
+    """LimitedLLM retries a rate-limited local LLM and keeps its metadata"""
+    from llama_index.core.llms import ChatMessage, MockLLM
+
+    from limited_llm import LimitedLLM
+
+    class RateLimitedLLM(MockLLM):
+        def complete(self, prompt, formatted=False, **kwargs):
+            if not getattr(self, "_failed", False):
+                object.__setattr__(self, "_failed", True)
+                raise ProviderError(429)
+            return super().complete(prompt, formatted=formatted, **kwargs)
+
+    inner = RateLimitedLLM(max_tokens=4)
+    llm = LimitedLLM(inner, LLMLimiter(base_backoff=0.001))
+
+    assert llm.complete("Which state is largest?").text
+    assert llm.chat([ChatMessage(role="user", content="Hello")]).message.content
+    assert llm.metadata == inner.metadata
+    assert llm.limiter.stats()["retries"] == 1
+    assert llm.limiter.stats()["succeeded"] == 2
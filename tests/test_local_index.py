@@ -0,0 +1,98 @@
+# test_local_index.py
+import hashlib
+
+import numpy as np
+from llama_index.core import Document
+from llama_index.core.embeddings import BaseEmbedding
+
+from local_index import LocalVectorIndex, build_local_index
+
+
+class HashEmbedding(BaseEmbedding):
+    """Deterministic bag-of-words embedding for offline tests"""
+
+    def _embed(self, text):
+        vector = np.zeros(64, dtype=np.float32)
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % 64] += 1.0
+        return vector.tolist()
+
+    def _get_query_embedding(self, query):
+        return self._embed(query)
+
+    def _get_text_embedding(self, text):
+        return self._embed(text)
+
+    async def _aget_query_embedding(self, query):
+        return self._embed(query)
+
+
+DOCUMENTS = [
+    Document(text="volcanoes beaches surfing luau", metadata={"state": "Hawaii"}),
+    Document(text="glaciers tundra moose salmon", metadata={"state": "Alaska"}),
+    Document(text="canyon desert cactus saguaro", metadata={"state": "Arizona"}),
+]
+
+
+def test_build_and_search(tmp_path):
+    """The best match for a query is the chunk that shares its words"""
+    index = build_local_index(DOCUMENTS, HashEmbedding(), index_dir=tmp_path, batch_size=2)
+
+    assert isinstance(index.embeddings, np.memmap)
+    retriever = index.as_retriever(similarity_top_k=2)
+    nodes = retriever.retrieve("glaciers and salmon")
+    assert len(nodes) == 2
+    assert nodes[0].node.metadata["state"] == "Alaska"
+    assert nodes[0].score >= nodes[1].score
+
+
+def test_state_prefilter_and_batched_queries(tmp_path):
+    """State filters restrict candidates and several queries search at once"""
+    build_local_index(DOCUMENTS, HashEmbedding(), index_dir=tmp_path)
+    index = LocalVectorIndex(tmp_path, HashEmbedding(), block_rows=1)
+    embed = HashEmbedding()
+
+    results = index.search(
+        [embed.get_query_embedding("volcanoes"), embed.get_query_embedding("canyon")], top_k=1
+    )
+    assert [index.chunks[hits[0][0]]["metadata"]["state"] for hits in results] == ["Hawaii", "Arizona"]
+
+    filtered = index.search([embed.get_query_embedding("volcanoes")], top_k=3, state="Arizona")[0]
+    assert [index.chunks[row]["metadata"]["state"] for row, _ in filtered] == ["Arizona"]
+    assert index.search([embed.get_query_embedding("volcanoes")], state="Ohio") == [[]]
+
+
+class CountingEmbedding(HashEmbedding):
+    """HashEmbedding that records every text it is asked to embed"""
+
+    texts: list = []
+
+    def _get_text_embeddings(self, texts):
+        self.texts.extend(texts)
+        return [self._embed(text) for text in texts]
+
+
+def test_rebuild_embeds_only_changed_chunks(tmp_path):
+    """Unchanged chunks reuse stored vectors and vectors of removed chunks are dropped"""
+    build_local_index(DOCUMENTS, CountingEmbedding(), index_dir=tmp_path, batch_size=2)
+
+    embed = CountingEmbedding()
+    documents = [
+        DOCUMENTS[0],
+        Document(text="glaciers tundra moose caribou", metadata={"state": "Alaska"}),
+    ]
+    index = build_local_index(documents, embed, index_dir=tmp_path, batch_size=2)
+
+    assert embed.texts == ["glaciers tundra moose caribou"]
+    stats = index.info["embedding_cache"]
+    assert (stats["chunks"], stats["reused"], stats["embedded"]) == (2, 1, 1)
+    assert stats["reuse_ratio"] == 0.5
+    assert (stats["deleted"], stats["entries"]) == (2, 2)
+    nodes = index.as_retriever(similarity_top_k=1).retrieve("caribou")
+    assert nodes[0].node.metadata["state"] == "Alaska"
+
+    # A third identical run makes no embedding calls at all
+    embed = CountingEmbedding()
+    stats = build_local_index(documents, embed, index_dir=tmp_path, batch_size=2).info["embedding_cache"]
+    assert embed.texts == []
+    assert (stats["embedding_calls"], stats["embedding_calls_saved"], stats["reuse_ratio"]) == (0, 1, 1.0)
@@ -0,0 +1,94 @@
+# test_model_cascade.py
+from types import SimpleNamespace
+
+import pytest
+
+from escalating_engine import EscalatingQueryEngine
+from llm_limiter import CircuitOpenError
+from model_cascade import DEFAULT_STAGE_MODELS, ModelCascade, parse_stage_models, sql_failure
+
+
+class FakeEngine:
+    def __init__(self, response=None, error=None):
+        self.response = response
+        self.error = error
+        self.questions = []
+
+    def query(self, question):
+        self.questions.append(question)
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+
+def sql_response(text, **metadata):
+    return SimpleNamespace(response=text, metadata=metadata)
+
+
+def test_parse_stage_models():
+    """Stages default to the large model and unknown stages or tiers are refused"""
+    assert parse_stage_models(DEFAULT_STAGE_MODELS) == {
+        "planning": "fast", "sql": "fast", "documents": "fast", "synthesis": "large"
+    }
+    assert parse_stage_models("sql=fast") == {
+        "planning": "large", "sql": "fast", "documents": "large", "synthesis": "large"
+    }
+    with pytest.raises(ValueError):
+        parse_stage_models("routing=fast")
+    with pytest.raises(ValueError):
+        parse_stage_models("sql=medium")
+
+
+def test_sql_failure_detects_errors_and_empty_results():
+    """SQL that failed to run or returned no rows fails validation"""
+    assert sql_failure(sql_response("Error: near 'SELEC'", sql_query="SELEC 1")) == "sql_error"
+    assert sql_failure(sql_response("No rows", sql_query="SELECT 1", result=[])) == "empty_result"
+    assert sql_failure(sql_response("Austin", sql_query="SELECT 1", result=[("Austin",)])) is None
+
+
+def test_escalates_only_when_cheap_answer_fails_validation():
+    """A valid cheap answer is kept; a failed one is redone by the escalation engine"""
+    reasons = []
+    good = sql_response("Austin", result=[("Austin",)])
+    strong = FakeEngine(sql_response("Sacramento", result=[("Sacramento",)]))
+
+    engine = EscalatingQueryEngine(FakeEngine(good), strong, sql_failure, reasons.append)
+    assert engine.query("Capital of Texas?") is good
+    assert strong.questions == []
+
+    engine = EscalatingQueryEngine(FakeEngine(sql_response("", result=[])), strong, sql_failure, reasons.append)
+    assert engine.query("Capital of Californa?").response == "Sacramento"
+
+    engine = EscalatingQueryEngine(FakeEngine(error=ValueError("bad SQL")), strong, sql_failure, reasons.append)
+    assert engine.query("Capital of California?").response == "Sacramento"
+    assert reasons == ["empty_result", "error: ValueError"]
+
+
+def test_open_circuit_is_not_escalated():
+    """Escalating would call the same unavailable provider, so the error is raised"""
+    strong = FakeEngine(sql_response("Sacramento", result=[("Sacramento",)]))
+    engine = EscalatingQueryEngine(FakeEngine(error=CircuitOpenError()), strong, sql_failure)
+    with pytest.raises(CircuitOpenError):
+        engine.query("Capital of California?")
+    assert strong.questions == []
+
+
+def test_stats_report_latency_escalations_and_savings():
+    """Costs are compared with what the same tokens would cost on the large model"""
+    cascade = ModelCascade(
+        parse_stage_models("sql=fast"), prices={"fast": (1.0, 2.0), "large": (10.0, 20.0)}
+    )
+    cascade.record("sql", "fast", 0.2, 1_000_000, 0)
+    cascade.record("sql", "large", 1.0, 1_000_000, 0)
+    cascade.record_escalation("sql", "empty_result")
+    cascade.record("synthesis", "large", 2.0, 0, 1_000_000)
+
+    stats = cascade.stats()
+    sql = stats["stages"]["sql"]
+    assert sql["calls"] == {"fast": 1, "large": 1}
+    assert sql["mean_ms"] == pytest.approx(600)
+    assert sql["mean_ms_by_tier"] == {"fast": pytest.approx(200), "large": pytest.approx(1000)}
+    assert sql["escalation_reasons"] == {"empty_result": 1}
+    assert stats["cost_usd"] == pytest.approx(1 + 10 + 20)
+    assert stats["large_model_cost_usd"] == pytest.approx(10 + 10 + 20)
+    assert stats["saved_usd"] == pytest.approx(9)
@@ -0,0 +1,94 @@
+# test_schema_context.py
+import re
+import shutil
+import sqlite3
+
+import pytest
+
+from database import create_read_engine
+from schema_context import SchemaContext, build_schema_context, build_schema_contexts, estimate_tokens
+from sql_guard import GuardedSQLDatabase
+
+
+@pytest.fixture
+def engine():
+    engine = create_read_engine("states.db")
+    yield engine
+    engine.dispose()
+
+
+def test_context_summarizes_live_columns(engine):
+    """Only real columns appear, with value ranges, samples and metric twins folded"""
+    text = build_schema_context(engine, token_budget=500)
+
+    assert "population (int 579315-39536653)" in text
+    assert "name (text e.g. 'Alabama', 'Alaska')" in text
+    assert "established (text e.g. 'Apr 28, 1788'" in text
+    assert "*_square_kilometers twin" in text
+    for absent in ["object_id", "created_at", "region", "median_household_income", "land_area_square_kilometers ("]:
+        assert absent not in text
+
+
+def test_context_fits_token_budget(engine):
+    """Smaller budgets drop samples, then ranges, then columns"""
+    full = build_schema_context(engine, token_budget=500)
+    compact = build_schema_context(engine, token_budget=100)
+    tiny = build_schema_context(engine, token_budget=20)
+
+    assert estimate_tokens(compact) <= 100 < estimate_tokens(full)
+    assert "e.g." not in compact
+    assert estimate_tokens(tiny) <= 20
+    assert tiny.startswith("SQLite table states, one row per US state: name (text)")
+    # Whole columns are dropped, never cut mid-name
+    assert tiny.endswith(" (text).")
+
+
+def test_all_tables_together_are_smaller_than_the_default_dump(engine):
+    """The budget covers every table at once and the result undercuts llama_index's column dump"""
+    from llama_index.core import SQLDatabase
+
+    context = SchemaContext(engine, "states.db")
+    tables = context.table_names()
+    default = "\n\n".join(SQLDatabase(engine, include_tables=tables).get_single_table_info(t) for t in tables)
+    generated = "\n\n".join(context.text(table) for table in tables)
+
+    assert estimate_tokens(generated) <= context.token_budget < estimate_tokens(default)
+    for budget in (60, 120):
+        texts = build_schema_contexts(engine, budget)
+        assert estimate_tokens("\n\n".join(texts.values())) <= budget
+        last = list(texts.values())[-1].split(" Each *_square_miles")[0]
+        assert re.search(r"\b[a-z_]+ \((?:text|int|real)\)\.$", last), last
+
+
+def test_context_is_rebuilt_when_database_changes(tmp_path):
+    """The cached text is reused until the database file's fingerprint changes"""
+    db_file = str(tmp_path / "states.db")
+    shutil.copy("states.db", db_file)
+    engine = create_read_engine(db_file)
+    context = SchemaContext(engine, db_file, token_budget=500)
+
+    before = context.text()
+    assert context.text() is before
+    assert context.stats()["builds"] == 1
+
+    with sqlite3.connect(db_file) as conn:
+        conn.execute("UPDATE states SET number_representatives = 60 WHERE name = 'California'")
+    assert "number_representatives (int 1-60)" in context.text()
+    assert context.stats()["builds"] == 2
+    engine.dispose()
+
+
+def test_guard_serves_context_to_text_to_sql(engine):
+    """GuardedSQLDatabase describes covered tables with the generated context"""
+    context = SchemaContext(engine, "states.db")
+    sql_database = GuardedSQLDatabase(engine, include_tables=context.table_names(), table_info=context.table_info)
+
+    assert context.table_names() == ["states", "state_borders", "state_metrics"]
+    assert sql_database.get_single_table_info("states") == context.text()
+    assert sql_database.get_single_table_info("state_metrics").startswith(
+        "SQLite table state_metrics, one row per US state, population_density is people per square mile"
+    )
+    assert "population_density (real)" in context.text("state_metrics")
+    assert context.topics().startswith("name, flag url, link, postal abbreviation, capital")
+    assert context.topics().endswith("; also bordering states, population density and ranks by population, "
+                                     "area and water share")
@@ -0,0 +1,102 @@
+# test_single_flight.py
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight, SingleFlightTimeout, question_key
+
+
+def test_concurrent_callers_share_one_execution():
+    """Only the first caller runs the function; the rest get its result"""
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def slow_query():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "Hawaii answer"
+
+    def worker():
+        results.append(flight.do("hawaii attraction", slow_query, timeout=5))
+
+    leader = threading.Thread(target=worker)
+    leader.start()
+    started.wait(5)
+    waiters = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in waiters:
+        thread.start()
+    while flight.stats()["coalesced"] < 4:
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader] + waiters:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(results) == [("Hawaii answer", False)] + [("Hawaii answer", True)] * 4
+    assert flight.stats()["executions"] == 1
+    assert flight.stats()["coalesced"] == 4
+    assert flight.in_flight() == 0
+
+
+def test_errors_propagate_to_all_waiters():
+    """Waiters receive the leader's exception instead of a result"""
+    flight = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def failing_query():
+        release.wait(5)
+        raise RuntimeError("provider unavailable")
+
+    def worker():
+        try:
+            flight.do("key", failing_query, timeout=5)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while flight.stats()["calls"] < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert errors == ["provider unavailable"] * 3
+    assert flight.stats()["errors"] == 1
+
+
+def test_waiter_times_out():
+    """A waiter gives up after its timeout while the leader keeps running"""
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_query():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    leader = threading.Thread(target=lambda: flight.do("key", slow_query))
+    leader.start()
+    started.wait(5)
+    with pytest.raises(SingleFlightTimeout):
+        flight.do("key", slow_query, timeout=0.05)
+    release.set()
+    leader.join()
+
+    assert flight.stats()["timeouts"] == 1
+    assert flight.do("key", lambda: "fresh") == ("fresh", False)
+
+
+def test_question_key_folds_only_case_whitespace_and_punctuation():
+    """Rewordings share a key only when they are the same question"""
+    assert question_key("  What is the capital of TEXAS? ") == question_key("what is the capital of texas")
+    assert question_key("Why did Hawaii become a state?") != question_key("When did Hawaii become a state?")
+    assert question_key("Which states border Florida?") != question_key("Which states don't border Florida?")
@@ -0,0 +1,137 @@
+# test_sql_cache.py
+import os
+import shutil
+import sqlite3
+
+from llama_index.core.embeddings import MockEmbedding
+
+from benchmarks.fakes import ScriptedLLM
+from cached_sql_engine import CachedNLSQLTableQueryEngine
+from database import create_read_engine
+from sql_cache import SQLResultCache, normalize_sql
+from sql_guard import GuardedSQLDatabase
+
+
+def test_normalize_folds_case_whitespace_and_literal_order():
+    """Statements differing only in formatting share a key; quoted tokens keep their case"""
+    a = normalize_sql("SELECT name, population\nFROM states WHERE name IN ('Texas', 'Ohio');")
+    b = normalize_sql("select name,population from STATES where NAME in ('Ohio','Texas')")
+    assert a == b == "select name,population from states where name in('Ohio','Texas')"
+    assert normalize_sql("SELECT 1 WHERE name = 'texas'") != normalize_sql("SELECT 1 WHERE name = 'Texas'")
+    # SQLite reads "Texas" as a string literal, so "TEXAS" matches different rows
+    assert normalize_sql('SELECT 1 WHERE name = "TEXAS"') != normalize_sql('SELECT 1 WHERE name = "Texas"')
+
+
+def test_cache_is_bounded_and_counts_rows_and_answers_separately(tmp_path):
+    """The least recently used statement is evicted and each kind of lookup has its own hit rate"""
+    db_file = str(tmp_path / "states.db")
+    shutil.copy("states.db", db_file)
+    cache = SQLResultCache(db_file, max_entries=2)
+    metadata = {"result": [("Austin",)], "col_keys": ["capital"], "truncated": False}
+
+    cache.put_rows("SELECT 1", "[(1,)]", metadata)
+    cache.put_rows("SELECT 2", "[(2,)]", metadata)
+    assert cache.get_rows("select 1") is not None
+    cache.put_rows("SELECT 3", "[(3,)]", metadata)
+    assert cache.get_rows("SELECT 2") is None
+    assert cache.get_answer("SELECT 1", "What is the capital of Texas?") is None
+    cache.put_answer("SELECT 1", "What is the capital of Texas?", "Austin")
+    assert cache.get_answer("SELECT  1;", "what is the capital of  Texas") == "Austin"
+
+    stats = cache.stats()
+    assert (stats["entries"], stats["evictions"]) == (2, 1)
+    assert (stats["row_hits"], stats["row_misses"], stats["row_hit_rate"]) == (1, 1, 0.5)
+    assert (stats["answer_hits"], stats["answer_misses"]) == (1, 1)
+
+
+def test_answers_are_kept_per_question_for_the_same_statement(tmp_path):
+    """Another question behind the same SQL shares the rows, not the prose written for the first"""
+    db_file = str(tmp_path / "states.db")
+    shutil.copy("states.db", db_file)
+    cache = SQLResultCache(db_file, max_answers=2)
+    statement = "SELECT population FROM states WHERE name = 'Texas'"
+    cache.put_rows(statement, "[(28304596,)]", {"result": [(28304596,)]})
+    cache.put_answer(statement, "What is the population of Texas?", "Texas has 28,304,596 people.")
+
+    assert cache.get_answer(statement, "Is Texas's population over 20 million?") is None
+    cache.put_answer(statement, "Is Texas's population over 20 million?", "Yes, about 28.3 million.")
+    cache.put_answer(statement, "How many people live in Texas?", "28,304,596.")
+    assert cache.get_answer(statement, "Is Texas's population over 20 million?") == "Yes, about 28.3 million."
+    assert cache.get_answer(statement, "What is the population of Texas?") is None  # beyond max_answers
+    assert cache.get_rows(statement)[1]["result"] == [(28304596,)]
+
+
+def test_guarded_rows_are_reused_until_the_database_changes(tmp_path):
+    """A reformatted statement is served from the cache until states.db is rewritten"""
+    db_file = str(tmp_path / "states.db")
+    shutil.copy("states.db", db_file)
+    engine = create_read_engine(db_file)
+    cache = SQLResultCache(db_file)
+    sql_database = GuardedSQLDatabase(engine, include_tables=["states"], result_cache=cache)
+    statements = engine.query_stats.count
+
+    _, first = sql_database.run_sql("SELECT capital FROM states WHERE name = 'Texas'")
+    first["sql_query"] = "added by the caller"
+    _, second = sql_database.run_sql("select capital\n  from states where name='Texas';")
+    assert second == {"result": [("Austin",)], "col_keys": ["capital"], "truncated": False}
+    assert engine.query_stats.count - statements == 2  # EXPLAIN QUERY PLAN and the statement, once
+
+    with sqlite3.connect(db_file) as conn:
+        conn.execute("UPDATE states SET capital = 'Houston' WHERE name = 'Texas'")
+    _, third = sql_database.run_sql("SELECT capital FROM states WHERE name = 'Texas'")
+    assert third["result"] == [("Houston",)]
+    assert cache.stats()["invalidations"] == 1
+    engine.dispose()
+
+
+def test_rows_read_before_a_swap_are_not_cached_after_it(tmp_path):
+    """After db_creator-style os.replace the cache refills from the new file, never the old one"""
+    db_file = str(tmp_path / "states.db")
+    shutil.copy("states.db", db_file)
+    engine = create_read_engine(db_file, pool_size=1, max_overflow=0)
+    cache = SQLResultCache(db_file)
+    sql_database = GuardedSQLDatabase(engine, include_tables=["states"], result_cache=cache)
+    statement = "SELECT population FROM states WHERE name = 'Texas'"
+    assert sql_database.run_sql(statement)[1]["result"] == [(28304596,)]
+
+    before = cache.fingerprint()
+    replacement = str(tmp_path / "states.db.tmp")
+    shutil.copy(db_file, replacement)
+    conn = sqlite3.connect(replacement)
+    with conn:
+        conn.execute("UPDATE states SET population = 1 WHERE name = 'Texas'")
+    conn.close()  # checkpoints the WAL into the file, as db_creator does before its swap
+    os.replace(replacement, db_file)
+
+    cache.put_rows("SELECT 1", "[(1,)]", {"result": [(1,)]}, fingerprint=before)
+    cache.put_answer("SELECT 2", "SELECT 2?", "no rows behind this answer")
+    assert cache.get_rows("SELECT 1") is None and cache.get_answer("SELECT 2", "SELECT 2?") is None
+    assert cache.stats()["stale_puts"] == 2
+    assert sql_database.run_sql(statement)[1]["result"] == [(1,)]
+    assert cache.get_rows(statement)[1]["result"] == [(1,)]
+    engine.dispose()
+
+
+def test_engine_skips_synthesis_only_for_a_repeated_question():
+    """A repeated question skips synthesis; another phrasing of the same SQL reuses only the rows"""
+    engine = create_read_engine("states.db")
+    cache = SQLResultCache("states.db")
+    llm = ScriptedLLM(state_names=["Texas"])
+    query_engine = CachedNLSQLTableQueryEngine(
+        sql_database=GuardedSQLDatabase(engine, include_tables=["states"], result_cache=cache),
+        tables=["states"], llm=llm, embed_model=MockEmbedding(embed_dim=8), result_cache=cache,
+    )
+
+    first = query_engine.query("What is the capital of Texas?")
+    assert llm.calls == 2  # SQL generation and synthesis
+    second = query_engine.query("what is the capital of Texas")
+    assert llm.calls == 3  # SQL generation only
+    assert second.response == first.response
+    assert second.metadata["sql_cache"] == "hit"
+    third = query_engine.query("Texas capital?")
+    assert llm.calls == 5  # SQL generation and synthesis for the new wording
+    assert "sql_cache" not in third.metadata
+    assert third.metadata["result"] == first.metadata["result"]
+    stats = cache.stats()
+    assert (stats["answer_hits"], stats["row_hits"]) == (1, 2)
+    engine.dispose()
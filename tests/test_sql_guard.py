@@ -0,0 +1,65 @@
+# test_sql_guard.py
+import pytest
+
+from database import create_read_engine
+from sql_guard import GuardedSQLDatabase, SQLGuardError
+
+
+@pytest.fixture
+def sql_database():
+    engine = create_read_engine("states.db")
+    yield GuardedSQLDatabase(engine, include_tables=["states"], max_rows=5, time_budget=0.2)
+    engine.dispose()
+
+
+def test_limit_added_and_rows_truncated(sql_database):
+    """Unbounded selects get a LIMIT and only max_rows rows come back"""
+    text, metadata = sql_database.run_sql("SELECT name FROM states ORDER BY population DESC;")
+
+    assert metadata["result"] == [("California",), ("Texas",), ("Florida",), ("New York",), ("Pennsylvania",)]
+    assert metadata["truncated"] is True
+    assert "Only the first 5 rows" in text
+    assert sql_database.stats()["limit_added"] == 1
+    assert sql_database.stats()["truncated"] == 1
+
+
+def test_selective_queries_pass_untouched(sql_database):
+    """Indexed lookups and keyed self-joins are allowed"""
+    _, metadata = sql_database.run_sql(
+        "SELECT a.name FROM states a JOIN states b ON b.name = 'Texas' "
+        "WHERE a.population > b.population LIMIT 3"
+    )
+
+    assert metadata == {"result": [("California",)], "col_keys": ["name"], "truncated": False}
+    assert sql_database.stats()["limit_added"] == 0
+
+    _, metadata = sql_database.run_sql(
+        "SELECT COUNT(*) FROM states WHERE population > (SELECT AVG(population) FROM states)"
+    )
+    assert metadata["result"] == [(17,)]
+
+
+@pytest.mark.parametrize("command, counter", [
+    ("DELETE FROM states", "rejected"),
+    ("SELECT 1; SELECT 2", "rejected"),
+    ("SELECT a.name FROM states a, states b", "plan_rejected"),
+])
+def test_unsafe_queries_are_refused(sql_database, command, counter):
+    """Writes, multiple statements and cross joins never run"""
+    with pytest.raises(SQLGuardError):
+        sql_database.run_sql(command)
+    assert sql_database.stats()[counter] == 1
+
+
+def test_slow_queries_are_cancelled(sql_database):
+    """Queries that exceed the time budget are interrupted"""
+    sql_database.max_full_scans = 5
+    with pytest.raises(SQLGuardError, match="time budget"):
+        sql_database.run_sql("SELECT COUNT(*) FROM states a, states b, states c, states d, states e")
+    assert sql_database.stats()["timeouts"] == 1
+
+
+def test_invalid_sql_reports_like_sqldatabase(sql_database):
+    """Bad SQL raises the same error type as SQLDatabase.run_sql"""
+    with pytest.raises(NotImplementedError, match="no such column"):
+        sql_database.run_sql("SELECT nonsense FROM states")
@@ -0,0 +1,125 @@
+# test_tracing.py
+import os
+
+import sqlalchemy as sa
+from llama_index.core.llms import MockLLM
+
+import tracing
+from tracing import RequestLog, read_log, replay, rollup
+
+
+def test_spans_are_logged_per_request(tmp_path):
+    """Spans recorded inside a trace are appended to the JSONL log"""
+    log = RequestLog(str(tmp_path / "log.jsonl"))
+    with tracing.trace("What is the capital of Texas?", log) as current:
+        with tracing.span("fast_path"):
+            pass
+        with tracing.span("fast_path"):
+            pass
+        current.path = "fast_path"
+
+    records = read_log(str(tmp_path / "log.jsonl"))
+    assert len(records) == 1
+    assert records[0]["path"] == "fast_path"
+    assert [s["stage"] for s in records[0]["spans"]] == ["fast_path", "fast_path"]
+    assert records[0]["total_ms"] >= 0
+
+
+def test_spans_outside_a_trace_are_ignored(tmp_path):
+    """Timing helpers do nothing when no request is being traced"""
+    with tracing.span("fast_path"):
+        pass
+    assert tracing.current_trace() is None
+
+
+def test_nested_trace_reuses_outer(tmp_path):
+    """A traced helper called inside a traced request adds to the same record"""
+    log = RequestLog(str(tmp_path / "log.jsonl"))
+    with tracing.trace("outer", log) as outer:
+        with tracing.trace("inner", log) as inner:
+            assert inner is outer
+    assert len(read_log(str(tmp_path / "log.jsonl"))) == 1
+
+
+def test_llm_calls_are_timed_with_tokens():
+    """llama_index LLM calls become spans with token counts on the current trace"""
+    tracing.install_instrumentation()
+    llm = MockLLM(max_tokens=8)
+    with tracing.trace("question") as current:
+        llm.complete("Name the capital of Texas")
+    record = current.to_record()
+    llm_spans = [s for s in record["spans"] if s["stage"].startswith("llm")]
+    assert len(llm_spans) == 1
+    assert llm_spans[0]["completion_tokens"] > 0
+    assert record["tokens"]["completion"] == llm_spans[0]["completion_tokens"]
+
+
+def test_sql_statements_are_timed():
+    """Statements on an instrumented engine are recorded as sql_execute spans"""
+    engine = tracing.instrument_engine(sa.create_engine("sqlite://"))
+    with tracing.trace("question") as current:
+        with engine.connect() as connection:
+            connection.execute(sa.text("SELECT 1"))
+    spans = current.to_record()["spans"]
+    assert [s["sql"] for s in spans if s["stage"] == "sql_execute"] == ["SELECT 1"]
+
+
+def test_rollup_percentiles_sum_repeated_stages():
+    """Repeated spans of one stage count as their total within a request"""
+    records = [
+        {"total_ms": float(i), "spans": [{"stage": "llm:planning", "ms": 1.0}, {"stage": "llm:planning", "ms": 2.0}]}
+        for i in range(1, 101)
+    ]
+    stats = rollup(records)
+    assert stats["llm:planning"]["p50_ms"] == 3.0
+    assert stats["total"]["count"] == 100
+    assert stats["total"]["p50_ms"] == 51.0
+    assert stats["total"]["p99_ms"] == 100.0
+
+
+def test_request_log_reloads_history(tmp_path):
+    """Rollups include requests logged by earlier runs of the app"""
+    path = str(tmp_path / "log.jsonl")
+    with tracing.trace("q", RequestLog(path)):
+        pass
+    with open(path, "a") as f:
+        f.write('{"truncated')
+    assert RequestLog(path).rollup()["total"]["count"] == 1
+
+
+def test_request_log_rotates_and_reloads_only_the_tail(tmp_path):
+    """A full log moves to ``.1`` and a reopened log keeps only the last ``window`` records"""
+    path = str(tmp_path / "log.jsonl")
+    log = RequestLog(path, window=5, max_bytes=1000)
+    for i in range(30):
+        log.append({"question": f"q{i}", "total_ms": float(i), "spans": []})
+
+    assert os.path.exists(path + ".1")
+    assert os.path.getsize(path) < 1000 and os.path.getsize(path + ".1") >= 1000
+    reopened = RequestLog(path, window=5, max_bytes=1000)
+    assert [r["question"] for r in reopened._recent] == [f"q{i}" for i in range(25, 30)]
+    assert read_log(path + ".1", limit=2) == read_log(path + ".1")[-2:]
+
+
+def test_replay_reruns_logged_questions(tmp_path):
+    """Replay answers each logged question again and reports before and after"""
+    path = str(tmp_path / "log.jsonl")
+    log = RequestLog(path)
+    for question in ["q1", "q2"]:
+        with tracing.trace(question, log) as current:
+            current.path = "agent"
+
+    asked = []
+
+    def answer(question):
+        asked.append(question)
+        return {"response": "answer", "path": "cache"}
+
+    result = replay(read_log(path), answer, log)
+    assert asked == ["q1", "q2"]
+    assert [r["after_path"] for r in result["requests"]] == ["cache", "cache"]
+    assert result["before"]["total"]["count"] == 2
+
+    # Replayed requests are logged but not replayed again
+    assert len(read_log(path)) == 4
+    assert len(replay(read_log(path), answer)["requests"]) == 2
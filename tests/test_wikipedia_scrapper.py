@@ -0,0 +1,33 @@
+# test_wikipedia_scrapper.py
+from benchmarks.bench_pdf_extraction import write_sample_pdf
+from wikipedia_scrapper import extract_text_from_pdf, iter_pdf_chunks, iter_state_documents
+
+
+def test_chunks_are_bounded_and_carry_page_numbers(tmp_path):
+    """Streaming extraction yields word-bounded chunks tagged with their page"""
+    pdf_path = str(tmp_path / "sample.pdf")
+    write_sample_pdf(pdf_path, pages=3, lines_per_page=10)
+
+    chunks = list(iter_pdf_chunks(pdf_path, max_words=40))
+
+    assert {page for _, page in chunks} == {1, 2, 3}
+    assert all(len(text.split()) <= 40 for text, _ in chunks)
+    assert "Page 2 line 9" in " ".join(text for text, page in chunks if page == 2)
+    whole = " ".join(extract_text_from_pdf(pdf_path).split())
+    assert whole == " ".join(" ".join(text.split()) for text, _ in chunks)
+
+
+def test_state_documents_stream_from_chunk_files(tmp_path):
+    """Each chunk becomes its own Document with state and page metadata"""
+    chunks_path = tmp_path / "Hawaii_state.chunks.jsonl"
+    chunks_path.write_text('{"text": "volcanoes", "page": 1}\n{"text": "beaches", "page": 2}\n')
+    records = [
+        {"name": "Hawaii", "path": "Hawaii_state.pdf", "chunks_path": str(chunks_path), "status": "unchanged"},
+        {"name": "Atlantis", "path": "", "chunks_path": "", "status": "failed"},
+    ]
+
+    documents = list(iter_state_documents(records))
+
+    assert [d.text for d in documents] == ["volcanoes", "beaches"]
+    assert [d.metadata["page"] for d in documents] == [1, 2]
+    assert documents[0].metadata["state"] == "Hawaii"
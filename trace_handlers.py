@@ -0,0 +1,155 @@
+"""llama_index instrumentation handlers that feed spans and tokens into ``tracing``"""
+import time
+
+from llama_index.core.base.base_query_engine import BaseQueryEngine
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.llms.base import BaseLLM
+from llama_index.core.indices.struct_store.sql_query import BaseSQLTableQueryEngine
+from llama_index.core.indices.struct_store.sql_retriever import NLSQLRetriever
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events.llm import LLMChatEndEvent, LLMCompletionEndEvent
+from llama_index.core.instrumentation.span import SimpleSpan
+from llama_index.core.instrumentation.span_handlers import BaseSpanHandler
+from llama_index.core.response_synthesizers import BaseSynthesizer
+
+from escalating_engine import EscalatingQueryEngine
+from lazy_engine import LazyQueryEngine
+from tracing import current_trace
+
+# Which stage an LLM call belongs to, by the nearest traced stage above it
+LLM_STAGES = {
+    None: "llm",
+    "agent": "llm:planning",
+    "sql_generation": "llm:sql_generation",
+    "sql_tool": "llm:sql_synthesis",
+    "document_tool": "llm:synthesis",
+    "synthesis": "llm:synthesis",
+}
+
+
+def _stage_of(instance):
+    if isinstance(instance, BaseLLM):
+        return "llm"
+    if isinstance(instance, NLSQLRetriever):
+        return "sql_generation"
+    if isinstance(instance, BaseRetriever):
+        return "retrieval"
+    if isinstance(instance, BaseEmbedding):
+        return "embedding"
+    if isinstance(instance, BaseSynthesizer):
+        return "synthesis"
+    # Agents are query engines too, so they are matched by name before the engine checks
+    if type(instance).__name__.endswith(("Agent", "AgentRunner", "AgentWorker")):
+        return "agent"
+    if isinstance(instance, BaseSQLTableQueryEngine):
+        return "sql_tool"
+    if isinstance(instance, (LazyQueryEngine, EscalatingQueryEngine)):
+        return None  # wrappers take the stage of the engine they delegate to
+    if isinstance(instance, BaseQueryEngine):
+        return "document_tool"
+    return None
+
+
+class StageSpanHandler(BaseSpanHandler[SimpleSpan]):
+    """Turn llama_index spans into pipeline stages on the current trace.
+
+    Only the outermost span of each stage is recorded (``retrieve`` calling
+    ``_retrieve`` is one retrieval), and LLM calls are labelled by the stage
+    that made them, e.g. ``llm:planning`` inside the agent loop.
+    """
+
+    def class_name(cls):
+        return "StageSpanHandler"
+
+    def new_span(self, id_, bound_args, instance=None, parent_span_id=None, tags=None, **kwargs):
+        parent = self.open_spans.get(parent_span_id) if parent_span_id else None
+        enclosing = parent.metadata["enclosing"] if parent is not None else None
+        ancestors = set(parent.metadata["ancestors"]) if parent is not None else set()
+        stage = _stage_of(instance)
+        record = stage is not None and stage not in ancestors
+        if stage is not None:
+            ancestors.add(stage)
+        llm_span = parent.metadata["llm_span"] if parent is not None else None
+        if stage == "llm":
+            label = LLM_STAGES.get(enclosing, "llm")
+            # predict() calling chat() is one LLM call; its tokens go to the outer span
+            llm_span = id_ if record else llm_span
+            current = current_trace()
+            if not record and current is not None:
+                current.alias(id_, llm_span)
+        else:
+            label = stage
+            enclosing = stage or enclosing
+        return SimpleSpan(
+            id_=id_,
+            parent_id=parent_span_id,
+            metadata={
+                "stage": label,
+                "record": record and current_trace() is not None,
+                "enclosing": enclosing,
+                "ancestors": ancestors,
+                "llm_span": llm_span,
+                "start": time.perf_counter(),
+            },
+        )
+
+    def prepare_to_exit_span(self, id_, bound_args, instance=None, result=None, **kwargs):
+        return self._close(id_, error=None)
+
+    def prepare_to_drop_span(self, id_, bound_args, instance=None, err=None, **kwargs):
+        return self._close(id_, error=err)
+
+    def _close(self, id_, error):
+        with self.lock:
+            span_ = self.open_spans.get(id_)
+        if span_ is None:
+            return None
+        current = current_trace()
+        if span_.metadata["record"] and current is not None:
+            attrs = {"error": str(error)} if error is not None else {}
+            start = span_.metadata["start"]
+            current.add_span(span_.metadata["stage"], start, time.perf_counter() - start, span_id=id_, **attrs)
+        return span_
+
+
+def token_usage(response):
+    """Return the provider's ``(prompt, completion)`` token counts for a response, None when absent"""
+    raw = getattr(response, "raw", None)
+    if hasattr(raw, "model_dump"):
+        raw = raw.model_dump()
+    usage = (raw or {}).get("usage_metadata") or (raw or {}).get("usage") or {}
+    if hasattr(usage, "model_dump"):
+        usage = usage.model_dump()
+    prompt = usage.get("prompt_token_count", usage.get("prompt_tokens"))
+    completion = usage.get("candidates_token_count", usage.get("completion_tokens"))
+    return prompt, completion
+
+
+class TokenEventHandler(BaseEventHandler):
+    """Attach prompt and completion token counts of each LLM call to its span.
+
+    When the provider reports no usage the counts are estimated at roughly
+    four characters per token and flagged as estimated.
+    """
+
+    @classmethod
+    def class_name(cls):
+        return "TokenEventHandler"
+
+    def handle(self, event, **kwargs):
+        if not isinstance(event, (LLMChatEndEvent, LLMCompletionEndEvent)):
+            return
+        current = current_trace()
+        if current is None or event.response is None:
+            return
+        prompt, completion = token_usage(event.response)
+        estimated = prompt is None or completion is None
+        if estimated:
+            if isinstance(event, LLMChatEndEvent):
+                prompt_text = "".join(str(m.content or "") for m in event.messages)
+                completion_text = str(event.response.message.content or "")
+            else:
+                prompt_text, completion_text = event.prompt, event.response.text or ""
+            prompt, completion = len(prompt_text) // 4, len(completion_text) // 4
+        current.add_tokens(event.span_id, prompt or 0, completion or 0, estimated=estimated)
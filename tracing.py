@@ -0,0 +1,319 @@
+import argparse
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """Spans and token counts collected while answering one request"""
+
+    def __init__(self, question, source="app"):
+        self.id = uuid.uuid4().hex[:12]
+        self.question = question
+        self.source = source
+        self.path = None
+        self.started_at = time.time()
+        self.total_seconds = 0.0
+        self.tokens = {"prompt": 0, "completion": 0}
+        self._start = time.perf_counter()
+        self._spans = []
+        self._by_id = {}
+        self._aliases = {}
+        self._pending_tokens = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, stage, start, seconds, span_id=None, **attrs):
+        span = {"stage": stage, "start_ms": (start - self._start) * 1000, "ms": seconds * 1000, **attrs}
+        with self._lock:
+            self._spans.append(span)
+            if span_id is not None:
+                self._by_id[span_id] = span
+                # End events fire before their span closes
+                span.update(self._pending_tokens.pop(span_id, {}))
+        return span
+
+    def alias(self, span_id, recorded_span_id):
+        """Credit tokens reported under ``span_id`` to an enclosing recorded span"""
+        with self._lock:
+            self._aliases[span_id] = recorded_span_id
+
+    def add_tokens(self, span_id, prompt, completion, estimated=False):
+        with self._lock:
+            self.tokens["prompt"] += prompt
+            self.tokens["completion"] += completion
+            span_id = self._aliases.get(span_id, span_id)
+            counts = {"prompt_tokens": prompt, "completion_tokens": completion}
+            if estimated:
+                counts["tokens_estimated"] = True
+            span = self._by_id.get(span_id)
+            if span is not None:
+                span.update(counts)
+            else:
+                self._pending_tokens[span_id] = counts
+
+    def to_record(self):
+        with self._lock:
+            spans = sorted(self._spans, key=lambda s: s["start_ms"])
+        return {
+            "id": self.id,
+            "ts": self.started_at,
+            "source": self.source,
+            "question": self.question,
+            "path": self.path,
+            "total_ms": self.total_seconds * 1000,
+            "tokens": dict(self.tokens),
+            "spans": spans,
+        }
+
+
+def current_trace():
+    """Return the trace of the request running in this context, if any"""
+    return _current_trace.get()
+
+
+@contextmanager
+def trace(question, request_log=None, source="app"):
+    """Collect spans for one request and append them to ``request_log`` when it ends.
+
+    Nested calls reuse the outer trace, so a helper that traces on its own
+    can also be called from inside a traced request.
+    """
+    outer = _current_trace.get()
+    if outer is not None:
+        yield outer
+        return
+    current = Trace(question, source=source)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+        current.total_seconds = time.perf_counter() - current._start
+        if request_log is not None:
+            request_log.append(current.to_record())
+
+
+@contextmanager
+def span(stage, **attrs):
+    """Time a block as one stage of the current trace; a no-op outside a trace"""
+    current = _current_trace.get()
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        if current is not None:
+            current.add_span(stage, start, time.perf_counter() - start, **attrs)
+
+
+_installed = False
+_install_lock = threading.Lock()
+
+
+def install_instrumentation():
+    """Register the stage and token handlers on llama_index's root dispatcher once"""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        # Deferred so that tracing a fast-path request never loads llama_index
+        from llama_index.core.instrumentation import get_dispatcher
+
+        from trace_handlers import StageSpanHandler, TokenEventHandler
+
+        dispatcher = get_dispatcher()
+        dispatcher.add_span_handler(StageSpanHandler())
+        dispatcher.add_event_handler(TokenEventHandler())
+        _installed = True
+
+
+def instrument_engine(engine):
+    """Record every statement run through a SQLAlchemy engine as a ``sql_execute`` span"""
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("trace_start", []).append(time.perf_counter())
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["trace_start"].pop()
+        current = _current_trace.get()
+        if current is not None:
+            current.add_span("sql_execute", start, time.perf_counter() - start, sql=" ".join(statement.split()))
+
+    def discard(context):
+        if context.connection is not None and context.connection.info.get("trace_start"):
+            context.connection.info["trace_start"].pop()
+
+    sa.event.listen(engine, "before_cursor_execute", before)
+    sa.event.listen(engine, "after_cursor_execute", after)
+    sa.event.listen(engine, "handle_error", discard)
+    return engine
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def rollup(records):
+    """Return count and p50/p95/p99 milliseconds per stage, plus ``total``.
+
+    A stage that runs several times in one request (e.g. two LLM planning
+    calls) counts as the sum of its spans for that request.
+    """
+    samples = defaultdict(list)
+    for record in records:
+        per_stage = defaultdict(float)
+        for s in record.get("spans", []):
+            per_stage[s["stage"]] += s["ms"]
+        for stage, ms in per_stage.items():
+            samples[stage].append(ms)
+        samples["total"].append(record["total_ms"])
+    result = {}
+    for stage, values in samples.items():
+        values.sort()
+        result[stage] = {
+            "count": len(values),
+            "p50_ms": _percentile(values, 50),
+            "p95_ms": _percentile(values, 95),
+            "p99_ms": _percentile(values, 99),
+        }
+    return result
+
+
+class RequestLog:
+    """Append-only JSONL log of request traces with rolling percentiles.
+
+    The most recent ``window`` records, including those already on disk when
+    the log is opened, are kept in memory for ``rollup``; only the tail of the
+    file is read for them. Once the file grows past ``max_bytes`` it is moved
+    to ``<path>.1``, replacing the previous one, and a new file is started.
+    """
+
+    def __init__(self, path="request_log.jsonl", window=1000, max_bytes=10_000_000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)
+        if path:
+            # Records at the end of the rotated file fill in a window the current one cannot
+            for source in (f"{path}.1", path):
+                if os.path.exists(source):
+                    self._recent.extend(read_log(source, limit=window))
+
+    def append(self, record):
+        with self._lock:
+            self._recent.append(record)
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+                    size = f.tell()
+                if self.max_bytes and size >= self.max_bytes:
+                    os.replace(self.path, f"{self.path}.1")
+
+    def rollup(self):
+        with self._lock:
+            records = list(self._recent)
+        return rollup(records)
+
+
+def _tail_lines(path, count, block_size=65536):
+    """Return the last ``count`` lines of a file, reading backwards from its end"""
+    with open(path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        data = b""
+        while position > 0 and data.count(b"\n") <= count:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.splitlines()
+    if position > 0:
+        lines = lines[1:]  # the first line read may start mid-record
+    return lines[-count:] if count else []
+
+
+def read_log(path, limit=None):
+    """Read the well-formed records from a request log, or only the last ``limit`` lines of it"""
+    if limit is not None:
+        lines = _tail_lines(path, limit)
+    else:
+        with open(path, "rb") as f:
+            lines = f.readlines()
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue  # a partially written last line
+    return records
+
+
+def replay(records, answer_fn, request_log=None, limit=None):
+    """Re-run logged questions through ``answer_fn`` and compare latencies.
+
+    ``answer_fn`` takes a question and returns ``{"response", "path"}`` like
+    ``app.answer_query``. Returns ``{"before", "after", "requests"}`` where
+    before/after are rollups of the original and replayed runs.
+    """
+    originals = [r for r in records if r.get("source") != "replay"]
+    if limit is not None:
+        originals = originals[-limit:]
+    replayed = []
+    for original in originals:
+        with trace(original["question"], request_log, source="replay") as current:
+            current.path = answer_fn(original["question"])["path"]
+        record = current.to_record()
+        replayed.append(record)
+    return {
+        "before": rollup(originals),
+        "after": rollup(replayed),
+        "requests": [
+            {
+                "question": o["question"],
+                "before_ms": o["total_ms"],
+                "after_ms": r["total_ms"],
+                "before_path": o["path"],
+                "after_path": r["path"],
+            }
+            for o, r in zip(originals, replayed)
+        ],
+    }
+
+
+def main(argv=None):
+    """Replay logged questions against the current pipeline and print a comparison"""
+    parser = argparse.ArgumentParser(description="Replay questions from a request log")
+    parser.add_argument("--log", default=os.getenv("REQUEST_LOG_PATH", "request_log.jsonl"))
+    parser.add_argument("--limit", type=int, default=None, help="Replay only the most recent N requests")
+    parser.add_argument("--no-cache", action="store_true", help="Clear the answer cache before replaying")
+    parser.add_argument("--json", action="store_true", help="Print the full comparison as JSON")
+    args = parser.parse_args(argv)
+
+    import app  # deferred: loading the pipeline is only needed for replay
+
+    if args.no_cache:
+        app.get_answer_cache().clear()
+    result = replay(read_log(args.log), app.answer_query, RequestLog(args.log), args.limit)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{'stage':<22}{'p50 before':>12}{'p50 after':>12}{'p95 before':>12}{'p95 after':>12}")
+    for stage in sorted(set(result["before"]) | set(result["after"])):
+        before = result["before"].get(stage, {})
+        after = result["after"].get(stage, {})
+        print(
+            f"{stage:<22}{before.get('p50_ms', 0):>12.0f}{after.get('p50_ms', 0):>12.0f}"
+            f"{before.get('p95_ms', 0):>12.0f}{after.get('p95_ms', 0):>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,34 @@
 # Import required libraries
 import requests
-import time
 import os
 from pathlib import Path
 import PyPDF2
 from llama_index.core import Document
 
+from ingestion import IngestionPipeline, iter_chunks
+
 # Create PDF directory if it doesn't exist
 pdf_dir = Path("state_pdfs")
 pdf_dir.mkdir(exist_ok=True)
 
-# Define all US states (Scale to cover all states)
-# states = [
-#     "Alabama", "Alaska", "Arizona", "Arkansas", "California", "Colorado", 
-#     "Connecticut", "Delaware", "Florida", "Georgia (U.S. state)", "Hawaii", "Idaho", 
-#     "Illinois", "Indiana", "Iowa", "Kansas", "Kentucky", "Louisiana", 
-#     "Maine", "Maryland", "Massachusetts", "Michigan", "Minnesota", 
-#     "Mississippi", "Missouri", "Montana", "Nebraska", "Nevada", 
-#     "New Hampshire", "New Jersey", "New Mexico", "New York", 
-#     "North Carolina", "North Dakota", "Ohio", "Oklahoma", "Oregon", 
-#     "Pennsylvania", "Rhode Island", "South Carolina", "South Dakota", 
-#     "Tennessee", "Texas", "Utah", "Vermont", "Virginia", "Washington", 
-#     "West Virginia", "Wisconsin", "Wyoming"
-# ]
+# Define all US states; the concurrent pipeline makes covering all 50 practical
+states = [
+    "Alabama", "Alaska", "Arizona", "Arkansas", "California", "Colorado", 
+    "Connecticut", "Delaware", "Florida", "Georgia", "Hawaii", "Idaho", 
+    "Illinois", "Indiana", "Iowa", "Kansas", "Kentucky", "Louisiana", 
+    "Maine", "Maryland", "Massachusetts", "Michigan", "Minnesota", 
+    "Mississippi", "Missouri", "Montana", "Nebraska", "Nevada", 
+    "New Hampshire", "New Jersey", "New Mexico", "New York", 
+    "North Carolina", "North Dakota", "Ohio", "Oklahoma", "Oregon", 
+    "Pennsylvania", "Rhode Island", "South Carolina", "South Dakota", 
+    "Tennessee", "Texas", "Utah", "Vermont", "Virginia", "Washington", 
+    "West Virginia", "Wisconsin", "Wyoming"
+]
 
-# --- Let's just focus on a sample of 5 states for this project --- #
-states = ["Hawaii", "Alaska", "Arizona", "California","New York" ]
+# Wikipedia page titles that differ from "<state> (state)"
+page_titles = {
+    "Georgia": "Georgia (U.S. state)",
+}
 
 # Function to download Wikipedia page as PDF
 def download_wikipedia_pdf(title, output_path):
@@ -70,34 +73,67 @@ def extract_text_from_pdf(pdf_path):
         print(f"Error extracting text from {pdf_path}: {e}")
         return ""
 
-# Download PDFs for all states and prepare documents
-pdf_documents = []
+# Function to stream bounded text chunks from a PDF for indexing
+def iter_pdf_chunks(pdf_path, max_words=300):
+    """Yield (text, page_number) chunks of at most max_words words, one page at a time"""
+    try:
+        with open(pdf_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            for page_number, page in enumerate(pdf_reader.pages, start=1):
+                lines, words = [], 0
+                for line in (page.extract_text() or "").splitlines():
+                    line_words = len(line.split())
+                    if lines and words + line_words > max_words:
+                        yield "\n".join(lines), page_number
+                        lines, words = [], 0
+                    lines.append(line)
+                    words += line_words
+                if words:
+                    yield "\n".join(lines), page_number
+    except Exception as e:
+        print(f"Error extracting text from {pdf_path}: {e}")
+
+# Download PDFs for all states concurrently and prepare documents
+def load_state_documents(state_names, concurrency=4, rate=2.0, processes=None):
+    """Ingest state pages, skipping unchanged ones, and yield one Document per chunk"""
+    pipeline = IngestionPipeline(
+        iter_pdf_chunks,
+        pdf_dir=pdf_dir,
+        concurrency=concurrency,
+        rate=rate,
+        processes=processes
+    )
+    pages = {state: page_titles.get(state, f"{state} (state)") for state in state_names}
+    records, stats = pipeline.run(pages)
 
-for state in states:
-    pdf_filename = pdf_dir / f"{state.replace(' ', '_')}_state.pdf"
-    print(f"Downloading PDF for {state}...")
-    
-    # Download the PDF
-    success = download_wikipedia_pdf(f"{state} (state)", pdf_filename)
-    
-    if success:
-        # Extract text from pdf
-        text_content = extract_text_from_pdf(pdf_filename)
-        
-        # Create a document that points to the PDF but also contains the text
-        doc = Document(
-            text=text_content,
-            metadata={
-                "title": f"{state} State Information",
-                "source": str(pdf_filename),
-                "file_type": "pdf",
-                "state": state
-            }
-        )
-        pdf_documents.append(doc)
-        print(f"  Successfully processed {state}")
-    
-    # Add a small delay to avoid hitting rate limits
-    time.sleep(1)
+    for record in records:
+        detail = record["error"] if record["status"] == "failed" else f"{record['chunks']} chunks"
+        print(f"  {record['name']}: {record['status']} ({detail})")
+    print(
+        f"Fetched {stats['downloaded']} pages, {stats['unchanged']} unchanged, {stats['failed']} failed "
+        f"in {stats['seconds']:.1f}s ({stats['pages_per_sec']:.2f} pages/sec, "
+        f"{stats['bytes_per_sec'] / 1024:.0f} KiB/sec)"
+    )
+    return iter_state_documents(records)
+
+def iter_state_documents(records):
+    """Stream Documents from the chunk files of ingested states, never holding a whole article"""
+    for record in records:
+        if record["status"] == "failed":
+            continue
+        for chunk in iter_chunks(record["chunks_path"]):
+            # Create a document that points to the PDF page but also contains the text
+            yield Document(
+                text=chunk["text"],
+                metadata={
+                    "title": f"{record['name']} State Information",
+                    "source": record["path"],
+                    "file_type": "pdf",
+                    "state": record["name"],
+                    "page": chunk["page"]
+                }
+            )
 
-print(f"Total PDFs downloaded and processed: {len(pdf_documents)}")
\ No newline at end of file
+if __name__ == "__main__":
+    chunk_count = sum(1 for _ in load_state_documents(states))
+    print(f"Total document chunks processed: {chunk_count}")